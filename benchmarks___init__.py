@@ -0,0 +1 @@
+# Бенчмарки горячих путей бота
\ No newline at end of file
@@ -0,0 +1,77 @@
+# benchmarks/commands.py
+"""
+Микробенчмарк распознавания команд: индекс parse_command против
+прежнего линейного перебора алиасов (get_command + extract_args).
+
+Запуск: python -m benchmarks.commands
+"""
+import timeit
+from handlers.commands import COMMANDS, parse_command
+
+def legacy_get_command(text: str) -> str:
+    """Прежняя реализация get_command: линейный перебор всех алиасов"""
+    if not text:
+        return None
+    text = text.lower().strip()
+    for cmd, variants in COMMANDS.items():
+        if text in variants:
+            return cmd
+    if text.startswith('/'):
+        cmd_without_slash = text[1:].split()[0].lower()
+        for cmd, variants in COMMANDS.items():
+            if cmd_without_slash == cmd or cmd_without_slash in variants:
+                return cmd
+    return None
+
+def legacy_extract_args(text: str) -> str:
+    """Прежняя реализация extract_args"""
+    if not text:
+        return ""
+    parts = text.split()
+    if len(parts) <= 1:
+        return ""
+    text_lower = text.lower()
+    for cmd, variants in COMMANDS.items():
+        for variant in variants:
+            if text_lower.startswith(variant):
+                return text[len(variant):].strip()
+    if text.startswith('/'):
+        return ' '.join(parts[1:])
+    return ""
+
+# Типичный поток: в основном обычные сообщения, немного команд
+SAMPLE = [
+    "Привет всем, как дела?",
+    "кто идёт сегодня вечером на встречу",
+    "ок",
+    "Да, согласен.",
+    "топ",
+    "/mystats",
+    "/warn спам в чате",
+    "пред флуд",
+    "мут время 120",
+    "это было очень давно, не помню уже",
+]
+
+def legacy(text: str):
+    cmd = legacy_get_command(text)
+    # Каждый из пяти роутеров разбирал сообщение заново
+    for _ in range(4):
+        legacy_get_command(text)
+    return (cmd, legacy_extract_args(text)) if cmd else None
+
+def indexed(text: str):
+    return parse_command(text)
+
+def run(number: int = 20000) -> dict:
+    results = {}
+    for name, func in (("legacy", legacy), ("indexed", indexed)):
+        seconds = timeit.timeit(lambda: [func(text) for text in SAMPLE], number=number)
+        results[name] = seconds / (number * len(SAMPLE)) * 1e6
+    return results
+
+if __name__ == "__main__":
+    results = run()
+    for name, usec in results.items():
+        print(f"{name:>8}: {usec:.2f} мкс/сообщение")
+    print(f"ускорение: x{results['legacy'] / results['indexed']:.1f}")
@@ -0,0 +1,119 @@
+# benchmarks/dispatch.py
+"""
+Стоимость маршрутизации одного апдейта через Dispatcher:
+прежняя схема (пять роутеров с F.text, каждый заново разбирает текст)
+против разбора один раз в CommandParserMiddleware и реестра команд.
+
+Обработчики пустые, база и сеть не используются — меряется только диспетчеризация.
+В прежней схеме роутер, которому команда «не своя», пропускает апдейт дальше
+(SkipHandler) — так, как эта схема была задумана; иначе первый же роутер
+забирал все текстовые сообщения и до учёта статистики они не доходили.
+
+Запуск: python -m benchmarks.dispatch
+"""
+import asyncio
+import time
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import Chat, Message, Update, User
+
+from benchmarks.commands import SAMPLE, legacy_get_command, legacy_extract_args
+from filters import IsGroup, HasCommand
+from handlers.commands import COMMANDS
+from middlewares import CommandParserMiddleware
+
+# Как команды были распределены по роутерам до перехода на реестр
+LEGACY_GROUPS = [
+    {"top", "mystats", "rank", "hiddenrank"},
+    {"mute", "unmute", "kick", "ban", "unban", "warn", "unwarn"},
+    {"setrank", "adminranks"},
+    {"admins", "settings", "set_welcome", "set_antiflood", "set_mute", "set_ban"},
+]
+
+def _legacy_router(commands: set) -> Router:
+    router = Router()
+    router.message.filter(IsGroup())
+
+    @router.message(F.text)
+    async def handle(message: Message):
+        cmd = legacy_get_command(message.text)
+        if cmd not in commands:
+            raise SkipHandler()
+        legacy_extract_args(message.text)
+
+    return router
+
+def legacy_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    for commands in LEGACY_GROUPS:
+        dp.include_router(_legacy_router(commands))
+
+    group = Router()
+    group.message.filter(IsGroup())
+
+    @group.message(F.text)
+    async def handle_message(message: Message):
+        if legacy_get_command(message.text):
+            return
+
+    dp.include_router(group)
+    return dp
+
+def indexed_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    dp.message.outer_middleware(CommandParserMiddleware())
+
+    dispatch = Router()
+    dispatch.message.filter(IsGroup())
+
+    @dispatch.message(F.text, HasCommand())
+    async def dispatch_command(message: Message, parsed_command):
+        name, args = parsed_command
+
+    group = Router()
+    group.message.filter(IsGroup())
+
+    @group.message(F.text)
+    async def handle_message(message: Message):
+        pass
+
+    dp.include_router(dispatch)
+    dp.include_router(group)
+    return dp
+
+def _updates():
+    chat = Chat(id=-100, type="supergroup", title="bench")
+    user = User(id=1, is_bot=False, first_name="bench")
+    return [
+        Update(update_id=i, message=Message(
+            message_id=i, date=datetime.now(), chat=chat, from_user=user, text=text
+        ))
+        for i, text in enumerate(SAMPLE)
+    ]
+
+async def _measure(dp: Dispatcher, bot: Bot, updates, rounds: int) -> float:
+    for update in updates:
+        await dp.feed_update(bot, update)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / (rounds * len(updates)) * 1e6
+
+async def run(rounds: int = 2000) -> dict:
+    assert set().union(*LEGACY_GROUPS) <= set(COMMANDS)
+    bot = Bot("42:BENCHMARK")
+    updates = _updates()
+    results = {
+        "legacy": await _measure(legacy_dispatcher(), bot, updates, rounds),
+        "indexed": await _measure(indexed_dispatcher(), bot, updates, rounds),
+    }
+    await bot.session.close()
+    return results
+
+if __name__ == "__main__":
+    results = asyncio.run(run())
+    for name, usec in results.items():
+        print(f"{name:>8}: {usec:.1f} мкс/апдейт")
+    print(f"ускорение: x{results['legacy'] / results['indexed']:.1f}")
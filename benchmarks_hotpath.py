@@ -0,0 +1,314 @@
+# benchmarks/hotpath.py
+"""
+Воспроизводимый бенчмарк горячего пути: синтетический трафик групп проходит
+через настоящий диспетчер из bot.build_app (все middleware и роутеры) с поддельной сессией Bot API
+и временной базой. Сценарии:
+
+  messages    — обычные сообщения (handle_message: учёт статистики, скрытые ранги)
+  commands    — разбор команд (parse_command) и их обработчики, вперемешку с похожими фразами
+  top         — нажатия кнопок топа (top_callback)
+  moderation  — пред/разварн/мут/размут от администратора ответом на сообщение
+
+Каждый сценарий идёт в отдельном процессе (spawn): кэши, пулы и пиковый RSS
+у сценариев не смешиваются. Перед замером чаты наполняются сообщениями (не входят
+в результат), антифлуд в чатах бенчмарка выключен, чтобы число обработанных апдейтов
+не зависело от скорости машины. Апдейты подаются по одному, задержка — время
+dp.feed_raw_update; в конце сбрасывается буфер записи, его время и запросы входят в итог.
+
+Результаты: апдейтов/с, p50/p99, SQL-выражений на апдейт (trace callback всех
+соединений пула), пиковый RSS. --output сохраняет JSON, --baseline сравнивает
+с прошлым файлом, --compare A B сравнивает два файла без прогона. Код возврата 1,
+если какая-то метрика хуже базовой больше, чем на --tolerance.
+
+Запуск: python -m benchmarks.hotpath [--count 3000] [--scenario messages] [--output new.json]
+        python -m benchmarks.hotpath --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List
+
+from aiogram.client.session.base import BaseSession
+from benchmarks.webhook import FakeBotAPI, PLAIN
+
+CHATS = 50
+USERS = 2000
+ADMIN_ID = 1
+WARMUP = 2000
+
+COMMAND_TEXTS = [
+    "топ", "/top", "стата", "/mystats", "моя стата", "ранг", "мой ранг", "/rank",
+    "скрытый ранг", "/hiddenrank", "админы", "настройки",
+    # Похожие на команды фразы: разбираются, но уходят в учёт статистики
+    "топ новостей за неделю", "ранг не важен", "стата какая-то странная",
+]
+MODERATION_TEXTS = ["пред", "разварн", "мут", "размут", "варн"]
+
+# Чем больше значение, тем лучше; для остальных метрик — наоборот
+HIGHER_IS_BETTER = {"updates_per_second"}
+COMPARED = ("updates_per_second", "p50_ms", "p99_ms", "statements_per_update", "peak_rss_mb")
+
+class FakeSession(BaseSession):
+    """Сессия без сети: ответы FakeBotAPI проходят обычный разбор check_response"""
+
+    def __init__(self, api: FakeBotAPI):
+        super().__init__()
+        self.api = api
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__
+        self.api.calls[name] += 1
+        result = self.api._result(name, method.model_dump())
+        return self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result})).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        # Абстрактный в BaseSession; бенчмарк файлов не скачивает — пустой поток
+        return
+        yield
+
+    async def close(self):
+        pass
+
+class StatementCounter:
+    """Счётчик SQL-выражений; вызывается из потоков соединений aiosqlite"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, statement: str):
+        with self._lock:
+            self.count += 1
+
+def _chat_id(user_id: int) -> int:
+    return -1000000 - user_id % CHATS
+
+def _message(update_id: int, user_id: int, text: str, now: int, reply_to: int = None) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": now,
+        "chat": {"id": _chat_id(user_id), "type": "supergroup", "title": "bench"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if reply_to is not None:
+        message["reply_to_message"] = {
+            "message_id": update_id - 1,
+            "date": now,
+            "chat": message["chat"],
+            "from": {"id": reply_to, "is_bot": False, "first_name": f"user{reply_to}"},
+            "text": "спам",
+        }
+    return {"update_id": update_id, "message": message}
+
+def _messages(count: int, rnd: random.Random, now: int, first_id: int) -> List[dict]:
+    return [
+        _message(first_id + i, rnd.randrange(2, USERS + 1), rnd.choice(PLAIN), now)
+        for i in range(count)
+    ]
+
+def _commands(count: int, rnd: random.Random, now: int, first_id: int) -> List[dict]:
+    return [
+        _message(first_id + i, rnd.randrange(2, USERS + 1), rnd.choice(COMMAND_TEXTS), now)
+        for i in range(count)
+    ]
+
+def _top(count: int, rnd: random.Random, now: int, first_id: int) -> List[dict]:
+    updates = []
+    for i in range(count):
+        user_id = rnd.randrange(2, USERS + 1)
+        chat = {"id": _chat_id(user_id), "type": "supergroup", "title": "bench"}
+        updates.append({
+            "update_id": first_id + i,
+            "callback_query": {
+                "id": str(first_id + i),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "chat_instance": str(chat["id"]),
+                "data": rnd.choice(("top_day", "top_week", "top_all")),
+                "message": {
+                    "message_id": 1,
+                    "date": now,
+                    "chat": chat,
+                    "from": {"id": 42, "is_bot": True, "first_name": "bench"},
+                    "text": "🏆 Выберите период для топа:",
+                },
+            },
+        })
+    return updates
+
+def _moderation(count: int, rnd: random.Random, now: int, first_id: int) -> List[dict]:
+    updates = []
+    for i in range(count):
+        # Администратор пишет во все чаты: цель — пользователь того же чата
+        target = rnd.randrange(2, USERS + 1)
+        update = _message(first_id + i, target, rnd.choice(MODERATION_TEXTS), now, reply_to=target)
+        update["message"]["from"] = {"id": ADMIN_ID, "is_bot": False, "first_name": "admin"}
+        updates.append(update)
+    return updates
+
+SCENARIOS: Dict[str, Callable[[int, random.Random, int, int], List[dict]]] = {
+    "messages": _messages,
+    "commands": _commands,
+    "top": _top,
+    "moderation": _moderation,
+}
+
+def _percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+async def _run_scenario(name: str, count: int, seed: int) -> dict:
+    import database
+    from bot import build_app, config
+    from rate_limiter import FloodPolicy, TOKEN_BUCKET
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app = build_app(config)
+
+    api = FakeBotAPI(admins=[ADMIN_ID])
+    session = FakeSession(api)
+    # Цепочка middleware сессии та же, что у настоящей (очередь отправки, трассировка)
+    for middleware in app.bot.session.middleware:
+        session.middleware(middleware)
+    app.bot.session = session
+    unlimited = FloodPolicy(TOKEN_BUCKET, 10 ** 6, 1)
+    app.outbound.global_policy = app.outbound.chat_policy = unlimited
+
+    rnd = random.Random(seed)
+    now = int(time.time())
+    await database.init_db()
+    try:
+        for index in range(CHATS):
+            await database.update_chat_setting(-1000000 - index, "antiflood_enabled", 0)
+        for update in _messages(WARMUP, rnd, now, first_id=1):
+            await app.dp.feed_raw_update(app.bot, update)
+        await database.flush_messages()
+
+        statements = StatementCounter()
+        for pool in database._all_pools():
+            for conn in pool._connections:
+                await conn.set_trace_callback(statements)
+        updates = SCENARIOS[name](count, rnd, now, first_id=WARMUP + 1)
+        api.calls.clear()
+
+        latencies = []
+        start = time.perf_counter()
+        for update in updates:
+            begin = time.perf_counter()
+            await app.dp.feed_raw_update(app.bot, update)
+            latencies.append(time.perf_counter() - begin)
+        await database.flush_messages()
+        elapsed = time.perf_counter() - start
+    finally:
+        await app.outbound.close()
+        await database.close_db()
+
+    return {
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_second": len(updates) / elapsed,
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "statements_per_update": statements.count / len(updates),
+        "api_calls_per_update": sum(api.calls.values()) / len(updates),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_scenario(name: str, count: int, seed: int, db_dir: str) -> dict:
+    """Точка входа процесса сценария: база — отдельный файл во временном каталоге"""
+    os.environ["DB_PATH"] = os.path.join(db_dir, f"{name}.db")
+    return asyncio.run(_run_scenario(name, count, seed))
+
+def run(scenarios: List[str], count: int, seed: int = 1) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as db_dir:
+        for name in scenarios:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                results[name] = executor.submit(run_scenario, name, count, seed, db_dir).result()
+    return {"meta": _meta(count, seed), "scenarios": results}
+
+def _meta(count: int, seed: int) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "count": count,
+        "seed": seed,
+        "timestamp": int(time.time()),
+    }
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.1) -> List[str]:
+    """Строки отчёта о метриках, которые стали хуже больше чем на tolerance (доля)"""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for metric in COMPARED:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            marker = "  ← регрессия" if worse > tolerance else ""
+            print(f"{name:>10} {metric:<22} {old:>10.2f} → {new:>10.2f} ({change:+.1%}){marker}")
+            if marker:
+                regressions.append(f"{name}: {metric} {old:.2f} → {new:.2f}")
+    return regressions
+
+def _print(results: dict):
+    for name, result in results["scenarios"].items():
+        print(
+            f"{name:>10}: {result['updates_per_second']:.0f} апдейтов/с, "
+            f"p50 {result['p50_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс, "
+            f"{result['statements_per_update']:.2f} SQL/апдейт, "
+            f"{result['api_calls_per_update']:.2f} вызовов API/апдейт, "
+            f"RSS {result['peak_rss_mb']:.0f} МБ"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк горячего пути бота")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="сценарий (можно несколько раз); по умолчанию все")
+    parser.add_argument("--count", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="сравнить результаты с прошлым JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два JSON без прогона")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as old, open(args.compare[1], encoding="utf-8") as new:
+            regressions = compare(json.load(old), json.load(new), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    results = run(args.scenario or list(SCENARIOS), args.count, args.seed)
+    _print(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# benchmarks/leaderboard.py
+"""
+Стоимость обновления рейтинга чата (ChatBoard.update) в зависимости от числа участников.
+Обновление удаляет и вставляет ключ в три отсортированных списка — это сдвиг
+участка списка, O(n); замер показывает, с какого размера чата он становится заметен.
+Сообщения пишут в основном активные участники, как в настоящих группах.
+
+Запуск: python -m benchmarks.leaderboard [--sizes 1000 10000 100000 200000]
+"""
+import argparse
+import random
+import time
+from leaderboard import ChatBoard
+
+UPDATES = 20000
+
+def run(sizes, updates: int = UPDATES, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    results = {}
+    for size in sizes:
+        board = ChatBoard()
+        for user_id in range(size):
+            messages = int(rnd.paretovariate(1.2))
+            board.users[user_id] = [messages, messages % 50, 1, messages % 300, 1, messages * 3]
+        board.epochs.update(day=1, week=1)
+        board.rebuild()
+        weights = [1 / (rank + 1) for rank in range(size)]
+        writers = rnd.choices(range(size), weights=weights, k=updates)
+        start = time.perf_counter()
+        for user_id in writers:
+            board.update(user_id, 1, 3, 1, 1)
+        elapsed = time.perf_counter() - start
+        results[size] = {
+            "usec_per_update": elapsed / updates * 1e6,
+            "updates_per_second": updates / elapsed,
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рейтинга чата в памяти")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 200000])
+    parser.add_argument("--updates", type=int, default=UPDATES)
+    args = parser.parse_args()
+    for size, result in run(args.sizes, args.updates).items():
+        print(
+            f"{size:>8} участников: {result['usec_per_update']:.1f} мкс/обновление, "
+            f"{result['updates_per_second']:.0f} обновлений/с"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/metrics.py
+"""
+Стоимость записи метрик на горячем пути: счётчик и гистограмма по меткам
+(как в middleware), обёртка timed вокруг корутины (как у функций database.py)
+и отрисовка /metrics. Регистр отдельный, чтобы не смешиваться с метриками бота.
+
+Запуск: python -m benchmarks.metrics
+"""
+import asyncio
+import time
+
+from metrics import Registry, timed
+
+N = 200000
+
+def _per_call(func, count: int = N) -> float:
+    start = time.perf_counter()
+    func(count)
+    return (time.perf_counter() - start) / count * 1e6
+
+def run() -> dict:
+    registry = Registry()
+    updates = registry.counter("updates_total", "", ["type"])
+    seconds = registry.histogram("handler_seconds", "", ["router", "handler"])
+    queries = registry.histogram("query_seconds", "", ["query"])
+
+    def baseline(count):
+        for _ in range(count):
+            time.perf_counter()
+
+    def counter_inc(count):
+        for _ in range(count):
+            updates.labels("message").inc()
+
+    def histogram_observe(count):
+        for i in range(count):
+            seconds.labels("handlers.group", "handle_message").observe((i % 1000) / 1e5)
+
+    async def query():
+        return None
+
+    timed_query = timed(queries)(query)
+
+    async def plain_calls(count):
+        for _ in range(count):
+            await query()
+
+    async def timed_calls(count):
+        for _ in range(count):
+            await timed_query()
+
+    plain = _per_call(lambda count: asyncio.run(plain_calls(count)))
+    wrapped = _per_call(lambda count: asyncio.run(timed_calls(count)))
+
+    start = time.perf_counter()
+    for _ in range(100):
+        text = registry.render()
+    render = (time.perf_counter() - start) / 100 * 1e3
+
+    return {
+        "perf_counter_usec": _per_call(baseline),
+        "counter_usec": _per_call(counter_inc),
+        "histogram_usec": _per_call(histogram_observe),
+        "timed_overhead_usec": wrapped - plain,
+        "render_msec": render,
+        "render_lines": text.count("\n"),
+    }
+
+if __name__ == "__main__":
+    result = run()
+    print(f"perf_counter(): {result['perf_counter_usec']:.2f} мкс")
+    print(f"counter.labels().inc(): {result['counter_usec']:.2f} мкс")
+    print(f"histogram.labels().observe(): {result['histogram_usec']:.2f} мкс")
+    print(f"обёртка timed: +{result['timed_overhead_usec']:.2f} мкс на вызов")
+    print(f"/metrics: {result['render_msec']:.2f} мс на {result['render_lines']} строк")
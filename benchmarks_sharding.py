@@ -0,0 +1,107 @@
+# benchmarks/sharding.py
+"""
+Многопроцессный режим на синтетическом потоке: фронт раздаёт апдейты
+воркерам по chat_id, посередине прогона часть шардов переносится
+на другой воркер (а при --add-worker запускается ещё один).
+После остановки проверяется, что каждое обычное сообщение учтено ровно один раз.
+
+Bot API — локальный фейковый сервер из benchmarks.webhook, база — временная.
+Антифлуд в тестовых чатах выключен, чтобы число учтённых сообщений было детерминированным.
+
+Запуск: python -m benchmarks.sharding [--workers 2] [--count 20000] [--add-worker]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from aiohttp import web
+from benchmarks.webhook import FakeBotAPI, PLAIN, synthetic_updates
+
+async def _prepare_db(updates):
+    """Создаёт схему и выключает антифлуд во всех чатах потока"""
+    import database
+    await database.init_db()
+    try:
+        chats = {update["message"]["chat"]["id"] for update in updates}
+        for chat_id in chats:
+            await database.update_chat_setting(chat_id, "antiflood_enabled", 0)
+    finally:
+        await database.close_db()
+
+async def run(workers: int, count: int, add_worker: bool = False, api_port: int = 18082) -> dict:
+    fake = FakeBotAPI()
+    api_app = web.Application()
+    api_app.router.add_post("/bot{token}/{method}", fake.handle)
+    api_runner = web.AppRunner(api_app)
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+
+    updates = synthetic_updates(count, chats=200, users=5000)
+    expected = sum(1 for update in updates if update["message"]["text"] in PLAIN)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sharding.db")
+        # Воркеры запускаются через spawn и получают окружение фронта
+        os.environ.update({"DB_PATH": db_path, "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}"})
+        await _prepare_db(updates)
+
+        from sharding import ShardedFront
+        front = ShardedFront(workers, log_level=logging.WARNING)
+        await front.start()
+        start = time.perf_counter()
+        try:
+            half = len(updates) // 2
+            for update in updates[:half]:
+                front.route(update)
+                if update["update_id"] % 500 == 0:
+                    await front.wait_capacity()
+                    await asyncio.sleep(0)
+            if add_worker:
+                await front.add_worker()
+            elif workers > 1:
+                await front.move_shards(front.shards_of(0)[::2], 1)
+            for update in updates[half:]:
+                front.route(update)
+                if update["update_id"] % 500 == 0:
+                    await front.wait_capacity()
+                    await asyncio.sleep(0)
+        finally:
+            await front.stop()
+            await api_runner.cleanup()
+        elapsed = time.perf_counter() - start
+
+        with sqlite3.connect(db_path) as db:
+            counted = db.execute("SELECT COALESCE(SUM(messages_all), 0) FROM chat_stats").fetchone()[0]
+
+    return {
+        "workers": len(front.routed),
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_second": len(updates) / elapsed,
+        "routed": dict(front.routed),
+        "expected_messages": expected,
+        "counted_messages": counted,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк шардирования по процессам")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--add-worker", action="store_true", help="добавить воркер посередине прогона")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.workers, args.count, args.add_worker))
+    print(
+        f"{result['workers']} воркер(а), {result['updates']} апдейтов за {result['seconds']:.2f} с: "
+        f"{result['updates_per_second']:.0f} апдейтов/с"
+    )
+    print(f"распределение: {result['routed']}")
+    status = "OK" if result["counted_messages"] == result["expected_messages"] else "РАСХОЖДЕНИЕ"
+    print(f"учтено сообщений: {result['counted_messages']} из {result['expected_messages']} — {status}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# benchmarks/webhook.py
+"""
+Пропускная способность режима вебхука без выхода в сеть.
+
+Поднимается локальный фейковый Bot API: он отвечает на вызовы методов
+(sendMessage, getChatMember, ...) и воспроизводит записанные апдейты —
+POST-запросами на вебхук бота через connections параллельных соединений,
+как это делает Telegram с max_connections. Бот — настоящий диспетчер из bot.build_app с временной базой.
+Лимиты Telegram на отправку не моделируются: очередь отправки открывается настежь.
+
+Апдейты читаются из JSONL (по одному объекту Update в строке, как их присылает Telegram);
+без --updates генерируется синтетический поток, который можно сохранить через --record.
+
+Запуск: python -m benchmarks.webhook [--updates updates.jsonl] [--count 5000] [--connections 40]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Iterable, List
+
+from aiohttp import ClientSession, web
+
+SECRET = "benchmark-secret"
+PLAIN = [
+    "Привет всем, как дела?",
+    "кто идёт сегодня вечером на встречу",
+    "ок",
+    "Да, согласен.",
+    "это было очень давно, не помню уже",
+]
+COMMANDS = ["топ", "/mystats", "ранг"]
+
+def synthetic_updates(count: int, chats: int = 50, users: int = 2000, command_share: float = 0.02,
+                      seed: int = 1) -> List[dict]:
+    rnd = random.Random(seed)
+    now = int(time.time())
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = rnd.randrange(1, users + 1)
+        text = rnd.choice(COMMANDS) if rnd.random() < command_share else rnd.choice(PLAIN)
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": now,
+                "chat": {"id": -1000000 - user_id % chats, "type": "supergroup", "title": "bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+            },
+        })
+    return updates
+
+def load_updates(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+class FakeBotAPI:
+    """Минимальный Bot API: правдоподобные ответы на методы, которые вызывает бот"""
+
+    def __init__(self, admins: Iterable[int] = ()):
+        self.calls = Counter()
+        # Эти пользователи — владельцы всех чатов (для сценариев модерации)
+        self.admins = set(admins)
+        self._message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] += 1
+        if method == "getUpdates":
+            # Апдейтов для long polling нет: как Telegram, держим запрос до таймаута (здесь не дольше секунды)
+            await asyncio.sleep(min(float(params.get("timeout", 0)), 1))
+            return web.json_response({"ok": True, "result": []})
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method: str, params):
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 42, "is_bot": True, "first_name": "bench"}
+        if method == "getChatAdministrators":
+            return [self._member(user_id) for user_id in sorted(self.admins)]
+        if method == "getChatMember":
+            return self._member(int(params.get("user_id", 0)))
+        return True
+
+    def _member(self, user_id: int) -> dict:
+        user = {"id": user_id, "is_bot": False, "first_name": "user"}
+        if user_id in self.admins:
+            return {"status": "creator", "user": user, "is_anonymous": False}
+        return {"status": "member", "user": user}
+
+async def _replay(url: str, updates: List[dict], connections: int) -> List[float]:
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    latencies = []
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def connection(session: ClientSession):
+        while not queue.empty():
+            update = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"Вебхук ответил {response.status}")
+            latencies.append(time.perf_counter() - start)
+
+    async with ClientSession() as session:
+        await asyncio.gather(*(connection(session) for _ in range(connections)))
+    return latencies
+
+def _percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+async def run(updates: List[dict], connections: int = 40, api_port: int = 18081,
+              webhook_port: int = 18080) -> dict:
+    fake = FakeBotAPI()
+    api_app = web.Application()
+    api_app.router.add_post("/bot{token}/{method}", fake.handle)
+    api_runner = web.AppRunner(api_app)
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+
+    # Config читает окружение при импорте, поэтому бот импортируется только здесь
+    os.environ.update({
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_URL": "",
+    })
+    import database
+    from bot import build_app, config
+    from rate_limiter import FloodPolicy, TOKEN_BUCKET
+    from webhook import start_webhook
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app = build_app(config)
+    unlimited = FloodPolicy(TOKEN_BUCKET, 10 ** 6, 1)
+    app.outbound.global_policy = app.outbound.chat_policy = unlimited
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "benchmark.db")
+        runner, handler = await start_webhook(app.dp, app.bot, app.config)
+        try:
+            url = f"http://127.0.0.1:{webhook_port}{app.config.WEBHOOK_PATH}"
+            start = time.perf_counter()
+            latencies = await _replay(url, updates, connections)
+            await handler.wait_idle()
+            elapsed = time.perf_counter() - start
+        finally:
+            await runner.cleanup()
+            await api_runner.cleanup()
+
+    return {
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_second": len(updates) / elapsed,
+        "ack_p50_ms": _percentile(latencies, 0.5) * 1000,
+        "ack_p99_ms": _percentile(latencies, 0.99) * 1000,
+        "api_calls": dict(fake.calls),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк вебхука на фейковом Bot API")
+    parser.add_argument("--updates", help="JSONL с записанными апдейтами")
+    parser.add_argument("--count", type=int, default=5000, help="размер синтетического потока")
+    parser.add_argument("--connections", type=int, default=40)
+    parser.add_argument("--record", help="сохранить синтетический поток в JSONL")
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count)
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as file:
+            for update in updates:
+                file.write(json.dumps(update, ensure_ascii=False) + "\n")
+
+    result = asyncio.run(run(updates, connections=args.connections))
+    print(
+        f"{result['updates']} апдейтов за {result['seconds']:.2f} с: "
+        f"{result['updates_per_second']:.0f} апдейтов/с, "
+        f"подтверждение p50 {result['ack_p50_ms']:.1f} мс, p99 {result['ack_p99_ms']:.1f} мс"
+    )
+    print(f"вызовы API: {result['api_calls']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,152 @@
 import asyncio
 import logging
+from typing import Callable, NamedTuple, Optional
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties  # Исправленный импорт
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.types import Message
 
 from config import Config
-from database import init_db
-from scheduler import start_scheduler
-from middlewares import AntifloodMiddleware, LoggingMiddleware
+from database import init_db, close_db, profile_cache_stats, settings_cache_stats
+from scheduler import start_scheduler, stop_scheduler
+from middlewares import (AntifloodMiddleware, LoggingMiddleware, CommandParserMiddleware,
+                         UpdateMetricsMiddleware, HandlerMetricsMiddleware,
+                         UpdateTracingMiddleware, TracedMiddleware, HandlerTracingMiddleware)
 from filters import IsPrivate
-from handlers import group, stats, moderation, ranks, admin
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+from log_pipeline import ChatLogSampler, log_stats, setup_logging
+from loop_monitor import monitor as loop_monitor
+from metrics import register_stats, start_metrics_server
+from outbound import OutboundScheduler, TracingRequestMiddleware
+from tracing import tracer
+from webhook import run_webhook
+from handlers import dispatch, group, stats, moderation, ranks, admin
 
 config = Config()
-bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+logger = logging.getLogger(__name__)
 
-dp.message.middleware(AntifloodMiddleware(default_delay=config.ANTIFLOOD_SECONDS))
-dp.message.middleware(LoggingMiddleware())
+class App(NamedTuple):
+    config: Config
+    bot: Bot
+    dp: Dispatcher
+    outbound: OutboundScheduler
 
-@dp.message(IsPrivate())
 async def private_not_allowed(message: Message):
     await message.answer("🤖 Бот работает только в группах.")
 
-dp.include_router(stats.router)
-dp.include_router(moderation.router)
-dp.include_router(ranks.router)
-dp.include_router(admin.router)
-dp.include_router(group.router)
+def build_app(config: Config, chat_filter: Optional[Callable[[int], bool]] = None) -> App:
+    """
+    Создаёт бота и диспетчер со всеми middleware и роутерами.
+    Вызывается один раз на процесс: роутеры handlers подключаются только к одному диспетчеру.
+    При импорте bot.py ничего не создаётся, поэтому воркеры (spawn), которые заново
+    исполняют bot.py как __mp_main__, а затем импортируют его, не подключают роутеры дважды.
+    chat_filter передаётся в init_db: воркер загружает в память только рейтинги своих чатов.
+    """
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL)) if config.TELEGRAM_API_URL else None
+    bot = Bot(token=config.BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = Dispatcher()
+
+    outbound = OutboundScheduler(
+        global_rate=config.OUTBOUND_GLOBAL_RATE,
+        chat_rate=config.OUTBOUND_CHAT_RATE,
+        chat_period=config.OUTBOUND_CHAT_PERIOD,
+        max_retries=config.OUTBOUND_MAX_RETRIES,
+    )
+    tracer.configure(
+        sample_rate=config.TRACE_SAMPLE_RATE,
+        slow_query_ms=config.SLOW_QUERY_MS,
+        max_traces=config.TRACE_MAX_TRACES,
+    )
+    tracing_enabled = config.TRACE_SAMPLE_RATE > 0
+    loop_monitor.configure(interval=config.LOOP_LAG_INTERVAL, threshold_ms=config.LOOP_LAG_THRESHOLD_MS)
+
+    def traced(middleware):
+        # Под трассировкой каждый middleware виден в трассе апдейта отдельным спаном
+        return TracedMiddleware(middleware) if tracing_enabled else middleware
+
+    if tracing_enabled:
+        bot.session.middleware(TracingRequestMiddleware())
+    bot.session.middleware(outbound)
+
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if tracing_enabled:
+        dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.message.outer_middleware(traced(CommandParserMiddleware()))
+    antiflood = AntifloodMiddleware(max_period=config.FLOOD_MAX_PERIOD)
+    dp.message.middleware(traced(antiflood))
+    message_log = LoggingMiddleware(ChatLogSampler(
+        sample_rate=config.LOG_SAMPLE_RATE,
+        capacity=config.LOG_CHAT_CAPACITY,
+        period=config.LOG_CHAT_PERIOD,
+    ))
+    dp.message.middleware(traced(message_log))
+    # Внутренние middleware dp.message/dp.callback_query действуют во всех вложенных роутерах
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+        if tracing_enabled:
+            observer.middleware(HandlerTracingMiddleware())
+
+    register_stats("bot_antiflood", "Состояние антифлуда", antiflood.stats)
+    register_stats("bot_outbound", "Очередь исходящих запросов", outbound.stats)
+    register_stats("bot_profile_cache", "Кэш профилей пользователей", profile_cache_stats)
+    register_stats("bot_settings_cache", "Кэш настроек чатов", settings_cache_stats)
+    register_stats("bot_log_queue", "Очередь логов", log_stats)
+    register_stats("bot_log_sampler", "Прореживание логов по чатам", message_log.stats)
+    register_stats("bot_tracing", "Трассировка и медленные запросы", tracer.stats)
+    register_stats("bot_loop", "Задержка цикла событий", loop_monitor.stats)
+
+    dp.message.register(private_not_allowed, IsPrivate())
+
+    # Команды разбираются один раз (CommandParserMiddleware) и уходят в dispatch.router,
+    # обычные сообщения — сразу в учёт статистики (group.router).
+    # Модули stats/moderation/ranks/admin регистрируют команды в реестре при импорте
+    dp.include_router(dispatch.router)
+    dp.include_router(group.router)
+    dp.include_router(stats.router)
+    dp.include_router(moderation.router)
+    dp.include_router(ranks.router)
+    dp.include_router(admin.router)
+
+    metrics_runner = None
+
+    @dp.startup()
+    async def on_startup():
+        nonlocal metrics_runner
+        await init_db(chat_filter)
+        if config.METRICS_PORT:
+            metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+        start_scheduler()
+        loop_monitor.start()
+        logger.info("✅ Бот запущен")
 
-@dp.startup()
-async def on_startup():
-    await init_db()
-    start_scheduler()
-    logger.info("✅ Бот запущен")
+    @dp.shutdown()
+    async def on_shutdown():
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await loop_monitor.stop()
+        # Идущий сброс буфера дожидается close_db (под блокировкой буфера), новые не начинаются
+        stop_scheduler()
+        await outbound.close()
+        await close_db()
+        if tracing_enabled:
+            events = tracer.export(config.TRACE_FILE)
+            logger.info("Трассы выгружены в %s (%s событий)", config.TRACE_FILE, events)
+        logger.info("❌ Бот остановлен")
 
-@dp.shutdown()
-async def on_shutdown():
-    logger.info("❌ Бот остановлен")
+    return App(config, bot, dp, outbound)
 
 async def main():
-    await dp.start_polling(bot)
+    setup_logging(config.LOG_LEVEL, queue_size=config.LOG_QUEUE_SIZE)
+    app = build_app(config)
+    if config.SHARD_WORKERS > 0:
+        # Этот процесс только принимает апдейты, обработка — в воркерах (sharding.py)
+        from sharding import run_sharded
+        await run_sharded(app.dp, app.bot, config, app.outbound)
+    elif config.UPDATE_MODE == "webhook":
+        await run_webhook(app.dp, app.bot, config)
+    else:
+        await app.dp.start_polling(app.bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,189 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш с вытеснением давно не использованных записей.
+    Если задан ttl (секунды), записи старше него считаются отсутствующими.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (значение, момент истечения или None)
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        """Сохраняет value, только если ключа нет (или запись истекла); возвращает текущее значение"""
+        current = self.get(key, _MISSING)
+        if current is not _MISSING:
+            return current
+        self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self) -> list:
+        return list(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "evictions": self.evictions}
+
+
+class ProfileCache:
+    """
+    Помнит, какой профиль пользователя (username, имя, фамилия) уже записан в базу,
+    чтобы не повторять upsert на каждое сообщение. Хранит только хэш профиля
+    и время записи; запись старше refresh_after секунд считается устаревшей.
+    """
+
+    def __init__(self, max_size: int = 100000, refresh_after: float = 86400):
+        self.refresh_after = refresh_after
+        self.hits = 0
+        self.misses = 0
+        self._entries = LRUCache(max_size)
+
+    def is_fresh(self, user_id: int, profile: Tuple) -> bool:
+        entry = self._entries.get(user_id)
+        if entry and entry[0] == hash(profile) and time.monotonic() - entry[1] < self.refresh_after:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, user_id: int, profile: Tuple):
+        self._entries.set(user_id, (hash(profile), time.monotonic()))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "evictions": self._entries.evictions,
+        }
+
+
+class ExpiringDict:
+    """
+    Словарь с ограниченным временем жизни записей на двух поколениях.
+    Записи живут в текущем поколении; раз в ttl секунд текущее становится
+    предыдущим, а предыдущее отправляется на удаление. Запись, обновлённая
+    не позже ttl секунд назад, гарантированно доступна; более старые могут
+    вернуться, поэтому вызывающий сам сравнивает сохранённое время.
+    Размер пропорционален числу ключей, активных за последние несколько ttl.
+    Отжившие поколения удаляются порциями по sweep_batch записей на каждую
+    запись, чтобы не останавливать цикл событий на освобождении миллионов ключей.
+    Время передаётся вызывающим (now), в тех же единицах, что и ttl.
+    """
+
+    def __init__(self, ttl: float, sweep_batch: int = 64):
+        self.ttl = ttl
+        self.sweep_batch = sweep_batch
+        self.evictions = 0
+        self._current: dict = {}
+        self._previous: dict = {}
+        self._expired: list = []
+        self._rotated_at: Optional[float] = None
+
+    def _advance(self, now: float):
+        if self._rotated_at is None:
+            self._rotated_at = now
+            return
+        elapsed = now - self._rotated_at
+        if elapsed < self.ttl:
+            return
+        if self._previous:
+            self._expired.append(self._previous)
+        if elapsed >= 2 * self.ttl:
+            # Пауза дольше двух поколений: устарели обе
+            if self._current:
+                self._expired.append(self._current)
+            self._previous = {}
+        else:
+            self._previous = self._current
+        self._current = {}
+        self._rotated_at = now
+
+    def _sweep(self):
+        budget = self.sweep_batch
+        while budget and self._expired:
+            generation = self._expired[-1]
+            while budget and generation:
+                generation.popitem()
+                budget -= 1
+                self.evictions += 1
+            if not generation:
+                self._expired.pop()
+
+    def get(self, key: Hashable, now: float, default: Any = None) -> Any:
+        self._advance(now)
+        value = self._current.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._previous.get(key, _MISSING)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any, now: float):
+        self._advance(now)
+        self._previous.pop(key, None)
+        self._current[key] = value
+        self._sweep()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self._current.pop(key, _MISSING)
+        if value is _MISSING:
+            value = self._previous.pop(key, _MISSING)
+        return default if value is _MISSING else value
+
+    @property
+    def pending_sweep(self) -> int:
+        """Количество отживших записей, ещё не освобождённых"""
+        return sum(len(generation) for generation in self._expired)
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "evictions": self.evictions,
+            "pending_sweep": self.pending_sweep,
+        }
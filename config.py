@@ -1,5 +1,5 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class Config:
@@ -8,5 +8,84 @@ class Config:
     MUTE_PERIOD: int = 60
     BAN_PERIOD: int = 3600
     MAX_WARNS: int = 3
-    ANTIFLOOD_SECONDS: int = 2
-    BONUS_GRAMMAR: int = 20
\ No newline at end of file
+    # Наибольший допустимый период политики антифлуда (/set_flood), сек.
+    FLOOD_MAX_PERIOD: int = 300
+    BONUS_GRAMMAR: int = 20
+    DB_POOL_SIZE: int = 4
+    # Число файлов-шардов для chat_stats, daily_stats и moderation_logs (1 — всё в DB_PATH).
+    # Существующую базу делит python -m db_split --shards N
+    # В многопроцессном режиме чаты воркера лежат в одном файле, только если DB_SHARDS == SHARD_WORKERS
+    DB_SHARDS: int = int(os.getenv("DB_SHARDS", "1"))
+    FLUSH_MAX_PENDING: int = 500
+    FLUSH_INTERVAL: int = 5
+    RANK_CACHE_SIZE: int = 100000
+    # В памяти держатся рейтинги чатов с сообщениями за столько дней (0 — всех чатов)
+    LEADERBOARD_ACTIVE_DAYS: int = 30
+    USER_CACHE_SIZE: int = 50000
+    # В многопроцессном режиме профиль может обновить другой воркер: кэш живёт не дольше (сек.)
+    USER_CACHE_SHARDED_TTL: int = 60
+    PROFILE_CACHE_SIZE: int = 200000
+    PROFILE_REFRESH_SECONDS: int = 86400
+    SETTINGS_CACHE_SIZE: int = 20000
+    SETTINGS_CACHE_TTL: int = 600
+    ADMIN_CACHE_SIZE: int = 20000
+    ADMIN_CACHE_TTL: int = 300
+    # Получение апдейтов: "polling" или "webhook"
+    UPDATE_MODE: str = os.getenv("UPDATE_MODE", "polling")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_PATH: str = "/webhook"
+    # Публичный адрес для setWebhook; если пуст, вебхук регистрируется вручную
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONCURRENCY: int = 256
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    # Свой Bot API сервер (например, локальный для бенчмарков); пусто — api.telegram.org
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
+    # Многопроцессный режим: число воркеров (0 — всё в одном процессе) и виртуальных шардов.
+    # На ходу число воркеров меняется сигналами фронту: SIGUSR1 — добавить, SIGUSR2 — убрать
+    SHARD_WORKERS: int = int(os.getenv("SHARD_WORKERS", "0"))
+    SHARD_VIRTUAL: int = 1024
+    SHARD_WORKER_CONCURRENCY: int = 256
+    # Сколько апдейтов воркер держит в обработке и в очередях чатов; остальные ждут во входной очереди
+    SHARD_WORKER_MAX_PENDING: int = 4096
+    # Сколько ждать отчёта воркера о запуске (сек.)
+    SHARD_START_TIMEOUT: int = 60
+    # Исходящие запросы к Telegram API (outbound.py). В многопроцессном режиме
+    # OUTBOUND_GLOBAL_RATE делится между воркерами поровну
+    OUTBOUND_GLOBAL_RATE: int = 30
+    OUTBOUND_CHAT_RATE: int = 20
+    OUTBOUND_CHAT_PERIOD: int = 60
+    OUTBOUND_MAX_RETRIES: int = 3
+    # Логирование (log_pipeline.py): очередь с фоновой записью, прореживание записей по чатам
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    LOG_CHAT_CAPACITY: int = 20
+    LOG_CHAT_PERIOD: int = 60
+    # Локальный HTTP сервер /metrics (Prometheus); 0 — выключен.
+    # В многопроцессном режиме воркер i слушает METRICS_PORT + 1 + i
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    # Трассировка апдейтов (tracing.py): доля апдейтов в трассировке (0 — выключена),
+    # сколько последних трасс держать и куда выгрузить их при остановке (Chrome trace JSON)
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    TRACE_MAX_TRACES: int = 1000
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "traces.json")
+    # SQL-выражения дольше этого (мс) пишутся в лог с планом запроса; 0 — не отслеживать.
+    # Включается явно: журнал оборачивает и замеряет каждое выражение
+    SLOW_QUERY_MS: int = int(os.getenv("SLOW_QUERY_MS", "0"))
+    # Контроль цикла событий (loop_monitor.py): как часто мерить задержку (сек.)
+    # и с какой задержки (мс) считать цикл заблокированным и снимать стек
+    LOOP_LAG_INTERVAL: float = 0.1
+    LOOP_LAG_THRESHOLD_MS: int = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+    # Владелец бота: ему доступна команда /status (отчёт приходит в личку); 0 — никому
+    OWNER_ID: int = int(os.getenv("OWNER_ID", "0"))
+    DB_PRAGMAS: dict = field(default_factory=lambda: {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,
+        "cache_size": -16000,
+    })
\ No newline at end of file
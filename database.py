@@ -1,86 +1,190 @@
-import aiosqlite
+import asyncio
 import logging
+import os
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from typing import Any, Callable, Dict, NamedTuple, Optional, List, Tuple
+import aiosqlite
+from config import Config
+from db_pool import ConnectionPool
+from write_buffer import MessageBuffer, merge_epoch
+from rank_tracker import RankTracker, RankState
+from leaderboard import Leaderboard
+from cache import LRUCache, ProfileCache
+from migrations import migrate_files
+import metrics
+import tracing
+from sharding import shard_of
+import periods
 
 logger = logging.getLogger(__name__)
-DB_PATH = "iris_clone.db"
+DB_PATH = os.getenv("DB_PATH", "iris_clone.db")
 
-async def init_db():
-    """Инициализация базы данных"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Пользователи (кэш)
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Статистика по чатам
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS chat_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER,
-                user_id INTEGER,
-                messages_day INTEGER DEFAULT 0,
-                messages_week INTEGER DEFAULT 0,
-                messages_all INTEGER DEFAULT 0,
-                experience INTEGER DEFAULT 0,
-                warns INTEGER DEFAULT 0,
-                custom_rank INTEGER,
-                hidden_rank INTEGER DEFAULT 0,
-                last_message_time TIMESTAMP,
-                rank_updated_at TIMESTAMP,
-                UNIQUE(chat_id, user_id)
-            )
-        ''')
-        
-        # Настройки чата
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS chat_settings (
-                chat_id INTEGER PRIMARY KEY,
-                welcome_enabled INTEGER DEFAULT 1,
-                antiflood_enabled INTEGER DEFAULT 1,
-                mute_duration INTEGER DEFAULT 60,
-                ban_duration INTEGER DEFAULT 3600
-            )
-        ''')
-        
-        # Логи модерации
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS moderation_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER,
-                admin_id INTEGER,
-                action TEXT,
-                target_id INTEGER,
-                reason TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Ежедневная статистика (для точного подсчёта за 30 дней)
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS daily_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER,
-                user_id INTEGER,
-                date TEXT,
-                messages INTEGER DEFAULT 0,
-                UNIQUE(chat_id, user_id, date)
+config = Config()
+_pool: Optional[ConnectionPool] = None
+# Пулы шардов статистики; индекс шарда чата — shard_of(chat_id, DB_SHARDS)
+_shard_pools: List[ConnectionPool] = []
+_buffer = MessageBuffer(max_pending=config.FLUSH_MAX_PENDING)
+_ranks = RankTracker(max_size=config.RANK_CACHE_SIZE)
+_leaderboard = Leaderboard()
+# user_id -> (username, first_name, last_name) или None, если пользователя нет в базе.
+# Кэш свой в каждом процессе; при нескольких воркерах записи устаревают по TTL
+_user_info_cache = LRUCache(
+    max_size=config.USER_CACHE_SIZE,
+    ttl=config.USER_CACHE_SHARDED_TTL if config.SHARD_WORKERS > 0 else None,
+)
+_NOT_CACHED = object()
+# Настройки меняются только через update_chat_setting, TTL — страховка от расхождений
+_settings_cache = LRUCache(max_size=config.SETTINGS_CACHE_SIZE, ttl=config.SETTINGS_CACHE_TTL)
+_profile_cache = ProfileCache(max_size=config.PROFILE_CACHE_SIZE, refresh_after=config.PROFILE_REFRESH_SECONDS)
+
+# Время каждой публичной функции модуля (с учётом ожидания пула и блокировки буфера)
+DB_QUERY_SECONDS = metrics.histogram("bot_db_query_seconds", "Время выполнения функций database.py", ["query"])
+DB_QUERY_ERRORS = metrics.counter("bot_db_query_errors_total", "Исключения в функциях database.py", ["query"])
+_metered = metrics.timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS)
+_traced = tracing.traced("db")
+
+def _timed(func):
+    """
+    Метрики времени и спан трассировки вокруг функции модуля.
+    Тонкие обёртки над другой функцией (get_user_info, update_chat_setting)
+    не оборачиваются: вызов учитывается один раз, во внутренней функции.
+    """
+    return _metered(_traced(func))
+
+def _acquire():
+    """Берёт соединение из общего пула (users, chat_settings)"""
+    if _pool is None:
+        raise RuntimeError("База данных не инициализирована, вызовите init_db()")
+    return _pool.acquire()
+
+def shard_path(index: int, base: Optional[str] = None) -> str:
+    """Файл шарда статистики: iris_clone.db -> iris_clone.shard0.db"""
+    root, ext = os.path.splitext(base or DB_PATH)
+    return f"{root}.shard{index}{ext}"
+
+def db_paths(base: Optional[str] = None) -> List[str]:
+    """Основной файл и файлы шардов статистики; схема у них одна"""
+    paths = [base or DB_PATH]
+    if config.DB_SHARDS > 1:
+        paths += [shard_path(index, base) for index in range(config.DB_SHARDS)]
+    return paths
+
+def _chat_pool(chat_id: int) -> ConnectionPool:
+    if not _shard_pools:
+        raise RuntimeError("База данных не инициализирована, вызовите init_db()")
+    return _shard_pools[shard_of(chat_id, len(_shard_pools))]
+
+def _acquire_chat(chat_id: int):
+    """Соединение с шардом, где лежат chat_stats, daily_stats и moderation_logs чата"""
+    return _chat_pool(chat_id).acquire()
+
+async def init_db(chat_filter: Optional[Callable[[int], bool]] = None):
+    """
+    Инициализация базы данных.
+    chat_filter — какие чаты загружать в память (воркер загружает только свои шарды)
+    """
+    global _pool, _shard_pools
+    if _pool is None:
+        # Миграции — до открытия пулов: соединение, открытое раньше, держит старую схему,
+        # и проверка планов ниже видела бы индексы до миграции
+        await migrate_files(db_paths())
+        if config.DB_SHARDS > 1 and await _has_unsplit_stats(DB_PATH):
+            # Бот читал бы статистику из шардов, а строки основного файла молча пропадали бы из топов
+            raise RuntimeError(
+                f"DB_SHARDS={config.DB_SHARDS}, но в {DB_PATH} остались строки chat_stats: "
+                f"разделите базу (python -m db_split --shards {config.DB_SHARDS}) или удалите их"
             )
-        ''')
-        
-        await db.commit()
+        _pool = ConnectionPool(DB_PATH, size=config.DB_POOL_SIZE, pragmas=config.DB_PRAGMAS)
+        await _pool.open()
+        # При DB_SHARDS = 1 статистика живёт в основном файле
+        _shard_pools = [_pool] if config.DB_SHARDS <= 1 else [
+            ConnectionPool(shard_path(index), size=config.DB_POOL_SIZE, pragmas=config.DB_PRAGMAS)
+            for index in range(config.DB_SHARDS)
+        ]
+        for pool in _shard_pools:
+            await pool.open()
+    await check_query_plans()
+    await warm_leaderboard(chat_filter)
     logger.info("База данных инициализирована")
 
+async def _has_unsplit_stats(path: str) -> bool:
+    """Есть ли статистика чатов в основном файле (при DB_SHARDS > 1 она должна лежать в шардах)"""
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM chat_stats)")
+        return bool((await cursor.fetchone())[0])
+
+def _all_pools() -> List[ConnectionPool]:
+    return [_pool] + [pool for pool in _shard_pools if pool is not _pool]
+
+# Горячие запросы, планы которых проверяются при старте
+_HOT_QUERIES = {
+    "get_top_all": ('''
+        SELECT user_id, messages_all, experience FROM chat_stats
+        WHERE chat_id = ? ORDER BY messages_all DESC, experience DESC, user_id LIMIT ?
+    ''', (0, 10)),
+    **{
+        f"get_top_{period}": (f'''
+            SELECT user_id, messages_{period}, experience FROM chat_stats
+            WHERE chat_id = ? AND {period}_epoch = ? AND messages_{period} > 0
+            ORDER BY messages_{period} DESC, experience DESC, user_id LIMIT ?
+        ''', (0, 0, 10))
+        for period in ('day', 'week')
+    },
+    "get_top_inactive": ('''
+        SELECT user_id, 0, experience FROM chat_stats
+        WHERE chat_id = ? AND NOT (day_epoch = ? AND messages_day > 0)
+        ORDER BY experience DESC, user_id LIMIT ?
+    ''', (0, 0, 10)),
+    "month_sum": ('''
+        SELECT SUM(messages) FROM daily_stats
+        WHERE chat_id = ? AND user_id = ? AND date >= ?
+    ''', (0, 0, "")),
+    "moderation_logs": ('''
+        SELECT action, target_id FROM moderation_logs
+        WHERE chat_id = ? ORDER BY timestamp DESC LIMIT ?
+    ''', (0, 10)),
+}
+
+async def check_query_plans() -> dict:
+    """
+    Прогоняет EXPLAIN QUERY PLAN для горячих запросов.
+    Возвращает {имя запроса: план} для тех, что ушли в полный скан или сортировку.
+    """
+    problems = {}
+    async with _shard_pools[0].acquire() as db:
+        for name, (sql, params) in _HOT_QUERIES.items():
+            cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in await cursor.fetchall()]
+            if any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan):
+                problems[name] = plan
+    for name, plan in problems.items():
+        logger.warning(f"Запрос {name} не использует индекс: {'; '.join(plan)}")
+    return problems
+
+async def close_db():
+    """Закрывает пулы соединений при остановке бота"""
+    global _pool, _shard_pools
+    if _pool is None:
+        return
+    try:
+        # Если запись не удалась, приращения остаются в буфере, а ошибка уходит вызывающему
+        await flush_messages()
+    finally:
+        pools, _pool, _shard_pools = _all_pools(), None, []
+        for pool in pools:
+            try:
+                await pool.close()
+            except Exception:
+                logger.exception("Не удалось закрыть пул %s", pool.path)
+
 # --- Работа с пользователями ---
+@_timed
 async def update_user_info(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-    async with aiosqlite.connect(DB_PATH) as db:
+    profile = (username, first_name, last_name)
+    # Профиль почти никогда не меняется между сообщениями — пишем только изменения
+    if _profile_cache.is_fresh(user_id, profile):
+        return
+    async with _acquire() as db:
         await db.execute('''
             INSERT INTO users (user_id, username, first_name, last_name, updated_at)
             VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
@@ -91,207 +195,503 @@ async def update_user_info(user_id: int, username: str = None, first_name: str =
                 updated_at=excluded.updated_at
         ''', (user_id, username, first_name, last_name))
         await db.commit()
+    _profile_cache.remember(user_id, profile)
+    _user_info_cache.set(user_id, profile)
+
+def profile_cache_stats() -> dict:
+    """Счётчики кэша профилей: hits — пропущенные записи, misses — выполненные"""
+    return _profile_cache.stats()
+
+def settings_cache_stats() -> dict:
+    return _settings_cache.stats()
 
 async def get_user_info(user_id: int) -> Optional[Tuple]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT username, first_name, last_name FROM users WHERE user_id = ?', (user_id,)) as cursor:
-            return await cursor.fetchone()
+    return (await get_users_info([user_id])).get(user_id)
+
+@_timed
+async def get_users_info(user_ids: List[int]) -> Dict[int, Tuple]:
+    """
+    (username, first_name, last_name) для списка пользователей.
+    Берёт из кэша, недостающих дочитывает одним запросом.
+    """
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        info = _user_info_cache.get(user_id, _NOT_CACHED)
+        if info is _NOT_CACHED:
+            missing.append(user_id)
+        elif info is not None:
+            result[user_id] = info
+    if missing:
+        placeholders = ",".join("?" * len(missing))
+        async with _acquire() as db:
+            cursor = await db.execute(f'''
+                SELECT user_id, username, first_name, last_name
+                FROM users WHERE user_id IN ({placeholders})
+            ''', missing)
+            rows = await cursor.fetchall()
+        for user_id, *info in rows:
+            result[user_id] = tuple(info)
+        for user_id in missing:
+            # Отсутствие записи тоже кэшируется, пока update_user_info её не создаст.
+            # Если update_user_info успел записать профиль, пока шёл SELECT,
+            # в кэше уже свежее значение — прочитанное его не заменяет
+            info = _user_info_cache.setdefault(user_id, result.get(user_id))
+            if info is not None:
+                result[user_id] = info
+    return result
 
 # --- Работа со статистикой ---
+# Дневной и недельный счётчики действительны только в своей эпохе (см. periods.py):
+# устаревшие значения читаются как 0 и перезаписываются при следующей записи,
+# поэтому ночное обнуление всей таблицы не нужно
+_PERIOD_VALUE = {
+    'day': "CASE WHEN day_epoch = ? THEN messages_day ELSE 0 END",
+    'week': "CASE WHEN week_epoch = ? THEN messages_week ELSE 0 END",
+}
+
+def _current_epochs():
+    now = datetime.now(periods.tz)
+    return periods.day_epoch(now), periods.week_epoch(now)
+
+def _experience_for(text: str) -> int:
+    exp_gain = (len(text) // 3) * 30
+    if text and text[0].isupper() and text[-1] in '.!?':
+        exp_gain += 20
+    return exp_gain
+
+@_timed
 async def add_message(chat_id: int, user_id: int, text: str):
-    """Начисляет опыт и увеличивает счётчики сообщений"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT messages_day, messages_week, messages_all, experience, warns, custom_rank
-            FROM chat_stats WHERE chat_id = ? AND user_id = ?
-        ''', (chat_id, user_id))
-        row = await cursor.fetchone()
+    """
+    Начисляет опыт и увеличивает счётчики сообщений.
+    Запись отложенная: приращения копятся в буфере и сбрасываются
+    flush_messages() по порогу, по таймеру планировщика и при остановке.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    day, week = _current_epochs()
+    exp_gain = _experience_for(text)
+    _ranks.add_message(chat_id, user_id, today, day, week)
+    if _leaderboard.ready:
+        _leaderboard.add_message(chat_id, user_id, exp_gain, day, week)
+    if _buffer.add(chat_id, user_id, exp_gain, today, timestamp, day, week):
+        await flush_messages()
 
-        exp_gain = (len(text) // 3) * 30
-        if text and text[0].isupper() and text[-1] in '.!?':
-            exp_gain += 20
-
-        today = datetime.now().strftime("%Y-%m-%d")
-
-        if row:
-            messages_day, messages_week, messages_all, experience, warns, custom_rank = row
-            messages_day += 1
-            messages_week += 1
-            messages_all += 1
-            experience += exp_gain
-            
-            await db.execute('''
-                UPDATE chat_stats
-                SET messages_day = ?, messages_week = ?, messages_all = ?, 
-                    experience = ?, last_message_time = CURRENT_TIMESTAMP
-                WHERE chat_id = ? AND user_id = ?
-            ''', (messages_day, messages_week, messages_all, experience, chat_id, user_id))
-        else:
-            await db.execute('''
-                INSERT INTO chat_stats 
-                (chat_id, user_id, messages_day, messages_week, messages_all, experience, last_message_time)
-                VALUES (?, ?, 1, 1, 1, ?, CURRENT_TIMESTAMP)
-            ''', (chat_id, user_id, exp_gain))
-        
-        await db.execute('''
-            INSERT INTO daily_stats (chat_id, user_id, date, messages)
-            VALUES (?, ?, ?, 1)
-            ON CONFLICT(chat_id, user_id, date) DO UPDATE SET
-                messages = messages + 1
-        ''', (chat_id, user_id, today))
-        
-        await db.commit()
+@_timed
+async def flush_messages():
+    """Записывает накопленные счётчики в базу одной транзакцией"""
+    async with _buffer.lock:
+        await _flush_pending()
 
-async def reset_day_stats():
-    """Обнуляет messages_day для всех пользователей"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('UPDATE chat_stats SET messages_day = 0')
-        await db.commit()
-    logger.info("Дневная статистика сброшена")
+async def _flush_pending():
+    """Сброс буфера; вызывается под _buffer.lock"""
+    if not len(_buffer):
+        return
+    stats, daily = _buffer.take()
+    # Каждый шард пишется своей транзакцией; шарды — отдельные файлы, поэтому параллельно
+    by_pool: Dict[ConnectionPool, Tuple[dict, dict]] = {}
+    for chat_id, users in stats.items():
+        by_pool.setdefault(_chat_pool(chat_id), ({}, {}))[0][chat_id] = users
+    for key, days in daily.items():
+        by_pool.setdefault(_chat_pool(key[0]), ({}, {}))[1][key] = days
+    results = await asyncio.gather(
+        *(_write_stats(pool, *pending) for pool, pending in by_pool.items()),
+        return_exceptions=True,
+    )
+    error = None
+    for (pool, pending), result in zip(by_pool.items(), results):
+        if isinstance(result, Exception):
+            # Возвращаем в буфер только то, что не записалось
+            _buffer.restore(*pending)
+            logger.error("Не удалось записать статистику в %s, повторим при следующем сбросе",
+                         pool.path, exc_info=result)
+            error = error or result
+    if error is not None:
+        raise error
 
-async def reset_week_stats():
-    """Обнуляет messages_week для всех пользователей"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('UPDATE chat_stats SET messages_week = 0')
+async def _write_stats(pool: ConnectionPool, stats, daily):
+    stats_rows = [
+        (chat_id, user_id, p.messages_day, p.day_epoch, p.messages_week, p.week_epoch,
+         p.messages, p.experience, p.last_message_time)
+        for chat_id, users in stats.items()
+        for user_id, p in users.items()
+    ]
+    daily_rows = [
+        (chat_id, user_id, date, count)
+        for (chat_id, user_id), days in daily.items()
+        for date, count in days.items()
+    ]
+    async with pool.acquire() as db:
+        await db.executemany('''
+            INSERT INTO chat_stats
+            (chat_id, user_id, messages_day, day_epoch, messages_week, week_epoch,
+             messages_all, experience, last_message_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                messages_day = CASE WHEN day_epoch = excluded.day_epoch
+                    THEN messages_day + excluded.messages_day ELSE excluded.messages_day END,
+                day_epoch = excluded.day_epoch,
+                messages_week = CASE WHEN week_epoch = excluded.week_epoch
+                    THEN messages_week + excluded.messages_week ELSE excluded.messages_week END,
+                week_epoch = excluded.week_epoch,
+                messages_all = messages_all + excluded.messages_all,
+                experience = experience + excluded.experience,
+                last_message_time = excluded.last_message_time
+        ''', stats_rows)
+        await db.executemany('''
+            INSERT INTO daily_stats (chat_id, user_id, date, messages)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(chat_id, user_id, date) DO UPDATE SET
+                messages = messages + excluded.messages
+        ''', daily_rows)
         await db.commit()
-    logger.info("Недельная статистика сброшена")
+    logger.debug("Статистика записана в %s: %s пользователей, %s дневных записей",
+                 pool.path, len(stats_rows), len(daily_rows))
 
-async def get_top(chat_id: int, period: str = 'all', limit: int = 10) -> List[Tuple]:
-    period_map = {
-        'day': 'messages_day',
-        'week': 'messages_week',
-        'all': 'messages_all'
-    }
-    column = period_map.get(period, 'messages_all')
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(f'''
-            SELECT user_id, {column}, experience
+async def _fetch_top(db, chat_id: int, period: str, epoch: int, limit: int) -> List[list]:
+    if period == 'all':
+        cursor = await db.execute('''
+            SELECT user_id, messages_all, experience
             FROM chat_stats
             WHERE chat_id = ?
-            ORDER BY {column} DESC, experience DESC
+            ORDER BY messages_all DESC, experience DESC, user_id
             LIMIT ?
         ''', (chat_id, limit))
-        return await cursor.fetchall()
+        return [list(row) for row in await cursor.fetchall()]
+
+    # Сначала активные в текущей эпохе, затем остальные (с нулём за период) по опыту
+    cursor = await db.execute(f'''
+        SELECT user_id, messages_{period}, experience
+        FROM chat_stats
+        WHERE chat_id = ? AND {period}_epoch = ? AND messages_{period} > 0
+        ORDER BY messages_{period} DESC, experience DESC, user_id
+        LIMIT ?
+    ''', (chat_id, epoch, limit))
+    rows = [list(row) for row in await cursor.fetchall()]
+    if len(rows) < limit:
+        cursor = await db.execute(f'''
+            SELECT user_id, 0, experience
+            FROM chat_stats
+            WHERE chat_id = ? AND NOT ({period}_epoch = ? AND messages_{period} > 0)
+            ORDER BY experience DESC, user_id
+            LIMIT ?
+        ''', (chat_id, epoch, limit - len(rows)))
+        rows.extend(list(row) for row in await cursor.fetchall())
+    return rows
+
+@_timed
+async def get_top(chat_id: int, period: str = 'all', limit: int = 10) -> List[Tuple]:
+    if period not in _PERIOD_VALUE:
+        period = 'all'
+    day, week = _current_epochs()
+    if _leaderboard.serves(chat_id):
+        return _leaderboard.top(chat_id, period, limit, day, week)
+    epoch = day if period == 'day' else week
+    value_sql = _PERIOD_VALUE.get(period, "messages_all")
+    value_params = (epoch,) if period != 'all' else ()
+
+    async with _buffer.lock:
+        pending = _buffer.chat_pending(chat_id)
+        async with _acquire_chat(chat_id) as db:
+            # Несброшенные приращения только увеличивают счётчики, поэтому
+            # итоговый топ гарантированно лежит в первых limit + len(pending) строках
+            rows = {row[0]: row for row in await _fetch_top(db, chat_id, period, epoch, limit + len(pending))}
+            missing = [user_id for user_id in pending if user_id not in rows]
+            if missing:
+                placeholders = ",".join("?" * len(missing))
+                cursor = await db.execute(f'''
+                    SELECT user_id, {value_sql}, experience
+                    FROM chat_stats
+                    WHERE chat_id = ? AND user_id IN ({placeholders})
+                ''', (*value_params, chat_id, *missing))
+                for user_id, msgs, exp in await cursor.fetchall():
+                    rows[user_id] = [user_id, msgs, exp]
+    if not pending:
+        return [tuple(row) for row in rows.values()][:limit]
+
+    for user_id, p in pending.items():
+        row = rows.setdefault(user_id, [user_id, 0, 0])
+        row[1] += {'day': p.day(day), 'week': p.week(week)}.get(period, p.messages)
+        row[2] += p.experience
+    # Тот же порядок, что у рейтинга в памяти: при равенстве — по user_id
+    top = sorted(rows.values(), key=lambda row: (-row[1], -row[2], row[0]))
+    return [tuple(row) for row in top[:limit]]
+
+def _touch_leaderboard(chat_id: int, user_id: int):
+    """Строки chat_stats, созданные не сообщением, тоже участвуют в топе (с нулём)"""
+    if _leaderboard.ready:
+        day, week = _current_epochs()
+        _leaderboard.touch(chat_id, user_id, day, week)
+
+@_timed
+async def get_user_position(chat_id: int, user_id: int, period: str = 'all') -> Optional[Tuple[int, int]]:
+    """(место в рейтинге, всего участников) по рейтингу в памяти, None если его нет"""
+    if not _leaderboard.serves(chat_id):
+        return None
+    day, week = _current_epochs()
+    return _leaderboard.position(chat_id, user_id, period, day, week)
+
+@_timed
+async def warm_leaderboard(chat_filter: Optional[Callable[[int], bool]] = None):
+    """
+    Загружает рейтинги чатов в память, чтобы топы не обращались к базе.
+    Загружаются только чаты с сообщениями за LEADERBOARD_ACTIVE_DAYS дней
+    (0 — все): остальные остаются в базе (cold), их топ читается запросом.
+    С chat_filter перезагружает только подходящие чаты (например, шарды,
+    перешедшие к этому процессу), остальные рейтинги не трогает.
+    """
+    day, week = _current_epochs()
+    active_since = None
+    if config.LEADERBOARD_ACTIVE_DAYS:
+        active_since = (datetime.utcnow() - timedelta(days=config.LEADERBOARD_ACTIVE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    async with _buffer.lock:
+        _leaderboard.forget(chat_filter or (lambda chat_id: True))
+        loaded = set()
+        cold = set()
+        # Чтение по всем шардам: каждый чат целиком лежит в одном из них
+        for pool in _shard_pools:
+            async with pool.acquire() as db:
+                if active_since is not None:
+                    async with db.execute('''
+                        SELECT chat_id FROM chat_stats
+                        GROUP BY chat_id
+                        HAVING MAX(last_message_time) IS NULL OR MAX(last_message_time) < ?
+                    ''', (active_since,)) as cursor:
+                        cold.update(chat_id for (chat_id,) in await cursor.fetchall()
+                                    if chat_filter is None or chat_filter(chat_id))
+                async with db.execute('''
+                    SELECT chat_id, user_id, messages_all, messages_day, day_epoch,
+                           messages_week, week_epoch, experience
+                    FROM chat_stats
+                    WHERE ? IS NULL OR chat_id IN (
+                        SELECT chat_id FROM chat_stats GROUP BY chat_id HAVING MAX(last_message_time) >= ?
+                    )
+                ''', (active_since, active_since)) as cursor:
+                    while True:
+                        rows = await cursor.fetchmany(5000)
+                        if not rows:
+                            break
+                        if chat_filter is not None:
+                            rows = [row for row in rows if chat_filter(row[0])]
+                        loaded.update(row[0] for row in rows)
+                        _leaderboard.load(rows)
+        # Несброшенные приращения добавляются без переключения задач до finish_load,
+        # дальше рейтинг обновляется из add_message
+        for chat_id, users in _buffer.pending().items():
+            if (chat_filter is not None and not chat_filter(chat_id)) or chat_id in cold:
+                continue
+            loaded.add(chat_id)
+            for user_id, p in users.items():
+                _leaderboard.load_pending(
+                    chat_id, user_id, p.messages, p.messages_day, p.day_epoch,
+                    p.messages_week, p.week_epoch, p.experience
+                )
+        _leaderboard.mark_cold(cold)
+        _leaderboard.finish_load(day, week, loaded)
+    logger.info("Рейтинги загружены: %s чатов, в базе оставлено %s неактивных", len(loaded), len(cold))
+
+def forget_chats(chat_filter: Callable[[int], bool]):
+    """
+    Сбрасывает состояние чатов в памяти процесса (рейтинги, скрытые ранги, настройки).
+    Вызывается после flush_messages, когда чаты переходят к другому процессу.
+    """
+    _leaderboard.forget(chat_filter)
+    _ranks.forget(chat_filter)
+    for chat_id in _settings_cache.keys():
+        if chat_filter(chat_id):
+            _settings_cache.pop(chat_id)
 
+@_timed
 async def get_user_stats(chat_id: int, user_id: int) -> Optional[Tuple]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT messages_day, messages_week, messages_all, experience, warns, custom_rank, hidden_rank
-            FROM chat_stats WHERE chat_id = ? AND user_id = ?
-        ''', (chat_id, user_id))
-        return await cursor.fetchone()
+    day, week = _current_epochs()
+    async with _buffer.lock:
+        async with _acquire_chat(chat_id) as db:
+            cursor = await db.execute(f'''
+                SELECT {_PERIOD_VALUE['day']}, {_PERIOD_VALUE['week']}, messages_all,
+                       experience, warns, custom_rank, hidden_rank
+                FROM chat_stats WHERE chat_id = ? AND user_id = ?
+            ''', (day, week, chat_id, user_id))
+            row = await cursor.fetchone()
+        pending = _buffer.get(chat_id, user_id)
+    if not pending:
+        return row
+    day_msgs, week_msgs, all_msgs, exp, warns, custom_rank, hidden_rank = row or (0, 0, 0, 0, 0, None, 0)
+    return (
+        day_msgs + pending.day(day), week_msgs + pending.week(week), all_msgs + pending.messages,
+        exp + pending.experience, warns, custom_rank, hidden_rank
+    )
 
+async def get_hidden_rank_info(chat_id: int, user_id: int) -> Optional[Tuple]:
+    stats = await get_user_stats(chat_id, user_id)
+    if not stats:
+        return None
+    day, week, all_msgs, exp, warns, custom_rank, hidden_rank = stats
+    return hidden_rank, all_msgs, day, week
+
+@_timed
 async def set_custom_rank(chat_id: int, user_id: int, rank: Optional[int]):
     """Устанавливает админ-ранг (custom_rank)"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _acquire_chat(chat_id) as db:
         await db.execute('''
             INSERT INTO chat_stats (chat_id, user_id, custom_rank)
             VALUES (?, ?, ?)
             ON CONFLICT(chat_id, user_id) DO UPDATE SET custom_rank=excluded.custom_rank
         ''', (chat_id, user_id, rank))
         await db.commit()
+    _touch_leaderboard(chat_id, user_id)
 
+async def _load_rank_state(chat_id: int, user_id: int, cutoff: str) -> Optional[RankState]:
+    """Однократно читает счётчики пользователя из базы и буфера"""
+    async with _buffer.lock:
+        state = _ranks.get(chat_id, user_id)
+        if state is not None:
+            return state
+        async with _acquire_chat(chat_id) as db:
+            cursor = await db.execute('''
+                SELECT messages_all, messages_day, day_epoch, messages_week, week_epoch, hidden_rank
+                FROM chat_stats 
+                WHERE chat_id = ? AND user_id = ?
+            ''', (chat_id, user_id))
+            row = await cursor.fetchone()
+            cursor = await db.execute('''
+                SELECT date, messages FROM daily_stats
+                WHERE chat_id = ? AND user_id = ? AND date >= ?
+            ''', (chat_id, user_id, cutoff))
+            days = dict(await cursor.fetchall())
+        # Снимок базы и буфера берётся без переключений задач между ними,
+        # поэтому последующие сообщения попадут в состояние через add_message
+        pending = _buffer.get(chat_id, user_id)
+        if not row and not pending:
+            return None
+        all_msgs, day_msgs, day_ep, week_msgs, week_ep, hidden_rank = row or (0, 0, 0, 0, 0, 0)
+        state = RankState(all_msgs, day_msgs, day_ep, week_msgs, week_ep, days, cutoff, hidden_rank)
+        if pending:
+            state.messages_all += pending.messages
+            state.messages_day, state.day_epoch = merge_epoch(
+                state.messages_day, state.day_epoch, pending.messages_day, pending.day_epoch)
+            state.messages_week, state.week_epoch = merge_epoch(
+                state.messages_week, state.week_epoch, pending.messages_week, pending.week_epoch)
+        for date, count in _buffer.daily_for(chat_id, user_id).items():
+            if date >= cutoff:
+                state.days[date] = state.days.get(date, 0) + count
+                state.month += count
+        _ranks.put(chat_id, user_id, state)
+        return state
+
+@_timed
 async def update_hidden_rank(chat_id: int, user_id: int) -> Optional[int]:
     """
     Проверяет условия и обновляет скрытый ранг пользователя.
     Возвращает новый ранг или None, если ранг не изменился.
+    Счётчики ведутся в памяти (RankTracker), база затрагивается
+    только при первой встрече пользователя и при смене ранга.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT messages_all, messages_day, messages_week, hidden_rank
-            FROM chat_stats 
-            WHERE chat_id = ? AND user_id = ?
-        ''', (chat_id, user_id))
-        row = await cursor.fetchone()
-        if not row:
+    thirty_days_ago = (datetime.now().date() - timedelta(days=30)).strftime("%Y-%m-%d")
+    day, week = _current_epochs()
+    state = _ranks.get(chat_id, user_id)
+    if state is None:
+        state = await _load_rank_state(chat_id, user_id, thirty_days_ago)
+        if state is None:
             return None
-        
-        all_msgs, day_msgs, week_msgs, current_hidden = row
-        
-        thirty_days_ago = (datetime.now().date() - timedelta(days=30)).strftime("%Y-%m-%d")
-        cursor = await db.execute('''
-            SELECT SUM(messages) FROM daily_stats
-            WHERE chat_id = ? AND user_id = ? AND date >= ?
-        ''', (chat_id, user_id, thirty_days_ago))
-        month_msgs = (await cursor.fetchone())[0] or 0
-        
-        new_rank = 0
-        
-        if all_msgs >= 1:
-            new_rank = 1
-        if all_msgs >= 1000:
-            new_rank = 2
-        if day_msgs >= 5000:
-            new_rank = 3
-        if week_msgs >= 15000:
-            new_rank = 4
-        if week_msgs >= 35000:
-            new_rank = 5
-        if month_msgs >= 100000:
-            new_rank = 6
-        
-        if new_rank != current_hidden:
-            await db.execute('''
-                UPDATE chat_stats 
-                SET hidden_rank = ?, rank_updated_at = CURRENT_TIMESTAMP
-                WHERE chat_id = ? AND user_id = ?
-            ''', (new_rank, chat_id, user_id))
-            await db.commit()
-            return new_rank
-        
+
+    new_rank = state.rank(thirty_days_ago, day, week)
+    if new_rank == state.hidden_rank:
         return None
 
+    state.hidden_rank = new_rank
+    async with _acquire_chat(chat_id) as db:
+        # Строки может ещё не быть, если все сообщения пользователя в буфере
+        await db.execute('''
+            INSERT INTO chat_stats (chat_id, user_id, hidden_rank, rank_updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                hidden_rank = excluded.hidden_rank,
+                rank_updated_at = excluded.rank_updated_at
+        ''', (chat_id, user_id, new_rank))
+        await db.commit()
+    return new_rank
+
+@_timed
 async def add_warn(chat_id: int, user_id: int) -> int:
     """Увеличивает счётчик варнов, возвращает текущее количество"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('SELECT warns FROM chat_stats WHERE chat_id = ? AND user_id = ?', (chat_id, user_id))
-        row = await cursor.fetchone()
-        if row:
-            warns = row[0] + 1
-            await db.execute('UPDATE chat_stats SET warns = ? WHERE chat_id = ? AND user_id = ?', (warns, chat_id, user_id))
-        else:
-            warns = 1
-            await db.execute('INSERT INTO chat_stats (chat_id, user_id, warns) VALUES (?, ?, ?)', (chat_id, user_id, warns))
+    async with _acquire_chat(chat_id) as db:
+        cursor = await db.execute('''
+            INSERT INTO chat_stats (chat_id, user_id, warns)
+            VALUES (?, ?, 1)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET warns = warns + 1
+            RETURNING warns
+        ''', (chat_id, user_id))
+        warns = (await cursor.fetchone())[0]
         await db.commit()
-        return warns
+    _touch_leaderboard(chat_id, user_id)
+    return warns
 
+@_timed
 async def remove_warn(chat_id: int, user_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('SELECT warns FROM chat_stats WHERE chat_id = ? AND user_id = ?', (chat_id, user_id))
+    async with _acquire_chat(chat_id) as db:
+        cursor = await db.execute('''
+            UPDATE chat_stats SET warns = MAX(warns - 1, 0)
+            WHERE chat_id = ? AND user_id = ?
+            RETURNING warns
+        ''', (chat_id, user_id))
         row = await cursor.fetchone()
-        if row and row[0] > 0:
-            warns = row[0] - 1
-            await db.execute('UPDATE chat_stats SET warns = ? WHERE chat_id = ? AND user_id = ?', (warns, chat_id, user_id))
-        else:
-            warns = 0
         await db.commit()
-        return warns
+        return row[0] if row else 0
 
 # --- Настройки чата ---
-async def get_chat_settings(chat_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT welcome_enabled, antiflood_enabled, mute_duration, ban_duration 
-            FROM chat_settings WHERE chat_id = ?
-        ''', (chat_id,))
+class ChatSettings(NamedTuple):
+    welcome_enabled: int = 1
+    antiflood_enabled: int = 1
+    mute_duration: int = 60
+    ban_duration: int = 3600
+    # Антифлуд: не больше flood_capacity сообщений за flood_period секунд (см. rate_limiter.py)
+    flood_mode: str = 'bucket'
+    flood_capacity: int = 5
+    flood_period: int = 10
+
+_SETTINGS_COLUMNS = ", ".join(ChatSettings._fields)
+
+@_timed
+async def get_chat_settings(chat_id: int) -> ChatSettings:
+    settings = _settings_cache.get(chat_id)
+    if settings is not None:
+        return settings
+    async with _acquire() as db:
+        cursor = await db.execute(
+            f"SELECT {_SETTINGS_COLUMNS} FROM chat_settings WHERE chat_id = ?", (chat_id,)
+        )
         row = await cursor.fetchone()
-        if not row:
-            return (1, 1, 60, 3600)
-        return row
+    settings = ChatSettings(*row) if row else ChatSettings()
+    _settings_cache.set(chat_id, settings)
+    return settings
 
 async def update_chat_setting(chat_id: int, setting: str, value):
     """Обновляет конкретную настройку чата"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(f'''
-            INSERT INTO chat_settings (chat_id, {setting})
-            VALUES (?, ?)
-            ON CONFLICT(chat_id) DO UPDATE SET {setting}=excluded.{setting}
-        ''', (chat_id, value))
+    await update_chat_settings(chat_id, {setting: value})
+
+@_timed
+async def update_chat_settings(chat_id: int, values: Dict[str, Any]):
+    """Обновляет несколько настроек чата одним запросом"""
+    columns = list(values)
+    for column in columns:
+        if column not in ChatSettings._fields:
+            raise ValueError(f"Неизвестная настройка чата: {column}")
+    updates = ", ".join(f"{column}=excluded.{column}" for column in columns)
+    async with _acquire() as db:
+        cursor = await db.execute(f'''
+            INSERT INTO chat_settings (chat_id, {", ".join(columns)})
+            VALUES (?{", ?" * len(columns)})
+            ON CONFLICT(chat_id) DO UPDATE SET {updates}
+            RETURNING {_SETTINGS_COLUMNS}
+        ''', (chat_id, *values.values()))
+        row = await cursor.fetchone()
         await db.commit()
+    _settings_cache.set(chat_id, ChatSettings(*row))
 
 # --- Логирование модерации ---
+@_timed
 async def log_moderation(chat_id: int, admin_id: int, action: str, target_id: int, reason: str = ""):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _acquire_chat(chat_id) as db:
         await db.execute('''
             INSERT INTO moderation_logs (chat_id, admin_id, action, target_id, reason)
             VALUES (?, ?, ?, ?, ?)
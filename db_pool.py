@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+from tracing import TracedConnection, tracer
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений aiosqlite.
+    Соединения открываются один раз при старте и переиспользуются,
+    вместо создания нового потока и открытия файла на каждый запрос.
+    """
+
+    def __init__(self, path: str, size: int = 4, pragmas: Optional[Dict[str, object]] = None):
+        self.path = path
+        self.size = max(1, size)
+        self.pragmas = pragmas or {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+
+    async def open(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path)
+            for name, value in self.pragmas.items():
+                await conn.execute(f"PRAGMA {name} = {value}")
+            self._connections.append(conn)
+            self._queue.put_nowait(conn)
+        logger.info(f"Пул соединений открыт: {self.path} ({self.size} шт.)")
+
+    @asynccontextmanager
+    async def acquire(self, traced: bool = True):
+        """
+        Выдаёт соединение из пула на время блока async with.
+        При включённой трассировке или журнале медленных запросов
+        соединение обёрнуто в TracedConnection (traced=False — без обёртки).
+        """
+        if self._queue is None:
+            raise RuntimeError("Пул соединений не открыт, вызовите init_db()")
+        conn = await self._queue.get()
+        try:
+            yield TracedConnection(conn, self) if traced and tracer.instrument_db else conn
+        except BaseException:
+            # Не отдаём следующему владельцу соединение с незавершённой транзакцией
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+        finally:
+            self._queue.put_nowait(conn)
+
+    async def close(self):
+        if self._queue is None:
+            return
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+        self._queue = None
+        logger.info(f"Пул соединений закрыт: {self.path}")
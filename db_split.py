@@ -0,0 +1,93 @@
+"""
+Разовое разделение базы на шарды статистики.
+
+chat_stats, daily_stats и moderation_logs переносятся из основного файла
+в N файлов (iris_clone.shard0.db, ...) по shard_of(chat_id, N); users и chat_settings
+остаются в основном. После проверки количества строк перенесённые строки
+удаляются из основного файла (кроме --keep). Бот на время разделения должен быть остановлен;
+после — запускается с DB_SHARDS=N. Пока в основном файле остаются строки chat_stats
+(--keep или разделение не запускалось), бот с DB_SHARDS > 1 не запускается.
+
+Запуск: python -m db_split --shards 4 [--db iris_clone.db] [--keep]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+import aiosqlite
+from migrations import run_migrations
+from sharding import shard_of
+
+logger = logging.getLogger(__name__)
+
+SHARDED_TABLES = ("chat_stats", "daily_stats", "moderation_logs")
+
+async def _count(db, table: str, schema: str = "main") -> int:
+    cursor = await db.execute(f"SELECT COUNT(*) FROM {schema}.{table}")
+    return (await cursor.fetchone())[0]
+
+async def split(path: str, shards: int, keep: bool = False) -> dict:
+    """Делит базу path на shards файлов; возвращает {таблица: [строк в каждом шарде]}"""
+    from database import shard_path
+
+    if shards < 2:
+        raise ValueError("Число шардов должно быть не меньше 2")
+    paths = [shard_path(index, path) for index in range(shards)]
+    existing = [shard for shard in paths if os.path.exists(shard)]
+    if existing:
+        raise FileExistsError(f"Файлы шардов уже существуют: {', '.join(existing)}")
+
+    for shard in paths:
+        async with aiosqlite.connect(shard) as db:
+            await run_migrations(db)
+
+    report = {table: [] for table in SHARDED_TABLES}
+    async with aiosqlite.connect(path) as db:
+        await run_migrations(db)
+        await db.create_function("shard_of", 1, lambda chat_id: shard_of(chat_id, shards), deterministic=True)
+        totals = {table: await _count(db, table) for table in SHARDED_TABLES}
+        for index, shard in enumerate(paths):
+            await db.execute("ATTACH DATABASE ? AS shard", (shard,))
+            for table in SHARDED_TABLES:
+                cursor = await db.execute(f"PRAGMA main.table_info({table})")
+                columns = ", ".join(row[1] for row in await cursor.fetchall())
+                await db.execute(f'''
+                    INSERT INTO shard.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE shard_of(chat_id) = ?
+                ''', (index,))
+                await db.commit()
+                report[table].append(await _count(db, table, "shard"))
+            await db.execute("DETACH DATABASE shard")
+            logger.info(f"Шард {index}: {shard}")
+
+        for table, counts in report.items():
+            if sum(counts) != totals[table]:
+                raise RuntimeError(
+                    f"{table}: в шардах {sum(counts)} строк, в исходной базе {totals[table]}; "
+                    f"исходные данные не тронуты, файлы шардов нужно удалить"
+                )
+        if not keep:
+            for table in SHARDED_TABLES:
+                await db.execute(f"DELETE FROM {table}")
+            await db.commit()
+            await db.execute("VACUUM")
+    return report
+
+async def _main():
+    from database import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Разделение базы на шарды статистики")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--keep", action="store_true", help="не удалять перенесённые строки из основного файла (для сверки; бот с ними не запустится)")
+    args = parser.parse_args()
+
+    report = await split(args.db, args.shards, keep=args.keep)
+    for table, counts in report.items():
+        print(f"{table}: {' + '.join(map(str, counts))} = {sum(counts)}")
+    print(f"Готово. Запускайте бота с DB_SHARDS={args.shards}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
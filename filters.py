@@ -1,4 +1,5 @@
 from aiogram.filters import BaseFilter
+from typing import Optional, Tuple
 from aiogram.types import Message
 
 class IsGroup(BaseFilter):
@@ -7,4 +8,9 @@ class IsGroup(BaseFilter):
 
 class IsPrivate(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        return message.chat.type == "private"
\ No newline at end of file
+        return message.chat.type == "private"
+
+class HasCommand(BaseFilter):
+    """Сообщение распознано как команда (см. CommandParserMiddleware)"""
+    async def __call__(self, message: Message, parsed_command: Optional[Tuple[str, str]] = None) -> bool:
+        return parsed_command is not None
\ No newline at end of file
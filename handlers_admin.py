@@ -1,39 +1,34 @@
-from aiogram import Router, F
-from aiogram.types import Message
-from aiogram.filters import Command, CommandObject
+import html
+import logging
+import os
+import re
+import time
+from aiogram import Router
+from aiogram.types import Message, ChatMemberUpdated
+from aiogram.filters import CommandObject
 from filters import IsGroup
-from database import update_chat_setting, get_chat_settings
-from utils import is_admin
-from handlers.commands import get_command, extract_args
+from config import Config
+from database import update_chat_setting, update_chat_settings, get_chat_settings
+from rate_limiter import MODES, TOKEN_BUCKET
+from utils import remember_admins, update_admin_status
+from handlers.commands import command_handler
+from loop_monitor import monitor as loop_monitor
 
 router = Router()
 router.message.filter(IsGroup())
 
-@router.message(F.text)
-async def handle_admin_commands(message: Message):
-    cmd = get_command(message.text)
-    if not cmd:
-        return
-    
-    args = extract_args(message.text)
-    
-    if cmd == "admins":
-        await cmd_admins(message)
-    elif cmd == "settings":
-        await cmd_settings(message)
-    elif cmd == "set_welcome":
-        await cmd_set_welcome(message, CommandObject(args=args))
-    elif cmd == "set_antiflood":
-        await cmd_set_antiflood(message, CommandObject(args=args))
-    elif cmd == "set_mute":
-        await cmd_set_mute(message, CommandObject(args=args))
-    elif cmd == "set_ban":
-        await cmd_set_ban(message, CommandObject(args=args))
+config = Config()
+logger = logging.getLogger(__name__)
+
+# Сколько верхних кадров стека блокировки попадает в отчёт «/status»
+STATUS_STACK_FRAMES = 3
+_FRAME_PATH = re.compile(r'File "([^"]+)"')
 
-@router.message(Command("admins"))
+@command_handler("admins")
 async def cmd_admins(message: Message):
     try:
         admins = await message.bot.get_chat_administrators(message.chat.id)
+        remember_admins(message.chat.id, admins)
         lines = []
         for admin in admins:
             user = admin.user
@@ -46,33 +41,33 @@ async def cmd_admins(message: Message):
     except Exception as e:
         await message.answer("❌ Не удалось получить список администраторов.")
 
-@router.message(Command("settings"))
+@router.chat_member()
+async def on_chat_member_updated(event: ChatMemberUpdated):
+    update_admin_status(event.chat.id, event.new_chat_member.user.id, event.new_chat_member.status)
+
+@command_handler("settings", admin=True)
 async def cmd_settings(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     settings = await get_chat_settings(message.chat.id)
-    welcome, antiflood, mute_dur, ban_dur = settings
+    flood_mode = "ведро токенов" if settings.flood_mode == TOKEN_BUCKET else "скользящее окно"
     
     text = (
         "⚙️ <b>Настройки чата:</b>\n"
-        f"Приветствие: {'✅' if welcome else '❌'}\n"
-        f"Антифлуд: {'✅' if antiflood else '❌'}\n"
-        f"Длительность мута: {mute_dur} сек.\n"
-        f"Длительность бана: {ban_dur} сек.\n\n"
+        f"Приветствие: {'✅' if settings.welcome_enabled else '❌'}\n"
+        f"Антифлуд: {'✅' if settings.antiflood_enabled else '❌'}\n"
+        f"Лимит сообщений: {settings.flood_capacity} за {settings.flood_period} сек. ({flood_mode})\n"
+        f"Длительность мута: {settings.mute_duration} сек.\n"
+        f"Длительность бана: {settings.ban_duration} сек.\n\n"
         "Для изменения:\n"
-        "/set_welcome on/off  или  приветствие on/off\n"
-        "/set_antiflood on/off  или  антифлуд on/off\n"
-        "/set_mute <сек>  или  мут время <сек>\n"
-        "/set_ban <сек>  или  бан время <сек>"
+        "/set_welcome on/off\n"
+        "/set_antiflood on/off\n"
+        "/set_flood [bucket|window] N сек\n"
+        "/set_mute <сек>\n"
+        "/set_ban <сек>"
     )
     await message.answer(text)
 
-@router.message(Command("set_welcome"))
+@command_handler("set_welcome", admin=True)
 async def cmd_set_welcome(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not command.args:
         await message.reply("Укажите on или off")
         return
@@ -85,13 +80,10 @@ async def cmd_set_welcome(message: Message, command: CommandObject):
         await update_chat_setting(message.chat.id, "welcome_enabled", 0)
         await message.reply("✅ Приветствие выключено")
     else:
-        await message.reply("Используйте: /set_welcome on/off  или  приветствие on/off")
+        await message.reply("Используйте: /set_welcome on/off")
 
-@router.message(Command("set_antiflood"))
+@command_handler("set_antiflood", admin=True)
 async def cmd_set_antiflood(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not command.args:
         await message.reply("Укажите on или off")
         return
@@ -104,13 +96,10 @@ async def cmd_set_antiflood(message: Message, command: CommandObject):
         await update_chat_setting(message.chat.id, "antiflood_enabled", 0)
         await message.reply("✅ Антифлуд выключен")
     else:
-        await message.reply("Используйте: /set_antiflood on/off  или  антифлуд on/off")
+        await message.reply("Используйте: /set_antiflood on/off")
 
-@router.message(Command("set_mute"))
+@command_handler("set_mute", admin=True)
 async def cmd_set_mute(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not command.args:
         await message.reply("Укажите длительность в секундах")
         return
@@ -124,11 +113,8 @@ async def cmd_set_mute(message: Message, command: CommandObject):
     except:
         await message.reply("Укажите положительное число")
 
-@router.message(Command("set_ban"))
+@command_handler("set_ban", admin=True)
 async def cmd_set_ban(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not command.args:
         await message.reply("Укажите длительность в секундах")
         return
@@ -140,4 +126,58 @@ async def cmd_set_ban(message: Message, command: CommandObject):
         await update_chat_setting(message.chat.id, "ban_duration", duration)
         await message.reply(f"✅ Длительность бана установлена: {duration} сек.")
     except:
-        await message.reply("Укажите положительное число")
\ No newline at end of file
+        await message.reply("Укажите положительное число")
+
+@command_handler("set_flood", admin=True)
+async def cmd_set_flood(message: Message, command: CommandObject):
+    usage = "Используйте: /set_flood [bucket|window] N сек, например /set_flood 5 10"
+    parts = command.args.split() if command.args else []
+    mode = TOKEN_BUCKET
+    if parts and parts[0].lower() in MODES:
+        mode = parts.pop(0).lower()
+    
+    try:
+        capacity, period = (int(part) for part in parts)
+        if capacity <= 0 or not 0 < period <= config.FLOOD_MAX_PERIOD:
+            raise ValueError
+    except ValueError:
+        await message.reply(f"{usage}\nПериод — от 1 до {config.FLOOD_MAX_PERIOD} сек.")
+        return
+    
+    await update_chat_settings(message.chat.id, {
+        "flood_mode": mode,
+        "flood_capacity": capacity,
+        "flood_period": period,
+    })
+    await message.reply(f"✅ Лимит: не больше {capacity} сообщений за {period} сек.")
+
+@command_handler("status")
+async def cmd_status(message: Message):
+    if not config.OWNER_ID or message.from_user.id != config.OWNER_ID:
+        return
+    
+    stats = loop_monitor.stats()
+    text = (
+        "🩺 <b>Состояние бота:</b>\n"
+        f"Задержка цикла: p50 {stats['p50'] * 1000:.1f} мс, p99 {stats['p99'] * 1000:.1f} мс, "
+        f"макс. {stats['max_lag'] * 1000:.0f} мс\n"
+        f"Блокировок дольше {loop_monitor.threshold * 1000:.0f} мс: {stats['stalls']}"
+    )
+    if loop_monitor.stalls:
+        stall = loop_monitor.stalls[-1]
+        duration = f"{stall.lag * 1000:.0f} мс" if stall.lag is not None else "ещё не завершилась"
+        text += (
+            f"\n\nПоследняя: {time.strftime('%d.%m %H:%M:%S', time.localtime(stall.started))}, {duration}"
+            + (f", задача {html.escape(stall.task)}" if stall.task else "")
+        )
+        if stall.stack:
+            # Последние кадры — место блокирующего вызова; пути сокращены до имени файла
+            frames = "".join(stall.stack[-STATUS_STACK_FRAMES:])
+            frames = _FRAME_PATH.sub(lambda match: f'File "{os.path.basename(match.group(1))}"', frames)
+            text += "\n<pre>" + html.escape(frames.rstrip()) + "</pre>"
+    # Отчёт — только владельцу в личку: в группе его увидели бы все участники
+    try:
+        await message.bot.send_message(config.OWNER_ID, text)
+    except Exception as e:
+        logger.warning("Не удалось отправить статус владельцу: %s", e)
+        await message.reply("❌ Не удалось отправить отчёт в личные сообщения — сначала напишите боту.")
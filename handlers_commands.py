@@ -1,4 +1,8 @@
 # handlers/commands.py
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from aiogram.filters import CommandObject
+from utils import is_admin
 
 COMMANDS = {
     # Статистика
@@ -28,49 +32,96 @@ COMMANDS = {
     "set_welcome": ["приветствие", "set welcome"],
     "set_antiflood": ["антифлуд", "antiflood"],
     "set_mute": ["мут время", "set mute"],
-    "set_ban": ["бан время", "set ban"]
+    "set_ban": ["бан время", "set ban"],
+    "set_flood": ["антифлуд лимит", "лимит флуда", "set flood"],
+
+    # Владелец бота: только /status — «статус» в начале фразы обычное слово
+    "status": []
 }
 
-def get_command(text: str) -> str:
+def _build_index():
+    """Строит при импорте таблицы текстовых алиасов и имён слэш-команд"""
+    aliases = {}
+    slash = {}
+    for cmd, variants in COMMANDS.items():
+        slash.setdefault(cmd, cmd)
+        for variant in variants:
+            aliases.setdefault(variant, cmd)
+            slash.setdefault(variant, cmd)
+    return aliases, slash
+
+_ALIASES, _SLASH_COMMANDS = _build_index()
+
+def parse_command(text: str) -> Optional[Tuple[str, str]]:
     """
-    Определяет, является ли текст командой, и возвращает ключ команды.
-    Если текст не является командой, возвращает None.
+    Разбирает текст сообщения за один проход.
+    Возвращает (ключ команды, аргументы) или None, если это не команда.
+    Текстовый алиас распознаётся только целиком: "топ новостей" или
+    "пред за спам" — обычные фразы. Аргументы передаются только после слэш-команды.
+    Время разбора не зависит от количества алиасов.
     """
     if not text:
         return None
-    
-    text = text.lower().strip()
-    
-    for cmd, variants in COMMANDS.items():
-        if text in variants:
-            return cmd
-    
-    if text.startswith('/'):
-        cmd_without_slash = text[1:].split()[0].lower()
-        for cmd, variants in COMMANDS.items():
-            if cmd_without_slash == cmd or cmd_without_slash in variants:
-                return cmd
-    
+
+    stripped = text.strip()
+    lowered = stripped.lower()
+
+    cmd = _ALIASES.get(lowered)
+    if cmd:
+        return cmd, ""
+
+    if lowered.startswith('/'):
+        parts = stripped.split(None, 1)
+        name = parts[0][1:].lower().split('@', 1)[0]
+        cmd = _SLASH_COMMANDS.get(name)
+        if cmd:
+            return cmd, parts[1] if len(parts) > 1 else ""
+
     return None
 
+def get_command(text: str) -> str:
+    """
+    Определяет, является ли текст командой, и возвращает ключ команды.
+    Если текст не является командой, возвращает None.
+    """
+    parsed = parse_command(text)
+    return parsed[0] if parsed else None
+
 def extract_args(text: str) -> str:
     """Извлекает аргументы из текста команды"""
-    if not text:
-        return ""
-    
-    parts = text.split()
-    if len(parts) <= 1:
-        return ""
-    
-    text_lower = text.lower()
-    
-    for cmd, variants in COMMANDS.items():
-        for variant in variants:
-            if text_lower.startswith(variant):
-                args = text[len(variant):].strip()
-                return args
-    
-    if text.startswith('/'):
-        return ' '.join(parts[1:])
-    
-    return ""
\ No newline at end of file
+    parsed = parse_command(text)
+    return parsed[1] if parsed else ""
+
+
+# --- Реестр обработчиков команд ---
+# Текст разбирается один раз (CommandParserMiddleware), а handlers/dispatch.py
+# вызывает обработчик из реестра напрямую, без перебора роутеров.
+# Команды с admin=True от остальных участников не выполняются: сообщение
+# ("пред" в ответе на чужое сообщение) учитывается в статистике как обычное.
+COMMAND_HANDLERS: Dict[str, Tuple[Callable[..., Awaitable[Any]], bool, bool]] = {}
+
+def command_handler(*names: str, admin: bool = False):
+    """Регистрирует обработчик для ключей команд из COMMANDS"""
+    def decorator(func):
+        takes_args = len(inspect.signature(func).parameters) > 1
+        for name in names:
+            COMMAND_HANDLERS[name] = (func, takes_args, admin)
+        return func
+    return decorator
+
+async def run_command(name: str, message, args: str) -> bool:
+    """
+    Вызывает обработчик команды. Возвращает False, если обработчика нет
+    или команда только для администраторов, а отправитель им не является.
+    """
+    entry = COMMAND_HANDLERS.get(name)
+    if entry is None:
+        return False
+    func, takes_args, admin = entry
+    if admin and not await is_admin(message.bot, message.chat.id, message.from_user.id):
+        return False
+    if takes_args:
+        await func(message, CommandObject(command=name, args=args or None))
+    else:
+        await func(message)
+    return True
@@ -0,0 +1,16 @@
+# handlers/dispatch.py
+from aiogram import Router, F
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Message
+from filters import IsGroup, HasCommand
+from handlers.commands import run_command
+
+router = Router()
+router.message.filter(IsGroup())
+
+@router.message(F.text, HasCommand())
+async def dispatch_command(message: Message, parsed_command):
+    name, args = parsed_command
+    if not await run_command(name, message, args):
+        # Не выполненная команда идёт дальше, в учёт статистики (handlers.group)
+        return UNHANDLED
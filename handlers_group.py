@@ -1,19 +1,18 @@
 from aiogram import Router, F
 from aiogram.types import Message
 from filters import IsGroup
+from outbound import send_priority, PRIORITY_WELCOME
 from database import update_user_info, add_message, get_chat_settings, update_hidden_rank
-from handlers.commands import get_command
 import logging
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 router.message.filter(IsGroup())
 
 @router.message(F.text)
 async def handle_message(message: Message):
-    cmd = get_command(message.text)
-    if cmd:
-        return
-    
+    # Команды сюда не доходят: их забирает роутер handlers.dispatch
     await update_user_info(
         message.from_user.id,
         message.from_user.username,
@@ -25,16 +24,18 @@ async def handle_message(message: Message):
     
     new_rank = await update_hidden_rank(message.chat.id, message.from_user.id)
     if new_rank:
-        logging.info(f"Пользователь {message.from_user.id} получил скрытый ранг {new_rank}")
+        logger.info("Пользователь %s получил скрытый ранг %s", message.from_user.id, new_rank)
 
 @router.message(F.new_chat_members)
 async def welcome_new_member(message: Message):
     settings = await get_chat_settings(message.chat.id)
-    if settings[0]:
+    if settings.welcome_enabled:
         for user in message.new_chat_members:
             if user.id == message.bot.id:
                 continue
-            await message.answer(
-                f"👋 Добро пожаловать, {user.full_name}!\n"
-                "Здесь мы собираем статистику и ценим грамотное общение."
-            )
\ No newline at end of file
+            # Приветствия уступают очередь ответам и модерации
+            with send_priority(PRIORITY_WELCOME):
+                await message.answer(
+                    f"👋 Добро пожаловать, {user.full_name}!\n"
+                    "Здесь мы собираем статистику и ценим грамотное общение."
+                )
\ No newline at end of file
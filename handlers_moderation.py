@@ -1,46 +1,19 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, ChatPermissions
-from aiogram.filters import Command, CommandObject
+from aiogram.filters import CommandObject
 from filters import IsGroup
 from database import add_warn, remove_warn, log_moderation, get_chat_settings
 from utils import is_admin
 import datetime
 from config import Config
-from handlers.commands import get_command, extract_args
+from handlers.commands import command_handler
 
 router = Router()
 router.message.filter(IsGroup())
 config = Config()
 
-@router.message(F.text)
-async def handle_moderation_commands(message: Message):
-    cmd = get_command(message.text)
-    if not cmd:
-        return
-    
-    args = extract_args(message.text)
-    
-    if cmd == "mute":
-        await cmd_mute(message, CommandObject(args=args))
-    elif cmd == "unmute":
-        await cmd_unmute(message)
-    elif cmd == "kick":
-        await cmd_kick(message)
-    elif cmd == "ban":
-        await cmd_ban(message, CommandObject(args=args))
-    elif cmd == "unban":
-        await cmd_unban(message)
-    elif cmd == "warn":
-        await cmd_warn(message, CommandObject(args=args))
-    elif cmd == "unwarn":
-        await cmd_unwarn(message)
-
-@router.message(Command("mute"))
+@command_handler("mute", admin=True)
 async def cmd_mute(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        await message.reply("❌ Эта команда только для администраторов.")
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение пользователя, которого хотите замутить.")
         return
@@ -55,7 +28,7 @@ async def cmd_mute(message: Message, command: CommandObject):
         return
 
     settings = await get_chat_settings(message.chat.id)
-    mute_duration = settings[2]
+    mute_duration = settings.mute_duration
     
     until_date = datetime.datetime.now() + datetime.timedelta(seconds=mute_duration)
     permissions = ChatPermissions(can_send_messages=False)
@@ -69,11 +42,8 @@ async def cmd_mute(message: Message, command: CommandObject):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.message(Command("unmute"))
+@command_handler("unmute", admin=True)
 async def cmd_unmute(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение пользователя.")
         return
@@ -88,11 +58,8 @@ async def cmd_unmute(message: Message):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.message(Command("kick"))
+@command_handler("kick", admin=True)
 async def cmd_kick(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение.")
         return
@@ -110,11 +77,8 @@ async def cmd_kick(message: Message):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.message(Command("ban"))
+@command_handler("ban", admin=True)
 async def cmd_ban(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение.")
         return
@@ -125,7 +89,7 @@ async def cmd_ban(message: Message, command: CommandObject):
         return
     
     settings = await get_chat_settings(message.chat.id)
-    ban_duration = settings[3]
+    ban_duration = settings.ban_duration
     until_date = datetime.datetime.now() + datetime.timedelta(seconds=ban_duration)
     
     try:
@@ -135,11 +99,8 @@ async def cmd_ban(message: Message, command: CommandObject):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.message(Command("unban"))
+@command_handler("unban", admin=True)
 async def cmd_unban(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение.")
         return
@@ -153,11 +114,8 @@ async def cmd_unban(message: Message):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.message(Command("warn"))
+@command_handler("warn", admin=True)
 async def cmd_warn(message: Message, command: CommandObject):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение.")
         return
@@ -174,7 +132,7 @@ async def cmd_warn(message: Message, command: CommandObject):
 
     if warns >= config.MAX_WARNS:
         settings = await get_chat_settings(message.chat.id)
-        mute_duration = settings[2]
+        mute_duration = settings.mute_duration
         until_date = datetime.datetime.now() + datetime.timedelta(seconds=mute_duration)
         permissions = ChatPermissions(can_send_messages=False)
         try:
@@ -188,11 +146,8 @@ async def cmd_warn(message: Message, command: CommandObject):
         except:
             pass
 
-@router.message(Command("unwarn"))
+@command_handler("unwarn", admin=True)
 async def cmd_unwarn(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     if not message.reply_to_message:
         await message.reply("❌ Ответьте на сообщение.")
         return
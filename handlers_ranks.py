@@ -1,30 +1,15 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
-from aiogram.filters import Command, CommandObject
+from aiogram.filters import CommandObject
 from filters import IsGroup
 from database import set_custom_rank
-from utils import is_creator, is_admin, ADMIN_RANKS
-from handlers.commands import get_command, extract_args
+from utils import is_creator, ADMIN_RANKS
+from handlers.commands import command_handler
 
 router = Router()
 router.message.filter(IsGroup())
 
-@router.message(F.text)
-async def handle_rank_commands(message: Message):
-    cmd = get_command(message.text)
-    if not cmd:
-        return
-    
-    args = extract_args(message.text)
-    
-    if cmd == "setrank":
-        await cmd_setrank(message, CommandObject(args=args))
-    elif cmd == "adminranks":
-        await cmd_admin_ranks(message)
-    elif cmd == "hiddenrank":
-        await cmd_hidden_rank(message)
-
-@router.message(Command("setrank"))
+@command_handler("setrank", admin=True)
 async def cmd_setrank(message: Message, command: CommandObject):
     if not await is_creator(message.bot, message.chat.id, message.from_user.id):
         await message.reply("❌ Только владелец чата может назначать админ-ранги.")
@@ -56,11 +41,8 @@ async def cmd_setrank(message: Message, command: CommandObject):
         rank_name = ADMIN_RANKS[rank - 1]
         await message.reply(f"👑 Пользователю {target.full_name} назначен админ-ранг «{rank_name}».")
 
-@router.message(Command("adminranks"))
+@command_handler("adminranks", admin=True)
 async def cmd_admin_ranks(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     ranks_info = [
         "1. Смотрящий",
         "2. Надзиратель",
@@ -71,8 +53,3 @@ async def cmd_admin_ranks(message: Message):
     ]
     text = "👑 <b>Административные ранги:</b>\n" + "\n".join(ranks_info)
     await message.answer(text)
-
-@router.message(Command("hiddenrank"))
-async def cmd_hidden_rank(message: Message):
-    from handlers.stats import cmd_hidden_rank as stats_hidden_rank
-    await stats_hidden_rank(message)
\ No newline at end of file
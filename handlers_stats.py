@@ -1,33 +1,15 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.filters import Command
 from filters import IsGroup
-from database import get_top, get_user_stats
-from utils import get_username_or_name, get_display_rank, format_number, is_admin
-import aiosqlite
-from database import DB_PATH
-from handlers.commands import get_command, extract_args
+from database import get_top, get_user_stats, get_hidden_rank_info, get_user_position
+from utils import get_usernames, get_display_rank, format_number
+from handlers.commands import command_handler
 
 router = Router()
 router.message.filter(IsGroup())
 
-@router.message(F.text)
-async def handle_commands(message: Message):
-    cmd = get_command(message.text)
-    if not cmd:
-        return
-    
-    args = extract_args(message.text)
-    
-    if cmd == "top":
-        await cmd_top(message)
-    elif cmd == "mystats":
-        await cmd_mystats(message)
-    elif cmd == "rank":
-        await cmd_rank(message)
-
-@router.message(Command("top"))
+@command_handler("top")
 async def cmd_top(message: Message):
     builder = InlineKeyboardBuilder()
     builder.button(text="За день", callback_data="top_day")
@@ -45,9 +27,10 @@ async def top_callback(callback: CallbackQuery):
         await callback.message.edit_text("📊 Статистика пока пуста.")
         return
 
+    names = await get_usernames([user_id for user_id, _, _ in top_data])
     lines = []
     for idx, (user_id, msgs, exp) in enumerate(top_data, 1):
-        name = await get_username_or_name(user_id)
+        name = names[user_id]
         exp_display = exp / 100
         lines.append(f"{idx}. {name} — {format_number(msgs)} сообщ., опыт: {exp_display:.2f}")
     
@@ -55,7 +38,7 @@ async def top_callback(callback: CallbackQuery):
     text = f"🏆 Топ-10 за {period_names[period]}:\n" + "\n".join(lines)
     await callback.message.edit_text(text)
 
-@router.message(Command("mystats"))
+@command_handler("mystats")
 async def cmd_mystats(message: Message):
     stats = await get_user_stats(message.chat.id, message.from_user.id)
     if not stats:
@@ -77,12 +60,17 @@ async def cmd_mystats(message: Message):
         f"⚠️ Предупреждений: {warns}"
     )
     
+    position = await get_user_position(message.chat.id, message.from_user.id)
+    if position:
+        place, total = position
+        text += f"\n🏆 Место в рейтинге: {place} из {total}"
+    
     if custom_rank:
         text = "👑 " + text
     
     await message.answer(text)
 
-@router.message(Command("rank"))
+@command_handler("rank")
 async def cmd_rank(message: Message):
     target = message.reply_to_message.from_user if message.reply_to_message else message.from_user
     
@@ -108,20 +96,11 @@ async def cmd_rank(message: Message):
     
     await message.answer(text)
 
-@router.message(Command("hiddenrank"))
+@command_handler("hiddenrank", admin=True)
 async def cmd_hidden_rank(message: Message):
-    if not await is_admin(message.bot, message.chat.id, message.from_user.id):
-        return
-    
     target = message.reply_to_message.from_user if message.reply_to_message else message.from_user
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT hidden_rank, messages_all, messages_day, messages_week
-            FROM chat_stats 
-            WHERE chat_id = ? AND user_id = ?
-        ''', (message.chat.id, target.id))
-        row = await cursor.fetchone()
+    row = await get_hidden_rank_info(message.chat.id, target.id)
     
     if not row:
         await message.answer("❌ Нет данных о пользователе.")
@@ -0,0 +1,175 @@
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from write_buffer import merge_epoch
+
+PERIODS = ('day', 'week', 'all')
+
+class ChatBoard:
+    """
+    Рейтинг одного чата по трём периодам.
+    Каждый период — отсортированный список ключей (-сообщения, -опыт, user_id):
+    поиск позиции бинарный, вставка и удаление — сдвиг участка списка (memmove).
+    Это O(n), но константа мала, а n ограничен размером группы Telegram (до 200 000
+    участников); замер на размерах чатов — python -m benchmarks.leaderboard.
+    """
+
+    __slots__ = ("users", "boards", "epochs")
+
+    def __init__(self):
+        # user_id -> [messages_all, messages_day, day_epoch, messages_week, week_epoch, experience]
+        self.users: Dict[int, list] = {}
+        self.boards: Dict[str, List[tuple]] = {period: [] for period in PERIODS}
+        self.epochs: Dict[str, int] = {'day': 0, 'week': 0}
+
+    def _value(self, user: list, period: str) -> int:
+        if period == 'day':
+            return user[1] if user[2] == self.epochs['day'] else 0
+        if period == 'week':
+            return user[3] if user[4] == self.epochs['week'] else 0
+        return user[0]
+
+    def _key(self, user_id: int, user: list, period: str) -> tuple:
+        return (-self._value(user, period), -user[5], user_id)
+
+    def sync_epochs(self, day_epoch: int, week_epoch: int):
+        """При смене суток/недели перестраивает соответствующий рейтинг"""
+        for period, epoch in (('day', day_epoch), ('week', week_epoch)):
+            if self.epochs[period] != epoch:
+                self.epochs[period] = epoch
+                self.boards[period] = sorted(
+                    self._key(user_id, user, period) for user_id, user in self.users.items()
+                )
+
+    def rebuild(self):
+        for period in PERIODS:
+            self.boards[period] = sorted(
+                self._key(user_id, user, period) for user_id, user in self.users.items()
+            )
+
+    def update(self, user_id: int, messages: int, exp_gain: int, day_epoch: int, week_epoch: int):
+        self.sync_epochs(day_epoch, week_epoch)
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = [0, 0, day_epoch, 0, week_epoch, 0]
+        else:
+            for period in PERIODS:
+                board = self.boards[period]
+                del board[bisect_left(board, self._key(user_id, user, period))]
+
+        user[0] += messages
+        user[1] = (user[1] if user[2] == day_epoch else 0) + messages
+        user[2] = day_epoch
+        user[3] = (user[3] if user[4] == week_epoch else 0) + messages
+        user[4] = week_epoch
+        user[5] += exp_gain
+
+        for period in PERIODS:
+            insort(self.boards[period], self._key(user_id, user, period))
+
+    def top(self, period: str, limit: int) -> List[Tuple[int, int, int]]:
+        return [(user_id, -msgs, -exp) for msgs, exp, user_id in self.boards[period][:limit]]
+
+    def position(self, user_id: int, period: str) -> Optional[int]:
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        return bisect_left(self.boards[period], self._key(user_id, user, period)) + 1
+
+_EMPTY = ChatBoard()
+
+class Leaderboard:
+    """
+    Рейтинги активных чатов в памяти; заполняется из базы при старте (warm).
+    Чаты, которые есть в базе, но не загружены (cold), обслуживает база:
+    serves() для них ложно, а сообщения в них рейтинг в памяти не меняют.
+    """
+
+    def __init__(self):
+        self.chats: Dict[int, ChatBoard] = {}
+        self.cold: Set[int] = set()
+        self.ready = False
+
+    def serves(self, chat_id: int) -> bool:
+        """Можно ли отвечать на топ и позиции чата из памяти"""
+        return self.ready and chat_id not in self.cold
+
+    def load(self, rows):
+        """
+        Заполняет рейтинги строками
+        (chat_id, user_id, messages_all, messages_day, day_epoch, messages_week, week_epoch, experience)
+        """
+        for chat_id, user_id, all_msgs, day_msgs, day_ep, week_msgs, week_ep, exp in rows:
+            board = self.chats.get(chat_id)
+            if board is None:
+                board = self.chats[chat_id] = ChatBoard()
+            board.users[user_id] = [all_msgs, day_msgs, day_ep, week_msgs, week_ep, exp]
+
+    def load_pending(self, chat_id: int, user_id: int, messages: int, messages_day: int, day_epoch: int,
+                     messages_week: int, week_epoch: int, exp: int):
+        """Добавляет к загруженным значениям ещё не записанные в базу приращения"""
+        board = self.chats.get(chat_id)
+        if board is None:
+            board = self.chats[chat_id] = ChatBoard()
+        user = board.users.setdefault(user_id, [0, 0, 0, 0, 0, 0])
+        user[0] += messages
+        user[1], user[2] = merge_epoch(user[1], user[2], messages_day, day_epoch)
+        user[3], user[4] = merge_epoch(user[3], user[4], messages_week, week_epoch)
+        user[5] += exp
+
+    def finish_load(self, day_epoch: int, week_epoch: int, chat_ids: Optional[Iterable[int]] = None):
+        """Сортирует загруженные рейтинги (все или только chat_ids) и включает чтение из памяти"""
+        for chat_id in self.chats if chat_ids is None else chat_ids:
+            board = self.chats.get(chat_id)
+            if board is not None:
+                board.epochs.update(day=day_epoch, week=week_epoch)
+                board.rebuild()
+        self.ready = True
+
+    def mark_cold(self, chat_ids: Iterable[int]):
+        """Чаты, оставленные в базе при загрузке; их рейтинги в памяти удаляются"""
+        for chat_id in chat_ids:
+            self.chats.pop(chat_id, None)
+            self.cold.add(chat_id)
+
+    def forget(self, chat_filter: Callable[[int], bool]):
+        for chat_id in [chat_id for chat_id in self.chats if chat_filter(chat_id)]:
+            del self.chats[chat_id]
+        self.cold = {chat_id for chat_id in self.cold if not chat_filter(chat_id)}
+
+    def _board(self, chat_id: int, day_epoch: int, week_epoch: int) -> ChatBoard:
+        """Рейтинг для чтения; чат без рейтинга получает общий пустой и не запоминается"""
+        board = self.chats.get(chat_id)
+        if board is None:
+            return _EMPTY
+        board.sync_epochs(day_epoch, week_epoch)
+        return board
+
+    def _writable(self, chat_id: int, day_epoch: int, week_epoch: int) -> Optional[ChatBoard]:
+        if chat_id in self.cold:
+            return None
+        board = self.chats.get(chat_id)
+        if board is None:
+            # Чата нет ни в памяти, ни среди cold — в базе его тоже нет, рейтинг начинается с нуля
+            board = self.chats[chat_id] = ChatBoard()
+            board.epochs.update(day=day_epoch, week=week_epoch)
+        return board
+
+    def add_message(self, chat_id: int, user_id: int, exp_gain: int, day_epoch: int, week_epoch: int):
+        board = self._writable(chat_id, day_epoch, week_epoch)
+        if board is not None:
+            board.update(user_id, 1, exp_gain, day_epoch, week_epoch)
+
+    def touch(self, chat_id: int, user_id: int, day_epoch: int, week_epoch: int):
+        """Добавляет пользователя без сообщений (строка chat_stats создана не сообщением)"""
+        board = self._writable(chat_id, day_epoch, week_epoch)
+        if board is not None and user_id not in board.users:
+            board.update(user_id, 0, 0, day_epoch, week_epoch)
+
+    def top(self, chat_id: int, period: str, limit: int, day_epoch: int, week_epoch: int):
+        return self._board(chat_id, day_epoch, week_epoch).top(period, limit)
+
+    def position(self, chat_id: int, user_id: int, period: str, day_epoch: int, week_epoch: int):
+        """(место пользователя, всего участников) или None"""
+        board = self._board(chat_id, day_epoch, week_epoch)
+        place = board.position(user_id, period)
+        return (place, len(board.users)) if place else None
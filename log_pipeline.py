@@ -0,0 +1,122 @@
+"""
+Неблокирующее логирование.
+
+Обработчики логов не пишут в поток вывода из цикла событий: запись кладётся
+в ограниченную очередь (LazyQueueHandler), а форматирует и пишет её фоновый
+поток QueueListener. Если очередь переполнена, запись отбрасывается и учитывается
+в log_stats(), обработка апдейтов при этом не ждёт диск.
+
+Структурные поля передаются через extra (chat_id, user_id, handler, length, latency)
+и дописываются форматтером в конец строки как key=value.
+"""
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Hashable, Optional, Union
+
+from rate_limiter import TOKEN_BUCKET, FloodPolicy, RateLimiter
+
+FIELDS = ("chat_id", "user_id", "handler", "length", "latency")
+
+class StructuredFormatter(logging.Formatter):
+    """Обычная строка лога плюс структурные поля записи в виде key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = []
+        for name in FIELDS:
+            value = getattr(record, name, None)
+            if value is None:
+                continue
+            if name == "latency":
+                fields.append(f"latency={value * 1000:.1f}ms")
+            else:
+                fields.append(f"{name}={value}")
+        return f"{line} {' '.join(fields)}" if fields else line
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: запись уходит в очередь
+    как есть, msg % args вычисляется в потоке слушателя. Поэтому в args
+    следует передавать значения, которые не меняются после вызова логгера.
+    При переполнении очереди запись отбрасывается.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"depth": self.queue.qsize(), "dropped": self.dropped}
+
+_handler: Optional[LazyQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: Union[int, str] = logging.INFO,
+                  fmt: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                  queue_size: int = 10000) -> QueueListener:
+    """
+    Заменяет обработчики корневого логгера очередью с фоновой записью в stderr.
+    Слушатель останавливается (с дозаписью очереди) при выходе из процесса.
+    Повторный вызов ничего не меняет: воркер настраивает лог сам, до сборки приложения.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return _listener
+    log_queue = queue.Queue(maxsize=queue_size)
+    stream = logging.StreamHandler()
+    stream.setFormatter(StructuredFormatter(fmt))
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    _handler = LazyQueueHandler(log_queue)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    # aiogram пишет «Update id=... is handled» на INFO для каждого апдейта в обход
+    # прореживания по чатам; эту запись заменяет структурная запись LoggingMiddleware
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    listener.start()
+    atexit.register(listener.stop)
+    _listener = listener
+    return listener
+
+def log_stats() -> dict:
+    """Глубина очереди и число отброшенных записей"""
+    return _handler.stats() if _handler else {"depth": 0, "dropped": 0}
+
+class ChatLogSampler:
+    """
+    Прореживание записей по чатам: в лог попадает доля sample_rate сообщений,
+    и не больше capacity записей за period секунд на чат, чтобы один
+    флудящий чат не забивал лог (и очередь) остальным.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, capacity: int = 20, period: float = 60):
+        self.sample_rate = sample_rate
+        self.policy = FloodPolicy(TOKEN_BUCKET, capacity, period)
+        self.limiter = RateLimiter(max_period=period)
+        self.sampled_out = 0
+
+    def allow(self, key: Hashable, now: float) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        return self.limiter.allow(key, self.policy, now)
+
+    def stats(self) -> dict:
+        """Сколько записей отсеяно выборкой и лимитом, размер состояния"""
+        return {"sampled_out": self.sampled_out, **self.limiter.stats()}
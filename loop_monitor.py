@@ -0,0 +1,174 @@
+"""
+Контроль задержки цикла событий.
+
+Задача в цикле просыпается каждые interval секунд; насколько позже положенного
+она проснулась — задержка цикла (lag), она пишется в гистограмму bot_loop_lag_seconds.
+Пока цикл занят синхронным кодом, задача не может ни проснуться, ни что-то
+записать, поэтому блокировку ловит отдельный поток-сторож: если отметка задачи
+не обновлялась дольше threshold, он снимает стек главного потока через
+sys._current_frames() и пишет его в лог. Последние блокировки видны владельцу
+бота в команде /status (handlers.admin).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = metrics.histogram(
+    "bot_loop_lag_seconds", "Задержка цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_STALLS = metrics.counter("bot_loop_stalls_total", "Блокировки цикла событий дольше порога")
+
+_ASYNCIO_EVENTS = os.path.join("asyncio", "events.py")
+
+class Stall:
+    """Одна блокировка цикла: когда началась, сколько длилась, чем был занят цикл"""
+
+    __slots__ = ("started", "lag", "task", "stack")
+
+    def __init__(self, started: float, task: Optional[str], stack: List[str]):
+        self.started = started
+        self.lag: Optional[float] = None
+        self.task = task
+        self.stack = stack
+
+def _coroutine_stack(frame) -> Tuple[Optional[str], List[str]]:
+    """
+    Стек без кадров самого цикла событий: от Handle._run до блокирующего вызова,
+    и имя внешней корутины (задачи). Если Handle._run в стеке нет, цикл не выполняет
+    колбэк (ждёт в selector) — возвращается (None, []).
+    """
+    summary = traceback.extract_stack(frame)
+    start = None
+    for index, entry in enumerate(summary):
+        if entry.filename.endswith(_ASYNCIO_EVENTS):
+            start = index + 1
+    if start is None or start >= len(summary):
+        return None, []
+    return summary[start].name, traceback.format_list(summary[start:])
+
+class LoopMonitor:
+    def __init__(self):
+        self.interval = 0.1
+        self.threshold = 0.1
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalls: Deque[Stall] = deque(maxlen=20)
+        # Последние задержки для перцентилей в команде /status (около минуты при interval 0.1)
+        self.recent: Deque[float] = deque(maxlen=600)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # Отметка задачи и номер такта; сторож снимает не больше одного стека за такт.
+        # Под _lock такт сменяется и сторож фиксирует снятый стек
+        self._heartbeat = time.monotonic()
+        self._beat = 0
+        self._captured_beat = -1
+        self._lock = threading.Lock()
+
+    def configure(self, interval: float = 0.1, threshold_ms: float = 100):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+
+    def start(self):
+        """Запускается из работающего цикла событий (on_startup)"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watchdog = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            # Такт сменяется сразу после пробуждения: сторож больше не считает цикл заблокированным
+            with self._lock:
+                captured = self._captured_beat == self._beat
+                self._heartbeat = time.monotonic()
+                self._beat += 1
+            LOOP_LAG.observe(lag)
+            self.recent.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                self._record(lag, captured)
+
+    def _record(self, lag: float, captured: bool):
+        LOOP_STALLS.inc()
+        self.stall_count += 1
+        if captured and self.stalls:
+            # Стек уже снят сторожем во время этой блокировки
+            self.stalls[-1].lag = lag
+            return
+        stall = Stall(time.time() - lag, None, [])
+        stall.lag = lag
+        self.stalls.append(stall)
+        logger.warning("Цикл событий был заблокирован %.0f мс (стек не снят: блокировка короче проверки)",
+                       lag * 1000)
+
+    def _watch(self):
+        check = max(self.threshold / 2, 0.01)
+        while not self._stopped.wait(check):
+            beat = self._beat
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.threshold or self._captured_beat == beat:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            name, stack = _coroutine_stack(frame)
+            del frame
+            with self._lock:
+                # Цикл проснулся, пока снимался стек, — это уже не стек блокировки
+                if self._beat != beat or not stack:
+                    continue
+                self._captured_beat = beat
+                self.stalls.append(Stall(time.time() - blocked, name, stack))
+            logger.warning("Цикл событий заблокирован уже %.0f мс, задача %s:\n%s",
+                           blocked * 1000, name, "".join(stack).rstrip())
+
+    def percentile(self, share: float) -> float:
+        values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * share))]
+
+    def stats(self) -> dict:
+        return {
+            "max_lag": self.max_lag,
+            "stalls": self.stall_count,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+        }
+
+monitor = LoopMonitor()
@@ -0,0 +1,246 @@
+"""
+Метрики процесса в формате Prometheus.
+
+Счётчики, gauge и гистограммы с фиксированными границами хранятся в памяти
+процесса; запись — несколько операций без блокировок и выделения памяти
+(дочерняя метрика с нужными метками берётся из словаря или заранее).
+Статистика компонентов (stats() антифлуда, очереди исходящих, кэшей) не дублируется,
+а читается в момент запроса /metrics через register_stats.
+
+Отдаётся локальным HTTP сервером: start_metrics_server(host, port), путь /metrics.
+"""
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+# Границы по умолчанию, сек.: от половины миллисекунды до 10 секунд
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # Последняя ячейка — значения больше всех границ (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class _Metric:
+    """Семейство метрик одного имени; дочерние метрики — по значениям меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, Any] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _labels_of(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, map(str, values)))
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self._children.items()):
+            yield self.name, self._labels_of(values), child.value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self._children.items()):
+            labels = self._labels_of(values)
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                total += count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                yield f"{self.name}_bucket", {**labels, "le": le}, total
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, total
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # Функции, возвращающие (имя, тип, описание, сэмплы) в момент запроса
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом или метками")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4"""
+        families = [
+            (metric.name, metric.kind, metric.documentation, metric.samples())
+            for metric in self._metrics.values()
+        ]
+        for collector in self._collectors:
+            families.extend(collector())
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+def register_stats(prefix: str, documentation: str, stats: Callable[[], Dict[str, Any]],
+                   registry: Registry = REGISTRY):
+    """
+    Выставляет числовые поля словаря stats() как gauge prefix_<поле>.
+    Списки становятся одной метрикой с меткой index, остальные значения пропускаются.
+    """
+    def collect():
+        families = []
+        for key, value in stats().items():
+            if isinstance(value, bool) or value is None:
+                continue
+            if isinstance(value, (int, float)):
+                samples = [(f"{prefix}_{key}", {}, value)]
+            elif isinstance(value, (list, tuple)):
+                samples = [(f"{prefix}_{key}", {"index": str(index)}, item) for index, item in enumerate(value)]
+            else:
+                continue
+            families.append((f"{prefix}_{key}", "gauge", f"{documentation}: {key}", samples))
+        return families
+
+    registry.add_collector(collect)
+
+def timed(metric: Histogram, errors: Optional[Counter] = None):
+    """
+    Декоратор корутины: время выполнения в metric с меткой — именем функции,
+    исключения считаются в errors. Дочерние метрики создаются один раз при декорировании.
+    """
+    def decorator(func):
+        observe = metric.labels(func.__name__).observe
+        failed = errors.labels(func.__name__) if errors is not None else None
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if failed is not None:
+                    failed.inc()
+                raise
+            finally:
+                observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    registry: Registry = request.app["registry"]
+    return web.Response(body=registry.render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Запускает HTTP сервер с /metrics; остановка — await runner.cleanup()"""
+    app = web.Application()
+    app["registry"] = registry
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
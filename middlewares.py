@@ -1,16 +1,32 @@
 import asyncio
 import logging
-from typing import Callable, Dict, Any, Awaitable
+import time
+from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import Message, Update
 from database import get_chat_settings
+from log_pipeline import ChatLogSampler
+import metrics
+from tracing import span, tracer
+from rate_limiter import FloodPolicy, RateLimiter
+from handlers.commands import parse_command
 
 logger = logging.getLogger(__name__)
 
+UPDATES = metrics.counter("bot_updates_total", "Принятые апдейты", ["type"])
+UPDATE_SECONDS = metrics.histogram("bot_update_seconds", "Полное время обработки апдейта", ["type"])
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Время обработчиков сообщений", ["router", "handler"])
+HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "Исключения в обработчиках сообщений", ["router", "handler"])
+
 class AntifloodMiddleware(BaseMiddleware):
-    def __init__(self, default_delay: int = 2):
-        self.default_delay = default_delay
-        self.user_last_message = {}
+    """
+    Ограничивает частоту сообщений пользователя в чате по политике
+    из настроек чата (flood_mode, flood_capacity, flood_period).
+    Сообщения сверх лимита не обрабатываются.
+    """
+
+    def __init__(self, max_period: float = 300):
+        self.limiter = RateLimiter(max_period=max_period)
 
     async def __call__(
         self,
@@ -22,23 +38,166 @@ class AntifloodMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         settings = await get_chat_settings(event.chat.id)
-        if not settings[1]:
+        if not settings.antiflood_enabled:
             return await handler(event, data)
 
-        key = (event.chat.id, event.from_user.id)
+        policy = FloodPolicy(settings.flood_mode, settings.flood_capacity, settings.flood_period)
         now = asyncio.get_event_loop().time()
-        last = self.user_last_message.get(key, 0)
-        if now - last < self.default_delay:
+        if not self.limiter.allow((event.chat.id, event.from_user.id), policy, now):
             return
-        self.user_last_message[key] = now
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        """Размер состояния, число вытесненных записей и отклонённых сообщений"""
+        return self.limiter.stats()
+
+class CommandParserMiddleware(BaseMiddleware):
+    """
+    Разбирает текст сообщения один раз за апдейт и кладёт результат
+    в data["parsed_command"]: (ключ команды, аргументы) или None.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        data["parsed_command"] = (
+            parse_command(event.text) if event.text else None
+        )
         return await handler(event, data)
 
 class LoggingMiddleware(BaseMiddleware):
+    """
+    Одна структурная запись на обработанное сообщение: chat_id, user_id,
+    длина текста, обработчик и время обработки. Записи по каждому чату
+    прореживаются (ChatLogSampler); текст сообщения пишется только на уровне DEBUG.
+    """
+
+    def __init__(self, sampler: Optional[ChatLogSampler] = None):
+        self.sampler = sampler or ChatLogSampler()
+
     async def __call__(
         self,
         handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
         event: Message,
         data: Dict[str, Any]
     ) -> Any:
-        logger.info(f"Получено сообщение от {event.from_user.id} в чате {event.chat.id}: {event.text}")
-        return await handler(event, data)
\ No newline at end of file
+        if not logger.isEnabledFor(logging.INFO):
+            return await handler(event, data)
+
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency = time.perf_counter() - start
+            if self.sampler.allow(event.chat.id, start):
+                parsed = data.get("parsed_command")
+                fields = {
+                    "chat_id": event.chat.id,
+                    "user_id": event.from_user.id if event.from_user else None,
+                    "handler": parsed[0] if parsed else data["handler"].callback.__name__,
+                    "length": len(event.text) if event.text else 0,
+                    "latency": latency,
+                }
+                logger.info("Сообщение обработано", extra=fields)
+                if event.text and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Текст сообщения: %s", event.text, extra=fields)
+
+    def stats(self) -> dict:
+        return self.sampler.stats()
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware dp.update: число апдейтов и полное время обработки по типу"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        event_type = event.event_type
+        UPDATES.labels(event_type).inc()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_SECONDS.labels(event_type).observe(time.perf_counter() - start)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время обработчика сообщения или callback. Метка router — модуль обработчика,
+    handler — ключ команды для команд или имя функции для остальных.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        parsed = data.get("parsed_command")
+        labels = (callback.__module__, parsed[0] if parsed else callback.__name__)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(*labels).observe(time.perf_counter() - start)
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware dp.update: по выборке открывает трассу апдейта
+    (tracing.tracer) с корневым спаном на всю обработку.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = tracer.begin(event.update_id)
+        if token is None:
+            return await handler(event, data)
+        try:
+            with span(f"update {event.event_type}", "update", update_id=event.update_id):
+                return await handler(event, data)
+        finally:
+            tracer.finish(token)
+
+class TracedMiddleware(BaseMiddleware):
+    """Спан вокруг другого middleware (вместе со всем, что он вызывает дальше)"""
+
+    def __init__(self, middleware: BaseMiddleware):
+        self.middleware = middleware
+        self.name = type(middleware).__name__
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        with span(self.name, "middleware"):
+            return await self.middleware(handler, event, data)
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Спан обработчика (сообщения или callback): модуль роутера и ключ команды или имя функции"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        parsed = data.get("parsed_command")
+        name = parsed[0] if parsed else callback.__name__
+        chat = data.get("event_chat")
+        with span(f"{callback.__module__}.{name}", "handler", chat_id=chat.id if chat else None):
+            return await handler(event, data)
@@ -0,0 +1,285 @@
+import abc
+import argparse
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import aiosqlite
+from periods import day_epoch, week_epoch
+
+logger = logging.getLogger(__name__)
+
+class Step(abc.ABC):
+    """Один шаг миграции. Каждый шаг выполняется и коммитится отдельно"""
+
+    table: Optional[str] = None
+
+    async def estimate(self, db) -> int:
+        """Оценка количества затрагиваемых строк (для dry-run)"""
+        return 0
+
+    @abc.abstractmethod
+    async def apply(self, db):
+        """Выполняет шаг и коммитит его"""
+
+class Sql(Step):
+    """Произвольный DDL/DML; если указана table, оценкой служит размер таблицы"""
+
+    def __init__(self, sql: str, table: Optional[str] = None):
+        self.sql = sql
+        self.table = table
+
+    async def estimate(self, db) -> int:
+        if not self.table or not await _table_exists(db, self.table):
+            return 0
+        return await _estimate_rows(db, self.table)
+
+    async def apply(self, db):
+        await db.execute(self.sql)
+        await db.commit()
+
+class AddColumn(Step):
+    """ALTER TABLE ADD COLUMN, безопасный к повторному запуску"""
+
+    def __init__(self, table: str, column: str, definition: str):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    async def apply(self, db):
+        cursor = await db.execute(f"PRAGMA table_info({self.table})")
+        if any(row[1] == self.column for row in await cursor.fetchall()):
+            return
+        await db.execute(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}")
+        await db.commit()
+
+class Backfill(Step):
+    """
+    Массовое обновление, выполняемое порциями по rowid.
+    Между порциями транзакция коммитится и управление отдаётся циклу событий,
+    чтобы запись в базу не блокировалась на всё время миграции.
+    В sql последними должны идти два плейсхолдера: rowid > ? AND rowid <= ?,
+    перед ними — значения из params(), вычисляемые в момент применения.
+    Обновление должно быть идемпотентным: прерванный шаг повторяется целиком.
+    """
+
+    def __init__(self, table: str, sql: str, params: Optional[Callable[[], tuple]] = None,
+                 chunk_size: int = 5000):
+        self.table = table
+        self.sql = sql
+        self.params = params
+        self.chunk_size = chunk_size
+
+    async def estimate(self, db) -> int:
+        if not await _table_exists(db, self.table):
+            return 0
+        return await _estimate_rows(db, self.table)
+
+    async def apply(self, db):
+        cursor = await db.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {self.table}")
+        low, high = await cursor.fetchone()
+        if low is None:
+            return
+        params = self.params() if self.params else ()
+        start = low - 1
+        while start < high:
+            end = start + self.chunk_size
+            await db.execute(self.sql, (*params, start, end))
+            await db.commit()
+            start = end
+            await asyncio.sleep(0)
+
+# Миграции применяются строго по возрастанию версии. Уже выпущенные версии не меняются,
+# любое изменение схемы оформляется новой миграцией в конце списка.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "Базовая схема", [
+        # Пользователи (кэш)
+        Sql('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        '''),
+        # Статистика по чатам
+        Sql('''
+            CREATE TABLE IF NOT EXISTS chat_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER,
+                user_id INTEGER,
+                messages_day INTEGER DEFAULT 0,
+                messages_week INTEGER DEFAULT 0,
+                messages_all INTEGER DEFAULT 0,
+                experience INTEGER DEFAULT 0,
+                warns INTEGER DEFAULT 0,
+                custom_rank INTEGER,
+                hidden_rank INTEGER DEFAULT 0,
+                last_message_time TIMESTAMP,
+                rank_updated_at TIMESTAMP,
+                UNIQUE(chat_id, user_id)
+            )
+        '''),
+        # Настройки чата
+        Sql('''
+            CREATE TABLE IF NOT EXISTS chat_settings (
+                chat_id INTEGER PRIMARY KEY,
+                welcome_enabled INTEGER DEFAULT 1,
+                antiflood_enabled INTEGER DEFAULT 1,
+                mute_duration INTEGER DEFAULT 60,
+                ban_duration INTEGER DEFAULT 3600
+            )
+        '''),
+        # Логи модерации
+        Sql('''
+            CREATE TABLE IF NOT EXISTS moderation_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER,
+                admin_id INTEGER,
+                action TEXT,
+                target_id INTEGER,
+                reason TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        '''),
+        # Ежедневная статистика (для точного подсчёта за 30 дней)
+        Sql('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER,
+                user_id INTEGER,
+                date TEXT,
+                messages INTEGER DEFAULT 0,
+                UNIQUE(chat_id, user_id, date)
+            )
+        '''),
+    ]),
+    (2, "Индексы под топы, 30-дневную сумму и логи модерации", [
+        # Индексы дневного и недельного топа создаёт миграция 3, уже с эпохами
+        Sql('''
+            CREATE INDEX IF NOT EXISTS idx_chat_stats_top_all
+            ON chat_stats (chat_id, messages_all DESC, experience DESC, user_id)
+        ''', table="chat_stats"),
+        Sql('''
+            CREATE INDEX IF NOT EXISTS idx_daily_stats_user_date
+            ON daily_stats (chat_id, user_id, date, messages)
+        ''', table="daily_stats"),
+        Sql('''
+            CREATE INDEX IF NOT EXISTS idx_moderation_logs_chat_time
+            ON moderation_logs (chat_id, timestamp)
+        ''', table="moderation_logs"),
+    ]),
+    (3, "Эпохи дневных и недельных счётчиков вместо ночного обнуления", [
+        AddColumn("chat_stats", "day_epoch", "INTEGER DEFAULT 0"),
+        AddColumn("chat_stats", "week_epoch", "INTEGER DEFAULT 0"),
+        # До миграции счётчики обнулялись планировщиком, значит сейчас они относятся к текущим эпохам
+        Backfill("chat_stats", '''
+            UPDATE chat_stats SET day_epoch = ?, week_epoch = ?
+            WHERE day_epoch = 0 AND rowid > ? AND rowid <= ?
+        ''', params=lambda: (day_epoch(), week_epoch())),
+        *[
+            Sql(f'''
+                CREATE INDEX IF NOT EXISTS idx_chat_stats_top_{period}_epoch
+                ON chat_stats (chat_id, {period}_epoch, messages_{period} DESC, experience DESC, user_id)
+            ''', table="chat_stats")
+            for period in ('day', 'week')
+        ],
+        # Пользователи без сообщений за период попадают в топ в порядке опыта
+        Sql('''
+            CREATE INDEX IF NOT EXISTS idx_chat_stats_experience
+            ON chat_stats (chat_id, experience DESC, user_id)
+        ''', table="chat_stats"),
+    ]),
+    (4, "Политика антифлуда в настройках чата", [
+        AddColumn("chat_settings", "flood_mode", "TEXT DEFAULT 'bucket'"),
+        AddColumn("chat_settings", "flood_capacity", "INTEGER DEFAULT 5"),
+        AddColumn("chat_settings", "flood_period", "INTEGER DEFAULT 10"),
+    ]),
+]
+
+async def _table_exists(db, table: str) -> bool:
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return await cursor.fetchone() is not None
+
+async def _estimate_rows(db, table: str) -> int:
+    """Быстрая оценка размера таблицы по диапазону rowid, без полного COUNT(*)"""
+    cursor = await db.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}")
+    low, high = await cursor.fetchone()
+    return 0 if low is None else high - low + 1
+
+async def get_schema_version(db, dry_run: bool = False) -> int:
+    """Текущая версия схемы; при dry_run таблица schema_version не создаётся"""
+    if dry_run and not await _table_exists(db, "schema_version"):
+        return 0
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.commit()
+    cursor = await db.execute("SELECT MAX(version) FROM schema_version")
+    return (await cursor.fetchone())[0] or 0
+
+async def run_migrations(db, dry_run: bool = False) -> List[Tuple[int, str, int]]:
+    """
+    Применяет недостающие миграции.
+    Возвращает список (версия, описание, оценка затронутых строк);
+    при dry_run ничего не меняет, только считает.
+    """
+    current = await get_schema_version(db, dry_run)
+    report = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        estimated = 0
+        for step in steps:
+            estimated += await step.estimate(db)
+        report.append((version, description, estimated))
+        if dry_run:
+            logger.info(f"[dry-run] Миграция {version} «{description}»: ~{estimated} строк")
+            continue
+
+        logger.info(f"Применяется миграция {version} «{description}» (~{estimated} строк)")
+        for step in steps:
+            await step.apply(db)
+        await db.execute(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description)
+        )
+        await db.commit()
+    return report
+
+async def migrate_files(paths: List[str], dry_run: bool = False) -> List[Tuple[str, int, List[Tuple[int, str, int]]]]:
+    """
+    Применяет миграции к файлам по очереди, каждый через отдельное соединение.
+    Возвращает (путь, версия до запуска, отчёт run_migrations) для каждого файла.
+    """
+    results = []
+    for path in paths:
+        async with aiosqlite.connect(path) as db:
+            version = await get_schema_version(db, dry_run)
+            report = await run_migrations(db, dry_run=dry_run)
+        results.append((path, version, report))
+    return results
+
+async def _main():
+    from database import DB_PATH, db_paths
+
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет сделано")
+    args = parser.parse_args()
+
+    for path, version, report in await migrate_files(db_paths(args.db), args.dry_run):
+        print(f"{path}: текущая версия схемы {version}")
+        for version, description, estimated in report:
+            print(f"  {version}: {description} — ~{estimated} строк")
+        if not report:
+            print("  Схема актуальна")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (BanChatMember, DeleteMessage, EditMessageCaption, EditMessageReplyMarkup,
+                             EditMessageText, RestrictChatMember, UnbanChatMember)
+from cache import ExpiringDict
+from rate_limiter import FloodPolicy, TokenBucket, TOKEN_BUCKET
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньшее значение отправляется раньше
+PRIORITY_MODERATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_WELCOME = 2
+PRIORITIES = (PRIORITY_MODERATION, PRIORITY_DEFAULT, PRIORITY_WELCOME)
+
+_MODERATION_METHODS = (RestrictChatMember, BanChatMember, UnbanChatMember, DeleteMessage)
+# Повтор этих запросов ничего не меняет, поэтому одинаковые ожидающие объединяются.
+# Отправки сообщений не объединяются: два «топ» подряд — два ответа
+_IDEMPOTENT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup) + _MODERATION_METHODS
+
+_priority: ContextVar[Optional[int]] = ContextVar("send_priority", default=None)
+
+@contextmanager
+def send_priority(priority: int):
+    """Задаёт полосу для запросов, отправленных внутри блока"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class _Request:
+    __slots__ = ("make_request", "bot", "method", "chat_id", "priority", "key", "future", "enqueued", "attempts")
+
+    def __init__(self, make_request, bot, method, chat_id: int, priority: int, key, future, enqueued: float):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.key = key
+        self.future = future
+        self.enqueued = enqueued
+        self.attempts = 0
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Очередь исходящих запросов к Telegram API (middleware сессии бота).
+
+    Запросы к чатам (отправка, правка, модерация) проходят через полосы
+    приоритета; внутри полосы чаты обслуживаются по кругу, чтобы один
+    шумный чат не задерживал остальные. Ограничения: global_rate запросов
+    в секунду на бота и chat_rate за chat_period секунд на группу
+    (модерация — ограничения, баны, удаления — лимит группы не тратит и не ждёт).
+    На 429 чат ставится на паузу retry_after и запрос повторяется.
+    Одинаковые ожидающие правки, удаления и ограничения объединяются в один запрос.
+    Запросы без chat_id и чтения (get*) отправляются сразу.
+    clock — источник времени для лимитов и пауз (монотонные секунды).
+    """
+
+    def __init__(self, global_rate: int = 30, chat_rate: int = 20, chat_period: int = 60,
+                 max_retries: int = 3, clock: Callable[[], float] = time.monotonic):
+        self.global_policy = FloodPolicy(TOKEN_BUCKET, global_rate, 1)
+        self.chat_policy = FloodPolicy(TOKEN_BUCKET, chat_rate, chat_period)
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global: Optional[TokenBucket] = None
+        self._chats = ExpiringDict(ttl=2 * chat_period)
+        self._paused: Dict[int, float] = {}
+        # Полоса: chat_id -> очередь запросов; порядок ключей задаёт очередь обхода чатов
+        self._lanes: List["OrderedDict[int, Deque[_Request]]"] = [OrderedDict() for _ in PRIORITIES]
+        self._waiting: Dict[Any, _Request] = {}
+        self._inflight: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def set_global_rate(self, rate: float):
+        """Меняет лимит запросов в секунду на бота (доля воркера в многопроцессном режиме)"""
+        self.global_policy = FloodPolicy(TOKEN_BUCKET, rate, 1)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int) or type(method).__name__.startswith("Get"):
+            return await make_request(bot, method)
+
+        loop = asyncio.get_running_loop()
+        self._start(loop)
+        key = repr(method) if isinstance(method, _IDEMPOTENT_METHODS) else None
+        if key is not None:
+            queued = self._waiting.get(key)
+            if queued is not None:
+                self.coalesced += 1
+                return await asyncio.shield(queued.future)
+
+        priority = _priority.get()
+        if priority is None:
+            priority = PRIORITY_MODERATION if isinstance(method, _MODERATION_METHODS) else PRIORITY_DEFAULT
+        request = _Request(make_request, bot, method, chat_id, priority, key, loop.create_future(), self.clock())
+        if key is not None:
+            self._waiting[key] = request
+        self._enqueue(request)
+        return await asyncio.shield(request.future)
+
+    def _start(self, loop):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._global = TokenBucket(self.global_policy.capacity, self.clock())
+            self._worker = loop.create_task(self._run())
+
+    def _enqueue(self, request: _Request, front: bool = False):
+        lane = self._lanes[request.priority]
+        queue = lane.get(request.chat_id)
+        if queue is None:
+            queue = lane[request.chat_id] = deque()
+        if front:
+            queue.appendleft(request)
+        else:
+            queue.append(request)
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id, now)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_policy.capacity, now)
+            self._chats.set(chat_id, bucket, now)
+        return bucket
+
+    def _chat_delay(self, chat_id: int, now: float, limited: bool) -> float:
+        paused_until = self._paused.get(chat_id)
+        if paused_until is not None:
+            if paused_until > now:
+                return paused_until - now
+            del self._paused[chat_id]
+        # Ограничение ~20 сообщений в минуту действует для групп (отрицательные id)
+        # и только на сообщения: модерация во время рейда не ждёт за ними
+        if chat_id > 0 or not limited:
+            return 0.0
+        return self._chat_bucket(chat_id, now).delay(self.chat_policy, now)
+
+    def _next(self, now: float):
+        """Следующий запрос, который можно отправить сейчас, или время ожидания (None — очередь пуста)"""
+        delay = self._global.delay(self.global_policy, now)
+        if delay:
+            return None, delay
+        wait = None
+        for lane in self._lanes:
+            for chat_id in list(lane):
+                queue = lane[chat_id]
+                limited = not isinstance(queue[0].method, _MODERATION_METHODS)
+                chat_delay = self._chat_delay(chat_id, now, limited)
+                if chat_delay:
+                    wait = chat_delay if wait is None else min(wait, chat_delay)
+                    continue
+                request = queue.popleft()
+                if queue:
+                    lane.move_to_end(chat_id)
+                else:
+                    del lane[chat_id]
+                self._global.allow(self.global_policy, now)
+                if chat_id < 0 and limited:
+                    self._chat_bucket(chat_id, now).allow(self.chat_policy, now)
+                return request, 0.0
+        return None, wait
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, wait = self._next(self.clock())
+            if request is not None:
+                task = loop.create_task(self._send(request))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, request: _Request):
+        waited = self.clock() - request.enqueued
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            request.attempts += 1
+            if request.attempts <= self.max_retries:
+                self.retries += 1
+                self._paused[request.chat_id] = self.clock() + e.retry_after
+                logger.warning("429 в чате %s: пауза %s сек.", request.chat_id, e.retry_after)
+                self._enqueue(request, front=True)
+                return
+            self._finish(request, waited, error=e)
+        except Exception as e:
+            self._finish(request, waited, error=e)
+        else:
+            self._finish(request, waited, result=result)
+
+    def _finish(self, request: _Request, waited: float, result=None, error: Optional[BaseException] = None):
+        if request.key is not None and self._waiting.get(request.key) is request:
+            del self._waiting[request.key]
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if error is not None:
+            self.failed += 1
+            if not request.future.done():
+                request.future.set_exception(error)
+        else:
+            self.sent += 1
+            if not request.future.done():
+                request.future.set_result(result)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for lane in self._lanes for queue in lane.values())
+
+    def stats(self) -> dict:
+        completed = self.sent + self.failed
+        return {
+            "depth": self.depth,
+            "depth_by_priority": [sum(len(queue) for queue in lane.values()) for lane in self._lanes],
+            "inflight": len(self._inflight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "wait_avg": self.wait_total / completed if completed else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    async def close(self, timeout: float = 5):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает обработчик"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.depth or self._inflight) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for lane in self._lanes:
+            for queue in lane.values():
+                for request in queue:
+                    if not request.future.done():
+                        request.future.cancel()
+            lane.clear()
+        self._waiting.clear()
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """
+    Спан вызова Telegram API в трассе апдейта. Регистрируется раньше
+    OutboundScheduler, поэтому в длительность входит и ожидание в очереди.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        with span(method.__api_method__, "api", chat_id=getattr(method, "chat_id", None)):
+            return await make_request(bot, method)
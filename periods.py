@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Optional
+import pytz
+from config import Config
+
+config = Config()
+tz = pytz.timezone(config.TIMEZONE)
+
+def day_epoch(now: Optional[datetime] = None) -> int:
+    """Номер текущих суток в часовом поясе бота"""
+    now = now or datetime.now(tz)
+    return now.toordinal()
+
+def week_epoch(now: Optional[datetime] = None) -> int:
+    """Номер текущей недели: номер суток её понедельника"""
+    now = now or datetime.now(tz)
+    return now.toordinal() - now.weekday()
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+def calculate_hidden_rank(all_msgs: int, day_msgs: int, week_msgs: int, month_msgs: int) -> int:
+    """Скрытый ранг по счётчикам сообщений"""
+    new_rank = 0
+
+    if all_msgs >= 1:
+        new_rank = 1
+    if all_msgs >= 1000:
+        new_rank = 2
+    if day_msgs >= 5000:
+        new_rank = 3
+    if week_msgs >= 15000:
+        new_rank = 4
+    if week_msgs >= 35000:
+        new_rank = 5
+    if month_msgs >= 100000:
+        new_rank = 6
+
+    return new_rank
+
+class RankState:
+    """
+    Счётчики пользователя, нужные для скрытого ранга.
+    Месячная сумма поддерживается скользящим окном по датам:
+    новые сообщения прибавляются, дни старше окна вычитаются при смене даты.
+    """
+
+    __slots__ = (
+        "messages_all", "messages_day", "day_epoch", "messages_week", "week_epoch",
+        "days", "month", "cutoff", "hidden_rank",
+    )
+
+    def __init__(self, messages_all: int, messages_day: int, day_epoch: int,
+                 messages_week: int, week_epoch: int, days: Dict[str, int],
+                 cutoff: str, hidden_rank: int):
+        self.messages_all = messages_all
+        self.messages_day = messages_day
+        self.day_epoch = day_epoch
+        self.messages_week = messages_week
+        self.week_epoch = week_epoch
+        self.days = {date: count for date, count in days.items() if date >= cutoff}
+        self.month = sum(self.days.values())
+        self.cutoff = cutoff
+        self.hidden_rank = hidden_rank
+
+    def add_message(self, date: str, day_epoch: int, week_epoch: int):
+        self.messages_all += 1
+        if self.day_epoch == day_epoch:
+            self.messages_day += 1
+        else:
+            self.messages_day, self.day_epoch = 1, day_epoch
+        if self.week_epoch == week_epoch:
+            self.messages_week += 1
+        else:
+            self.messages_week, self.week_epoch = 1, week_epoch
+        self.days[date] = self.days.get(date, 0) + 1
+        self.month += 1
+
+    def rank(self, cutoff: str, day_epoch: int, week_epoch: int) -> int:
+        """Текущий скрытый ранг; дни раньше cutoff выпадают из месячной суммы"""
+        if cutoff != self.cutoff:
+            for date in [date for date in self.days if date < cutoff]:
+                self.month -= self.days.pop(date)
+            self.cutoff = cutoff
+        return calculate_hidden_rank(
+            self.messages_all,
+            self.messages_day if self.day_epoch == day_epoch else 0,
+            self.messages_week if self.week_epoch == week_epoch else 0,
+            self.month,
+        )
+
+class RankTracker:
+    """Ограниченный по размеру LRU-кэш состояний RankState по (chat_id, user_id)"""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._states: "OrderedDict[Tuple[int, int], RankState]" = OrderedDict()
+
+    def get(self, chat_id: int, user_id: int) -> Optional[RankState]:
+        state = self._states.get((chat_id, user_id))
+        if state is not None:
+            self._states.move_to_end((chat_id, user_id))
+        return state
+
+    def put(self, chat_id: int, user_id: int, state: RankState):
+        self._states[(chat_id, user_id)] = state
+        self._states.move_to_end((chat_id, user_id))
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+    def add_message(self, chat_id: int, user_id: int, date: str, day_epoch: int, week_epoch: int):
+        """Учитывает сообщение, если состояние пользователя уже загружено"""
+        state = self._states.get((chat_id, user_id))
+        if state is not None:
+            state.add_message(date, day_epoch, week_epoch)
+
+    def forget(self, chat_filter: Callable[[int], bool]):
+        """Удаляет состояния чатов, для которых chat_filter(chat_id) истинно"""
+        for key in [key for key in self._states if chat_filter(key[0])]:
+            del self._states[key]
+
+    def __len__(self) -> int:
+        return len(self._states)
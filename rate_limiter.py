@@ -0,0 +1,95 @@
+from typing import Hashable, NamedTuple
+from cache import ExpiringDict
+
+TOKEN_BUCKET = "bucket"
+SLIDING_WINDOW = "window"
+MODES = (TOKEN_BUCKET, SLIDING_WINDOW)
+
+class FloodPolicy(NamedTuple):
+    """Не больше capacity сообщений за period секунд"""
+    mode: str = TOKEN_BUCKET
+    capacity: int = 5
+    period: int = 10
+
+class TokenBucket:
+    """
+    Ведро на capacity токенов, пополняется со скоростью capacity/period в секунду.
+    Разрешает всплеск до capacity сообщений и затем ровный поток.
+    """
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: int, now: float):
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def allow(self, policy: FloodPolicy, now: float) -> bool:
+        tokens = self.tokens + (now - self.updated) * policy.capacity / policy.period
+        self.tokens = tokens if tokens < policy.capacity else float(policy.capacity)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, policy: FloodPolicy, now: float) -> float:
+        """Через сколько секунд появится токен (0 — уже есть); токены не расходуются"""
+        tokens = self.tokens + (now - self.updated) * policy.capacity / policy.period
+        if tokens >= 1:
+            return 0.0
+        return (1 - tokens) * policy.period / policy.capacity
+
+class SlidingWindowCounter:
+    """
+    Скользящее окно по двум счётчикам: текущее и предыдущее окно длиной period.
+    Число сообщений за последние period секунд оценивается как
+    current + previous * (доля предыдущего окна, ещё попадающая в интервал).
+    """
+
+    __slots__ = ("window", "current", "previous")
+
+    def __init__(self, capacity: int, now: float):
+        self.window = 0
+        self.current = 0
+        self.previous = 0
+
+    def allow(self, policy: FloodPolicy, now: float) -> bool:
+        window = int(now // policy.period)
+        if window != self.window:
+            self.previous = self.current if window == self.window + 1 else 0
+            self.current = 0
+            self.window = window
+        elapsed = now / policy.period - window
+        if self.current + self.previous * (1 - elapsed) >= policy.capacity:
+            return False
+        self.current += 1
+        return True
+
+_ALGORITHMS = {TOKEN_BUCKET: TokenBucket, SLIDING_WINDOW: SlidingWindowCounter}
+
+class RateLimiter:
+    """
+    Решения о пропуске сообщений по ключу (обычно (chat_id, user_id)).
+    На каждый ключ хранится один объект фиксированного размера; ключи,
+    молчавшие дольше двух max_period, забываются (их состояние всё равно
+    равно начальному: ведро полное, окна пустые).
+    """
+
+    def __init__(self, max_period: float = 300):
+        self.max_period = max_period
+        self.denied = 0
+        self._states = ExpiringDict(ttl=2 * max_period)
+
+    def allow(self, key: Hashable, policy: FloodPolicy, now: float) -> bool:
+        algorithm = _ALGORITHMS[policy.mode]
+        state = self._states.get(key, now)
+        if type(state) is not algorithm:
+            state = algorithm(policy.capacity, now)
+        allowed = state.allow(policy, now)
+        self._states.set(key, state, now)
+        if not allowed:
+            self.denied += 1
+        return allowed
+
+    def stats(self) -> dict:
+        return {"denied": self.denied, **self._states.stats()}
@@ -1,7 +1,7 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import pytz
-from database import reset_day_stats, reset_week_stats
+from database import flush_messages
 from config import Config
 
 config = Config()
@@ -9,8 +9,12 @@ tz = pytz.timezone(config.TIMEZONE)
 
 scheduler = AsyncIOScheduler(timezone=tz)
 
-scheduler.add_job(reset_day_stats, CronTrigger(hour=0, minute=0, timezone=tz))
-scheduler.add_job(reset_week_stats, CronTrigger(day_of_week='mon', hour=0, minute=0, timezone=tz))
+scheduler.add_job(flush_messages, IntervalTrigger(seconds=config.FLUSH_INTERVAL), max_instances=1, coalesce=True)
 
 def start_scheduler():
-    scheduler.start()
\ No newline at end of file
+    scheduler.start()
+
+def stop_scheduler():
+    """Останавливается до close_db: задача сброса не должна стартовать на закрытых пулах"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
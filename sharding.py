@@ -0,0 +1,532 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import traceback
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config import Config
+from log_pipeline import setup_logging
+from outbound import OutboundScheduler
+from webhook import check_webhook_secret, register_webhook
+
+logger = logging.getLogger(__name__)
+
+def shard_of(chat_id: int, virtual_shards: int) -> int:
+    """Виртуальный шард чата; хэш не зависит от процесса и перезапусков"""
+    return zlib.crc32(chat_id.to_bytes(8, "little", signed=True)) % virtual_shards
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """chat_id сырого апдейта (message, callback_query, chat_member, ...); без чата — 0"""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+def db_shards_aligned(config: Config) -> bool:
+    """
+    Лежат ли чаты каждого воркера в одном файле-шарде базы (db_split). Так бывает,
+    только если DB_SHARDS == SHARD_WORKERS и это число делит SHARD_VIRTUAL:
+    тогда crc32 % SHARD_VIRTUAL % SHARD_WORKERS совпадает с crc32 % DB_SHARDS.
+    Перенос шардов между воркерами (move_shards) это совпадение нарушает
+    """
+    return (config.DB_SHARDS == config.SHARD_WORKERS
+            and config.SHARD_VIRTUAL % config.SHARD_WORKERS == 0)
+
+# --- Рабочий процесс ---
+
+class _Worker:
+    """
+    Обрабатывает апдейты своих чатов через обычный диспетчер (bot.build_app).
+    Апдейты одного чата выполняются строго по очереди (цепочка задач),
+    разные чаты — параллельно, не больше concurrency одновременно.
+    Слот занимается, только когда апдейт дождался предыдущего в своём чате,
+    чтобы очередь одного занятого чата не держала слоты остальных.
+    Принятых, но не обработанных апдейтов не больше max_pending: пока их столько,
+    воркер не читает inbox, и всплеск или один медленный чат не раздувают память.
+    """
+
+    def __init__(self, index: int, virtual_shards: int, owned: Iterable[int], concurrency: int,
+                 max_pending: int, global_rate: float, inbox, outbox):
+        self.index = index
+        self.virtual_shards = virtual_shards
+        self.owned: Set[int] = set(owned)
+        self.global_rate = global_rate
+        self.inbox = inbox
+        self.outbox = outbox
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._admission = asyncio.Semaphore(max_pending)
+        # chat_id -> последняя поставленная задача чата
+        self._tails: Dict[int, asyncio.Task] = {}
+        self.pending = 0
+        self.admission_waits = 0
+
+    def _in(self, vshards: Set[int]):
+        return lambda chat_id: shard_of(chat_id, self.virtual_shards) in vshards
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "chats": len(self._tails),
+            "admission_waits": self.admission_waits,
+            "global_rate": self.global_rate,
+        }
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        app = None
+        try:
+            # Бот, диспетчер, пул базы и кэши создаются заново в каждом процессе.
+            # Импорт тоже внутри try: о любой ошибке запуска фронт узнаёт через "failed"
+            import database
+            from bot import build_app
+            from metrics import register_stats
+            from utils import forget_chat_admins
+
+            config = Config()
+            if config.METRICS_PORT:
+                config.METRICS_PORT += 1 + self.index
+            root, ext = os.path.splitext(config.TRACE_FILE)
+            config.TRACE_FILE = f"{root}.worker{self.index}{ext}"
+            # Рейтинги в памяти — только чатов своих шардов
+            app = build_app(config, chat_filter=self._in(set(self.owned)))
+            # Лимит бота на всех один: воркер получает свою долю OUTBOUND_GLOBAL_RATE
+            app.outbound.set_global_rate(self.global_rate)
+            register_stats("bot_shard_worker", "Очередь апдейтов воркера", self.stats)
+            await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp, bots=[app.bot])
+        except Exception:
+            # Фронт ждёт "ready"; без ответа он завис бы, а потоки aiosqlite не дали бы выйти
+            logger.exception("Воркер %s не запустился", self.index)
+            if app is not None:
+                await app.outbound.close(timeout=0)
+                await database.close_db()
+                await app.bot.session.close()
+            self.outbox.put(("failed", self.index, traceback.format_exc()))
+            return
+        self._app = app
+        self.outbox.put(("ready", self.index, None))
+        try:
+            while True:
+                kind, payload = await loop.run_in_executor(None, self.inbox.get)
+                if kind == "updates":
+                    for update in payload:
+                        await self._schedule(update)
+                    # Фронт считает апдейты во входной очереди воркера (ShardedFront.wait_capacity)
+                    self.outbox.put(("taken", self.index, len(payload)))
+                elif kind == "release":
+                    vshards, token = payload
+                    vshards = set(vshards)
+                    chats = self._in(vshards)
+                    await self._drain(chats)
+                    self.owned -= vshards
+                    await database.flush_messages()
+                    database.forget_chats(chats)
+                    forget_chat_admins(chats)
+                    self.outbox.put(("released", self.index, token))
+                elif kind == "acquire":
+                    vshards = set(payload)
+                    self.owned |= vshards
+                    await database.warm_leaderboard(self._in(vshards))
+                elif kind == "rate":
+                    self.global_rate = payload
+                    app.outbound.set_global_rate(payload)
+                elif kind == "stop":
+                    break
+        finally:
+            await self._drain(lambda chat_id: True)
+            await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp, bots=[app.bot])
+            await app.bot.session.close()
+            self.outbox.put(("stopped", self.index, None))
+
+    async def _schedule(self, update: Dict[str, Any]):
+        # Место занимается до постановки в цепочку чата, слот обработки — отдельно в _process
+        if self._admission.locked():
+            self.admission_waits += 1
+        await self._admission.acquire()
+        self.pending += 1
+        chat_id = update_chat_id(update)
+        previous = self._tails.get(chat_id)
+        task = asyncio.create_task(self._process(previous, update))
+        self._tails[chat_id] = task
+        task.add_done_callback(lambda done: self._done(chat_id, done))
+
+    def _done(self, chat_id: int, task: asyncio.Task):
+        self.pending -= 1
+        self._admission.release()
+        if self._tails.get(chat_id) is task:
+            del self._tails[chat_id]
+
+    async def _process(self, previous: Optional[asyncio.Task], update: Dict[str, Any]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._slots:
+            try:
+                await self._app.dp.feed_raw_update(self._app.bot, update)
+            except Exception:
+                logger.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+    async def _drain(self, chat_filter):
+        tasks = [task for chat_id, task in self._tails.items() if chat_filter(chat_id)]
+        if tasks:
+            await asyncio.wait(tasks)
+
+def worker_main(index: int, virtual_shards: int, owned: List[int], concurrency: int, max_pending: int,
+                global_rate: float, inbox, outbox, log_level: int = logging.INFO):
+    # Ctrl+C получает вся группа процессов; останавливает воркеры только фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(log_level, fmt=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_Worker(index, virtual_shards, owned, concurrency, max_pending, global_rate, inbox, outbox).run())
+
+# --- Фронт ---
+
+class ShardedFront:
+    """
+    Принимает сырые апдейты и раскладывает их по рабочим процессам по chat_id.
+    Чат хэшируется в один из virtual_shards виртуальных шардов, шард закреплён
+    за воркером; перебалансировка переносит шарды целиком (move_shards).
+    Апдейты копятся пачками и отправляются воркерам раз за итерацию цикла событий.
+    Во входной очереди воркера не больше max_pending апдейтов, ещё не взятых им
+    в обработку: пока чья-то очередь полна, фронт не забирает новые апдейты
+    у Telegram (wait_capacity), и медленный воркер не раздувает память очередей.
+    global_rate (лимит исходящих запросов бота в секунду) делится между воркерами поровну.
+    """
+
+    def __init__(self, workers: int, virtual_shards: int = 1024, concurrency: int = 256,
+                 max_pending: int = 4096, global_rate: float = 30, start_timeout: float = 60,
+                 log_level: int = logging.INFO):
+        self.virtual_shards = virtual_shards
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.global_rate = global_rate
+        self.start_timeout = start_timeout
+        self.log_level = log_level
+        self.routed = Counter()
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = self._context.Queue()
+        self._owner: List[int] = [vshard % workers for vshard in range(virtual_shards)]
+        self._initial_workers = workers
+        self._processes: Dict[int, Any] = {}
+        self._inboxes: Dict[int, Any] = {}
+        self._batches: Dict[int, list] = {}
+        self._flush_scheduled = False
+        # Отправлено воркеру, но ещё не взято им из входной очереди
+        self._queued: Counter = Counter()
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+        # Шарды в процессе переноса: апдейты придерживаются до смены владельца
+        self._moving: Dict[int, list] = {}
+        self._waiters: Dict[Any, asyncio.Future] = {}
+        self._tokens = itertools.count(1)
+        self._reader: Optional[asyncio.Task] = None
+
+    def shards_of(self, worker: int) -> List[int]:
+        return [vshard for vshard, owner in enumerate(self._owner) if owner == worker]
+
+    @property
+    def workers(self) -> List[int]:
+        return sorted(self._processes)
+
+    async def start(self):
+        # Миграции — один раз до запуска воркеров: иначе init_db каждого воркера
+        # применял бы их одновременно к тем же файлам
+        import database
+        from migrations import migrate_files
+        await migrate_files(database.db_paths())
+
+        self._reader = asyncio.create_task(self._read_outbox())
+        results = await asyncio.gather(*(self._spawn(index, self._initial_workers)
+                                         for index in range(self._initial_workers)),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _spawn(self, index: int, workers: int):
+        """Запускает воркер index с долей лимита отправки на workers воркеров"""
+        inbox = self._context.Queue()
+        ready = self._waiter(("ready", index))
+        process = self._context.Process(
+            target=worker_main,
+            args=(index, self.virtual_shards, self.shards_of(index), self.concurrency, self.max_pending,
+                  self.global_rate / workers, inbox, self._outbox, self.log_level),
+            name=f"shard-worker-{index}",
+        )
+        process.start()
+        try:
+            await self._wait_ready(index, process, ready)
+        except Exception:
+            self._waiters.pop(("ready", index), None)
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 30)
+            raise
+        self._processes[index] = process
+        self._inboxes[index] = inbox
+        self._batches[index] = []
+        logger.info("Воркер %s запущен (pid %s)", index, process.pid)
+
+    async def _wait_ready(self, index: int, process, ready: asyncio.Future):
+        """
+        Ждёт "ready" от воркера, проверяя, что процесс жив: упавший до отчёта
+        воркер (или зависший дольше start_timeout) не оставляет фронт ждать вечно
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.start_timeout
+        while True:
+            done, _ = await asyncio.wait([ready], timeout=0.5)
+            if done:
+                return ready.result()
+            if not process.is_alive():
+                raise RuntimeError(f"Воркер {index} завершился при запуске (код {process.exitcode})")
+            if loop.time() >= deadline:
+                process.terminate()
+                raise RuntimeError(f"Воркер {index} не запустился за {self.start_timeout} сек.")
+
+    def _share_rate(self, workers: int):
+        """Раздаёт запущенным воркерам долю лимита отправки на workers воркеров"""
+        for inbox in self._inboxes.values():
+            inbox.put(("rate", self.global_rate / workers))
+
+    def _waiter(self, key) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key] = future
+        return future
+
+    async def _read_outbox(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            kind, index, token = await loop.run_in_executor(None, self._outbox.get)
+            if kind == "closed":
+                return
+            if kind == "taken":
+                self._taken(index, token)
+                continue
+            if kind == "failed":
+                future = self._waiters.pop(("ready", index), None)
+                if future is not None and not future.done():
+                    future.set_exception(RuntimeError(f"Воркер {index} не запустился:\n{token}"))
+                continue
+            future = self._waiters.pop((kind, token if token is not None else index), None)
+            if future is not None and not future.done():
+                future.set_result(index)
+
+    def route(self, update: Dict[str, Any]):
+        vshard = shard_of(update_chat_id(update), self.virtual_shards)
+        held = self._moving.get(vshard)
+        if held is not None:
+            held.append(update)
+            return
+        worker = self._owner[vshard]
+        self._batches[worker].append(update)
+        self.routed[worker] += 1
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        for worker, batch in self._batches.items():
+            if batch:
+                self._inboxes[worker].put(("updates", batch))
+                self._batches[worker] = []
+                self._queued[worker] += len(batch)
+                if self._queued[worker] >= self.max_pending:
+                    self._capacity.clear()
+
+    def _taken(self, worker: int, count: int):
+        if worker in self._queued:
+            self._queued[worker] -= count
+        if max(self._queued.values(), default=0) < self.max_pending:
+            self._capacity.set()
+
+    async def wait_capacity(self):
+        """Ждёт, пока во входных очередях всех воркеров есть место"""
+        await self._capacity.wait()
+
+    async def move_shards(self, vshards: Iterable[int], target: int):
+        """
+        Переносит виртуальные шарды к воркеру target. Старый владелец дообрабатывает
+        их апдейты и сбрасывает счётчики в базу, новый загружает их рейтинги;
+        пришедшие за это время апдейты придерживаются, порядок внутри чата сохраняется.
+        """
+        vshards = [vshard for vshard in vshards if self._owner[vshard] != target]
+        if not vshards:
+            return
+        for vshard in vshards:
+            self._moving[vshard] = []
+        # Всё, что уже направлено старым владельцам, уходит раньше команды release
+        self._flush()
+        by_owner: Dict[int, List[int]] = {}
+        for vshard in vshards:
+            by_owner.setdefault(self._owner[vshard], []).append(vshard)
+        releases = []
+        for owner, shards in by_owner.items():
+            token = next(self._tokens)
+            releases.append(self._waiter(("released", token)))
+            self._inboxes[owner].put(("release", (shards, token)))
+        await asyncio.gather(*releases)
+
+        self._inboxes[target].put(("acquire", vshards))
+        for vshard in vshards:
+            self._owner[vshard] = target
+            held = self._moving.pop(vshard)
+            self._batches[target].extend(held)
+            self.routed[target] += len(held)
+        self._flush()
+        logger.info(f"{len(vshards)} шардов перенесено на воркер {target}")
+
+    async def add_worker(self) -> int:
+        """Запускает ещё один воркер и переносит на него равную долю шардов"""
+        index = max(self._processes, default=-1) + 1
+        workers = len(self._processes) + 1
+        # Сначала уменьшаются доли работающих, чтобы сумма не превышала global_rate
+        self._share_rate(workers)
+        try:
+            await self._spawn(index, workers)
+        except Exception:
+            self._share_rate(len(self._processes))
+            raise
+        share = self.virtual_shards // len(self._processes)
+        donors = [worker for worker in self.workers if worker != index]
+        moving = []
+        for position in range(share):
+            donor_shards = self.shards_of(donors[position % len(donors)])
+            moving.append(donor_shards[position // len(donors)])
+        await self.move_shards(moving, index)
+        return index
+
+    async def remove_worker(self, index: int):
+        """Раздаёт шарды воркера остальным и останавливает его"""
+        others = [worker for worker in self.workers if worker != index]
+        if not others:
+            raise ValueError("Нельзя остановить последний воркер")
+        shards = self.shards_of(index)
+        for position, target in enumerate(others):
+            await self.move_shards(shards[position::len(others)], target)
+        await self._stop_worker(index)
+        self._share_rate(len(self._processes))
+
+    async def _stop_worker(self, index: int, timeout: float = 30):
+        stopped = self._waiter(("stopped", index))
+        self._inboxes[index].put(("stop", None))
+        try:
+            await asyncio.wait_for(stopped, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Воркер {index} не остановился за {timeout} сек., завершаю принудительно")
+            self._processes[index].terminate()
+        await asyncio.get_running_loop().run_in_executor(None, self._processes[index].join, timeout)
+        del self._processes[index], self._inboxes[index], self._batches[index]
+        self._taken(index, self._queued.pop(index, 0))
+
+    async def stop(self):
+        """Отдаёт воркерам накопленное, дожидается их штатной остановки и закрывает каналы"""
+        self._flush()
+        await asyncio.gather(*(self._stop_worker(index) for index in self.workers))
+        self._outbox.put(("closed", None, None))
+        if self._reader is not None:
+            await self._reader
+
+class ShardedRequestHandler(SimpleRequestHandler):
+    """Вебхук фронта: проверяет секрет и передаёт апдейт воркеру, не обрабатывая его"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, front: ShardedFront, secret_token: Optional[str] = None):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token)
+        self.front = front
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        # Пока очереди воркеров полны, ответ задерживается и Telegram не шлёт новые апдейты
+        await self.front.wait_capacity()
+        self.front.route(await request.json(loads=bot.session.json_loads))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+async def _poll(front: ShardedFront, dp: Dispatcher, bot: Bot):
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while True:
+        await front.wait_capacity()
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.warning(f"Ошибка получения апдейтов: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            front.route(update.model_dump(mode="json", by_alias=True, exclude_unset=True))
+            offset = update.update_id + 1
+
+async def _resize(front: ShardedFront, grow: bool, lock: asyncio.Lock):
+    """Добавляет воркер или останавливает последний; изменения выполняются по одному"""
+    async with lock:
+        try:
+            if grow:
+                index = await front.add_worker()
+                logger.info("Добавлен воркер %s, всего %s", index, len(front.workers))
+            else:
+                index = front.workers[-1]
+                await front.remove_worker(index)
+                logger.info("Воркер %s остановлен, всего %s", index, len(front.workers))
+        except Exception:
+            logger.exception("Не удалось изменить число воркеров")
+
+async def run_sharded(dp: Dispatcher, bot: Bot, config: Config, outbound: Optional[OutboundScheduler] = None):
+    """Фронт-процесс: получает апдейты (polling или вебхук) и раздаёт их воркерам"""
+    if config.UPDATE_MODE == "webhook":
+        check_webhook_secret(config)
+    if config.DB_SHARDS > 1 and not db_shards_aligned(config):
+        # Работать это не мешает, но каждый воркер пишет во все файлы-шарды
+        logger.warning(
+            "DB_SHARDS=%s не совпадает с SHARD_WORKERS=%s (или не делит SHARD_VIRTUAL=%s): "
+            "чаты одного воркера лежат в разных файлах базы",
+            config.DB_SHARDS, config.SHARD_WORKERS, config.SHARD_VIRTUAL,
+        )
+    front = ShardedFront(config.SHARD_WORKERS, config.SHARD_VIRTUAL, config.SHARD_WORKER_CONCURRENCY,
+                         max_pending=config.SHARD_WORKER_MAX_PENDING, global_rate=config.OUTBOUND_GLOBAL_RATE,
+                         start_timeout=config.SHARD_START_TIMEOUT)
+    runner = None
+    loop = asyncio.get_running_loop()
+    resizing = asyncio.Lock()
+    resizes: Set[asyncio.Task] = set()
+
+    def resize(grow: bool):
+        task = loop.create_task(_resize(front, grow, resizing))
+        resizes.add(task)
+        task.add_done_callback(resizes.discard)
+
+    try:
+        # Если какой-то воркер не запустился, finally останавливает уже запущенные
+        await front.start()
+        # Число воркеров меняется на ходу: SIGUSR1 — добавить воркер, SIGUSR2 — убрать последний
+        loop.add_signal_handler(signal.SIGUSR1, resize, True)
+        loop.add_signal_handler(signal.SIGUSR2, resize, False)
+        if config.UPDATE_MODE == "webhook":
+            app = web.Application()
+            ShardedRequestHandler(dp, bot, front, config.WEBHOOK_SECRET or None).register(app, path=config.WEBHOOK_PATH)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT).start()
+            await register_webhook(dp, bot, config)
+            await asyncio.Event().wait()
+        else:
+            await _poll(front, dp, bot)
+    finally:
+        loop.remove_signal_handler(signal.SIGUSR1)
+        loop.remove_signal_handler(signal.SIGUSR2)
+        if runner is not None:
+            await runner.cleanup()
+        # Начатое изменение числа воркеров доводится до конца до остановки
+        async with resizing:
+            await front.stop()
+        # Диспетчер фронта не запускается, поэтому on_shutdown с закрытием очереди не вызывается
+        if outbound is not None:
+            await outbound.close()
+        await bot.session.close()
@@ -0,0 +1,65 @@
+# tests/test_cache.py
+from cache import ExpiringDict
+
+def test_entry_readable_for_ttl_through_previous_generation():
+    cache = ExpiringDict(ttl=10)
+    cache.set("a", 1, now=0)
+    cache.set("b", 2, now=9)
+    assert cache.get("a", now=9.9) == 1
+
+    # Первая ротация: обе записи переходят в предыдущее поколение и читаются оттуда
+    assert cache.get("b", now=10) == 2
+    assert cache._previous == {"a": 1, "b": 2} and cache._current == {}
+    # Запись "b" обновлена 9.9 единиц назад — ещё в пределах ttl
+    assert cache.get("b", now=18.9) == 2
+
+    # Вторая ротация: предыдущее поколение отжило
+    assert cache.get("b", now=20) is None
+    assert cache.get("a", now=20, default="нет") == "нет"
+    assert len(cache) == 0
+    assert cache.pending_sweep == 2
+
+def test_set_moves_entry_to_current_generation():
+    cache = ExpiringDict(ttl=10)
+    cache.set("a", 1, now=0)
+    cache.set("a", 2, now=12)
+    assert cache._current == {"a": 2} and cache._previous == {}
+    assert cache.get("a", now=21) == 2
+    assert len(cache) == 1
+
+def test_long_pause_expires_both_generations():
+    cache = ExpiringDict(ttl=10)
+    cache.set("a", 1, now=0)
+    cache.set("b", 2, now=11)
+    assert cache._previous == {"a": 1} and cache._current == {"b": 2}
+    # Пауза больше двух ttl: устаревают и текущее, и предыдущее поколение
+    assert cache.get("b", now=40) is None
+    assert len(cache) == 0
+    assert cache.pending_sweep == 2
+
+def test_expired_generations_swept_in_batches():
+    cache = ExpiringDict(ttl=10, sweep_batch=3)
+    for key in range(10):
+        cache.set(key, key, now=0)
+    cache.get(0, now=10)
+    cache.get(0, now=20)
+    assert cache.pending_sweep == 10
+
+    # Каждая запись освобождает не больше sweep_batch отживших ключей
+    cache.set("new", 1, now=20)
+    assert cache.pending_sweep == 7
+    assert cache.evictions == 3
+    for step in range(3):
+        cache.set(f"k{step}", step, now=21)
+    assert cache.pending_sweep == 0
+    assert cache.evictions == 10
+    assert cache.stats() == {"size": 4, "evictions": 10, "pending_sweep": 0}
+
+def test_pop_reads_both_generations():
+    cache = ExpiringDict(ttl=10)
+    cache.set("a", 1, now=0)
+    cache.set("b", 2, now=10)
+    assert cache.pop("a") == 1
+    assert cache.pop("b") == 2
+    assert cache.pop("a", "нет") == "нет"
+    assert len(cache) == 0
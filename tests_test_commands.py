@@ -0,0 +1,82 @@
+# tests/test_commands.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import handlers.commands as commands
+from handlers.commands import parse_command
+
+@pytest.mark.parametrize("text, expected", [
+    # Слэш-команды: имя команды или алиас, аргументы — остаток строки
+    ("/top", ("top", "")),
+    ("/TOP", ("top", "")),
+    ("/mute 60", ("mute", "60")),
+    ("/warn спам в чате", ("warn", "спам в чате")),
+    ("/set_flood window 5 10", ("set_flood", "window 5 10")),
+    ("/топ", ("top", "")),
+    ("  /mystats  ", ("mystats", "")),
+    ("/status", ("status", "")),
+    ("/unknown", None),
+    ("/", None),
+    # @botname отбрасывается, аргументы сохраняются
+    ("/top@statbot", ("top", "")),
+    ("/warn@statbot флуд", ("warn", "флуд")),
+    ("/unknown@statbot", None),
+    # Текстовые алиасы — только целиком, без учёта регистра и пробелов по краям
+    ("топ", ("top", "")),
+    ("Топ", ("top", "")),
+    ("  моя стата ", ("mystats", "")),
+    ("пред", ("warn", "")),
+    ("снять предупреждение", ("unwarn", "")),
+    ("мут время", ("set_mute", "")),
+    ("антифлуд лимит", ("set_flood", "")),
+    ("статус", None),
+    # Алиас в начале фразы не делает её командой
+    ("топ новостей за неделю", None),
+    ("предупреждение всем: завтра собрание", None),
+    ("пред спам", None),
+    ("мут время 60", None),
+    ("антифлуд on", None),
+    ("назначить 3", None),
+    # Алиас — префикс другого алиаса или обычного слова
+    ("мут", ("mute", "")),
+    ("мутный", None),
+    ("ранг", ("rank", "")),
+    ("ранги админов", ("adminranks", "")),
+    ("бан", ("ban", "")),
+    ("бан время", ("set_ban", "")),
+    ("бананы", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_command(text, expected):
+    assert parse_command(text) == expected
+
+def test_admin_command_falls_through_for_members(monkeypatch):
+    # Команда администратора от участника не выполняется, и сообщение уходит в статистику
+    calls = []
+
+    async def handler(message):
+        calls.append(message.from_user.id)
+
+    async def is_admin(bot, chat_id, user_id):
+        return user_id == 1
+
+    monkeypatch.setattr(commands, "is_admin", is_admin)
+    monkeypatch.setitem(commands.COMMAND_HANDLERS, "warn", (handler, False, True))
+    monkeypatch.setitem(commands.COMMAND_HANDLERS, "top", (handler, False, False))
+
+    def message(user_id):
+        return SimpleNamespace(bot=None, chat=SimpleNamespace(id=-100), from_user=SimpleNamespace(id=user_id))
+
+    async def scenario():
+        return [
+            await commands.run_command("warn", message(2), ""),
+            await commands.run_command("warn", message(1), ""),
+            await commands.run_command("top", message(2), ""),
+            await commands.run_command("unknown", message(1), ""),
+        ]
+
+    assert asyncio.run(scenario()) == [False, True, True, False]
+    assert calls == [1, 2]
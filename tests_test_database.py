@@ -0,0 +1,328 @@
+# tests/test_database.py
+import asyncio
+import random
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Отдельный файл базы на тест; пулы открывает и закрывает сам тест"""
+    path = tmp_path / "test.db"
+    monkeypatch.setattr(database, "DB_PATH", str(path))
+    return path
+
+def _run(scenario):
+    async def wrapped():
+        await database.init_db()
+        try:
+            return await scenario()
+        finally:
+            await database.close_db()
+    return asyncio.run(wrapped())
+
+def test_add_warn_concurrent(db_path):
+    # Тысячи одновременных варнов одному пользователю: ни одно увеличение не теряется
+    count = 3000
+
+    async def scenario():
+        results = await asyncio.gather(*(database.add_warn(1, 2) for _ in range(count)))
+        stats = await database.get_user_stats(1, 2)
+        return results, stats
+
+    results, stats = _run(scenario)
+    assert sorted(results) == list(range(1, count + 1))
+    assert stats[4] == count
+
+def test_profile_update_during_read_not_overwritten(db_path, monkeypatch):
+    # Профиль обновился, пока get_users_info читал старый: в кэше остаётся новый
+    acquire = database._acquire
+    raced = []
+
+    @asynccontextmanager
+    async def racing_acquire():
+        async with acquire() as db:
+            yield db
+        if not raced:
+            raced.append(True)
+            await database.update_user_info(901, "new", "Новое", None)
+
+    async def scenario():
+        await database.update_user_info(901, "old", "Старое", None)
+        database._user_info_cache.pop(901)
+        monkeypatch.setattr(database, "_acquire", racing_acquire)
+        read = await database.get_users_info([901])
+        return read, await database.get_user_info(901)
+
+    read, cached = _run(scenario)
+    assert raced
+    assert read[901] == ("new", "Новое", None)
+    assert cached == ("new", "Новое", None)
+
+def test_hot_queries_use_indexes(db_path):
+    # Горячие запросы не должны уходить в полный скан или сортировку во временном B-дереве
+    assert _run(database.check_query_plans) == {}
+
+def test_inactive_chats_stay_in_database(db_path):
+    # Давно молчащий чат не загружается в память: его топ читается из базы,
+    # а запрос топа чата без рейтинга не заводит для него пустой рейтинг
+    async def scenario():
+        await database.add_message(-101, 10, "привет")
+        await database.add_message(-102, 20, "привет")
+        await database.flush_messages()
+        async with database._acquire_chat(-101) as db:
+            await db.execute("UPDATE chat_stats SET last_message_time = '2000-01-01 00:00:00' WHERE chat_id = -101")
+            await db.commit()
+        await database.warm_leaderboard()
+        await database.add_message(-101, 11, "привет")
+        await database.flush_messages()
+        return await database.get_top(-101), await database.get_top(-102), await database.get_top(-103)
+
+    cold, active, missing = _run(scenario)
+    assert -101 in database._leaderboard.cold and -101 not in database._leaderboard.chats
+    assert [row[0] for row in cold] == [10, 11] or [row[0] for row in cold] == [11, 10]
+    assert [row[0] for row in active] == [20]
+    assert missing == [] and -103 not in database._leaderboard.chats
+
+def _baseline_db(path, rows):
+    """База в схеме до миграций (как её создавал старый init_db) со строками chat_stats"""
+    from migrations import MIGRATIONS
+    with sqlite3.connect(path) as db:
+        for step in MIGRATIONS[0][2]:
+            db.execute(step.sql)
+        db.executemany('''
+            INSERT INTO chat_stats (chat_id, user_id, messages_day, messages_week, messages_all, experience)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+def test_upgraded_database_uses_indexes(db_path):
+    # Первый запуск после обновления старой базы: планы проверяются уже по новой схеме
+    _baseline_db(db_path, [(-1, user_id, 1, 2, user_id, user_id * 10) for user_id in range(1, 6)])
+
+    async def scenario():
+        return await database.check_query_plans(), await database.get_top(-1)
+
+    problems, top = _run(scenario)
+    assert problems == {}
+    assert [row[0] for row in top] == [5, 4, 3, 2, 1]
+
+def test_reads_see_buffered_messages(db_path, monkeypatch):
+    # До сброса буфера статистика и топ (из памяти и запросом к базе) уже учитывают сообщения
+    async def scenario():
+        await database.add_message(-201, 1, "привет")
+        await database.flush_messages()
+        for _ in range(3):
+            await database.add_message(-201, 2, "привет")
+        await database.add_message(-201, 1, "привет")
+        assert len(database._buffer) == 4
+        stats = await database.get_user_stats(-201, 2)
+        memory_top = await database.get_top(-201)
+        monkeypatch.setattr(database._leaderboard, "ready", False)
+        sql_top = await database.get_top(-201)
+        monkeypatch.setattr(database._leaderboard, "ready", True)
+        return stats, memory_top, sql_top
+
+    stats, memory_top, sql_top = _run(scenario)
+    assert stats[:3] == (3, 3, 3)
+    assert [row[:2] for row in memory_top] == [(2, 3), (1, 2)]
+    assert [row[:2] for row in sql_top] == [(2, 3), (1, 2)]
+
+def test_failed_final_flush_keeps_buffer(db_path, monkeypatch):
+    # Запись при остановке не удалась — приращения остаются в буфере и записываются позже
+    write_stats = database._write_stats
+
+    async def failing_write(pool, stats, daily):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def scenario():
+        await database.init_db()
+        for _ in range(3):
+            await database.add_message(-202, 1, "привет")
+        monkeypatch.setattr(database, "_write_stats", failing_write)
+        pools = database._all_pools()
+        with pytest.raises(sqlite3.OperationalError):
+            await database.close_db()
+        assert len(database._buffer) == 3
+        # Пулы закрыты и при неудачном сбросе
+        assert database._pool is None
+        assert all(pool._queue is None for pool in pools)
+        monkeypatch.setattr(database, "_write_stats", write_stats)
+        await database.init_db()
+        try:
+            await database.flush_messages()
+            assert len(database._buffer) == 0
+            return await database.get_user_stats(-202, 1)
+        finally:
+            await database.close_db()
+
+    stats = asyncio.run(scenario())
+    assert stats[2] == 3
+
+class _Clock:
+    """Подменяет datetime в database и periods: время бота задаётся тестом"""
+
+    def __init__(self, monkeypatch, now):
+        import periods
+        clock = self
+        self.now = now
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now.astimezone(tz) if tz else clock.now.astimezone().replace(tzinfo=None)
+
+            @classmethod
+            def utcnow(cls):
+                return clock.now.astimezone(timezone.utc).replace(tzinfo=None)
+
+        monkeypatch.setattr(database, "datetime", FakeDatetime)
+        monkeypatch.setattr(periods, "datetime", FakeDatetime)
+
+def test_epoch_rollover_matches_cron_resets(db_path, monkeypatch):
+    # Счётчики по эпохам дают те же топы, что старое ночное обнуление (включая переход
+    # через миграцию 3): воскресенье 23:00 -> понедельник 00:30 -> вторник 00:30 по времени бота
+    import periods
+    sunday = periods.tz.localize(datetime(2026, 10, 18, 23, 0))
+    clock = _Clock(monkeypatch, sunday)
+    chat = -301
+    # Эталон: user_id -> [день, неделя, всего, опыт], обнуляется по расписанию старого cron
+    expected = {user_id: [user_id, 2 * user_id, 10 * user_id, 7 * user_id + 1] for user_id in range(1, 6)}
+    _baseline_db(db_path, [(chat, user_id, *counters) for user_id, counters in expected.items()])
+    with sqlite3.connect(db_path) as db:
+        # Чат активен — его рейтинг загружается в память
+        db.execute("UPDATE chat_stats SET last_message_time = ?",
+                   (sunday.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),))
+
+    def write(user_id):
+        for counter in (0, 1, 2):
+            expected[user_id][counter] += 1
+        expected[user_id][3] += 60  # "привет": (6 // 3) * 30
+
+    def reference(period):
+        column = {"day": 0, "week": 1, "all": 2}[period]
+        rows = [(user_id, values[column], values[3]) for user_id, values in expected.items()]
+        return sorted(rows, key=lambda row: (row[1], row[2]), reverse=True)
+
+    async def check():
+        for period in ("day", "week", "all"):
+            assert await database.get_top(chat, period) == reference(period), period
+            monkeypatch.setattr(database._leaderboard, "ready", False)
+            assert [tuple(row) for row in await database.get_top(chat, period)] == reference(period), period
+            monkeypatch.setattr(database._leaderboard, "ready", True)
+
+    async def scenario():
+        assert database._leaderboard.serves(chat)
+        await check()
+        for user_id in (1, 1, 3):
+            await database.add_message(chat, user_id, "привет")
+            write(user_id)
+        await check()
+
+        # Полночь на понедельник: cron обнулял и день, и неделю
+        clock.now = sunday + timedelta(hours=1, minutes=30)
+        for values in expected.values():
+            values[0] = values[1] = 0
+        await check()
+        for user_id in (2, 5, 5):
+            await database.add_message(chat, user_id, "привет")
+            write(user_id)
+        await check()
+        await database.flush_messages()
+        await check()
+
+        # Полночь на вторник: только день
+        clock.now = sunday + timedelta(days=1, hours=1, minutes=30)
+        for values in expected.values():
+            values[0] = 0
+        await check()
+        await database.add_message(chat, 4, "привет")
+        write(4)
+        await database.flush_messages()
+        await check()
+
+    _run(scenario)
+
+def test_hidden_rank_window_moves_with_clock(db_path, monkeypatch):
+    # Дни старше 30 суток выпадают из месячной суммы в памяти, и ранг понижается при сдвиге окна
+    clock = _Clock(monkeypatch, datetime(2026, 10, 18, 12, 0).astimezone())
+    chat, user = -401, 1
+    _baseline_db(db_path, [(chat, user, 0, 0, 100000, 0)])
+    with sqlite3.connect(db_path) as db:
+        db.executemany("INSERT INTO daily_stats (chat_id, user_id, date, messages) VALUES (?, ?, ?, ?)",
+                       [(chat, user, "2026-09-19", 60000), (chat, user, "2026-10-08", 40000)])
+
+    async def scenario():
+        assert await database.update_hidden_rank(chat, user) == 6
+
+        clock.now += timedelta(days=1)
+        await database.add_message(chat, user, "привет")
+        assert await database.update_hidden_rank(chat, user) is None
+
+        clock.now += timedelta(days=1)
+        assert await database.update_hidden_rank(chat, user) == 2
+        state = database._ranks.get(chat, user)
+        assert state.days == {"2026-10-08": 40000, "2026-10-19": 1}
+        assert state.month == 40001
+
+    _run(scenario)
+
+def test_memory_leaderboard_matches_sql(db_path, monkeypatch):
+    # Рейтинг в памяти и запросы get_top к базе дают один порядок, включая равенства
+    # (малые диапазоны значений) и устаревшие эпохи; так же после перезагрузки бывшего cold-чата
+    rnd = random.Random(7)
+    chats = [-501, -502, -503]
+    active = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    async def compare(chat, limits=(1, 5, 10, 100)):
+        for period in ("day", "week", "all"):
+            for limit in limits:
+                assert database._leaderboard.serves(chat)
+                memory = await database.get_top(chat, period, limit)
+                monkeypatch.setattr(database._leaderboard, "ready", False)
+                sql = [tuple(row) for row in await database.get_top(chat, period, limit)]
+                monkeypatch.setattr(database._leaderboard, "ready", True)
+                assert memory == sql, (chat, period, limit)
+
+    async def scenario():
+        day, week = database._current_epochs()
+        rows = []
+        for chat in chats:
+            for user_id in range(1, 61):
+                rows.append((
+                    chat, user_id, rnd.randrange(4), rnd.choice((day, day - 1)), rnd.randrange(6),
+                    rnd.choice((week, week - 7)), rnd.randrange(10), rnd.randrange(5) * 30,
+                    active if chat != -503 else "2000-01-01 00:00:00",
+                ))
+        for chat in chats:
+            async with database._acquire_chat(chat) as db:
+                await db.executemany('''
+                    INSERT INTO chat_stats (chat_id, user_id, messages_day, day_epoch, messages_week,
+                                            week_epoch, messages_all, experience, last_message_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [row for row in rows if row[0] == chat])
+                await db.commit()
+        await database.warm_leaderboard()
+        assert not database._leaderboard.serves(-503)
+        for chat in chats[:2]:
+            await compare(chat)
+        # Сообщения поверх загруженного рейтинга — в памяти и в буфере
+        for _ in range(200):
+            await database.add_message(rnd.choice(chats[:2]), rnd.randrange(1, 80), rnd.choice(("ок", "привет")))
+        for chat in chats[:2]:
+            await compare(chat)
+        await database.flush_messages()
+        for chat in chats[:2]:
+            await compare(chat)
+
+        # Cold-чат снова активен: после перезагрузки рейтинг в памяти совпадает с базой
+        async with database._acquire_chat(-503) as db:
+            await db.execute("UPDATE chat_stats SET last_message_time = ? WHERE chat_id = -503", (active,))
+            await db.commit()
+        await database.warm_leaderboard(lambda chat_id: chat_id == -503)
+        await compare(-503)
+
+    _run(scenario)
@@ -0,0 +1,80 @@
+# tests/test_db_split.py
+import asyncio
+import random
+import sqlite3
+
+import pytest
+
+import database
+from db_split import SHARDED_TABLES, split
+
+CHATS = [-(1000 + index) for index in range(12)]
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    monkeypatch.setattr(database, "DB_PATH", str(path))
+    return path
+
+def _run(scenario):
+    async def wrapped():
+        await database.init_db()
+        try:
+            return await scenario()
+        finally:
+            await database.close_db()
+    return asyncio.run(wrapped())
+
+async def _tops(monkeypatch):
+    """Топы всех чатов за все периоды: из памяти и запросом к базе"""
+    tops = {}
+    for source, ready in (("memory", True), ("sql", False)):
+        monkeypatch.setattr(database._leaderboard, "ready", ready)
+        for chat_id in CHATS:
+            for period in ("day", "week", "all"):
+                tops[source, chat_id, period] = [row[:3] for row in await database.get_top(chat_id, period)]
+    monkeypatch.setattr(database._leaderboard, "ready", True)
+    return tops
+
+def _counts(path):
+    with sqlite3.connect(path) as db:
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in SHARDED_TABLES}
+
+def _populate(db_path, monkeypatch):
+    rnd = random.Random(20)
+
+    async def scenario():
+        for _ in range(600):
+            chat_id = rnd.choice(CHATS)
+            await database.add_message(chat_id, rnd.randrange(1, 40), "сообщение " * rnd.randrange(1, 5))
+        for chat_id in CHATS[:4]:
+            await database.log_moderation(chat_id, 1, "warn", 2)
+        await database.flush_messages()
+        return await _tops(monkeypatch)
+
+    return _run(scenario)
+
+def test_split_preserves_rows_and_tops(db_path, monkeypatch):
+    before = _populate(db_path, monkeypatch)
+    counts = _counts(db_path)
+    assert all(counts.values()) and all(before.values())
+
+    report = asyncio.run(split(str(db_path), 2))
+    assert {table: sum(rows) for table, rows in report.items()} == counts
+    assert all(rows for rows in report["chat_stats"])
+    assert not any(_counts(db_path).values())
+    shard_counts = [_counts(database.shard_path(index)) for index in range(2)]
+    assert {table: sum(shard[table] for shard in shard_counts) for table in SHARDED_TABLES} == counts
+
+    monkeypatch.setattr(database.config, "DB_SHARDS", 2)
+    after = _run(lambda: _tops(monkeypatch))
+    assert after == before
+
+def test_unsplit_stats_refuse_sharded_start(db_path, monkeypatch):
+    _populate(db_path, monkeypatch)
+    asyncio.run(split(str(db_path), 2, keep=True))
+
+    monkeypatch.setattr(database.config, "DB_SHARDS", 2)
+    with pytest.raises(RuntimeError, match="chat_stats"):
+        asyncio.run(database.init_db())
+    assert database._pool is None
@@ -0,0 +1,31 @@
+# tests/test_loop_monitor.py
+import asyncio
+import logging
+import time
+
+from loop_monitor import LoopMonitor
+
+async def blocking_handler():
+    time.sleep(0.3)
+
+def test_blocking_call_reported_once(caplog):
+    # Одна блокировка — один отчёт, и в его стеке корутина, вызвавшая time.sleep
+    monitor = LoopMonitor()
+    monitor.configure(interval=0.05, threshold_ms=100)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.2)
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(0.3)
+        await monitor.stop()
+
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        asyncio.run(scenario())
+
+    assert len(monitor.stalls) == 1
+    stall = monitor.stalls[0]
+    assert stall.task == "blocking_handler"
+    assert any("blocking_handler" in line for line in stall.stack)
+    assert stall.lag is not None and stall.lag >= 0.2
+    assert len([record for record in caplog.records if record.name == "loop_monitor"]) == 1
@@ -0,0 +1,109 @@
+# tests/test_migrations.py
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+import migrations
+from migrations import Backfill, MIGRATIONS, Step, run_migrations
+from periods import day_epoch, week_epoch
+
+ROWS = 100
+
+def _schema(path):
+    with sqlite3.connect(path) as db:
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        columns = [row[1] for row in db.execute("PRAGMA table_info(chat_stats)")]
+    return tables, indexes, columns
+
+async def _database(path, monkeypatch, version: int):
+    """Файл со схемой версии version и ROWS строками chat_stats"""
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:version])
+        async with aiosqlite.connect(path) as db:
+            await run_migrations(db)
+            await db.executemany(
+                "INSERT INTO chat_stats (chat_id, user_id, messages_all) VALUES (?, ?, ?)",
+                [(-1, user_id, user_id) for user_id in range(ROWS)],
+            )
+            await db.commit()
+
+def test_step_requires_apply():
+    class Incomplete(Step):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_dry_run_reports_without_changes(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+
+    async def scenario():
+        await _database(path, monkeypatch, version=2)
+        before = _schema(path)
+        async with aiosqlite.connect(path) as db:
+            report = await run_migrations(db, dry_run=True)
+            version = await migrations.get_schema_version(db)
+        return before, report, version
+
+    before, report, version = asyncio.run(scenario())
+    assert [entry[0] for entry in report] == [3, 4]
+    # Бэкфилл и три индекса по chat_stats — по оценке на каждую строку
+    assert report[0][2] == 4 * ROWS
+    assert version == 2
+    assert _schema(path) == before
+    assert "day_epoch" not in before[2]
+
+class _Interrupted(Exception):
+    pass
+
+class _InterruptedDb:
+    """Соединение, которое обрывается на n-м UPDATE — как остановка процесса посреди миграции"""
+
+    def __init__(self, db, fail_on: int):
+        self._db = db
+        self._fail_on = fail_on
+        self._updates = 0
+
+    async def execute(self, sql, *args):
+        if sql.lstrip().startswith("UPDATE"):
+            self._updates += 1
+            if self._updates == self._fail_on:
+                raise _Interrupted
+        return await self._db.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+def test_interrupted_backfill_resumes(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    backfill = next(step for step in MIGRATIONS[2][2] if isinstance(step, Backfill))
+    monkeypatch.setattr(backfill, "chunk_size", 10)
+
+    def filled():
+        with sqlite3.connect(path) as db:
+            return db.execute("SELECT COUNT(*) FROM chat_stats WHERE day_epoch != 0").fetchone()[0]
+
+    async def scenario():
+        await _database(path, monkeypatch, version=2)
+        async with aiosqlite.connect(path) as db:
+            with pytest.raises(_Interrupted):
+                await run_migrations(_InterruptedDb(db, fail_on=3))
+            interrupted_version = await migrations.get_schema_version(db)
+        # Закоммиченные порции остаются, версия 3 не записана
+        interrupted_rows = filled()
+        async with aiosqlite.connect(path) as db:
+            report = await run_migrations(db)
+            version = await migrations.get_schema_version(db)
+        return interrupted_version, interrupted_rows, report, version
+
+    interrupted_version, interrupted_rows, report, version = asyncio.run(scenario())
+    assert interrupted_version == 2
+    assert interrupted_rows == 20
+    assert [entry[0] for entry in report] == [3, 4]
+    assert version == MIGRATIONS[-1][0]
+    with sqlite3.connect(path) as db:
+        epochs = set(db.execute("SELECT day_epoch, week_epoch FROM chat_stats"))
+    assert epochs == {(day_epoch(), week_epoch())}
@@ -0,0 +1,171 @@
+# tests/test_outbound.py
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import BanChatMember, DeleteMessage, GetChat, SendMessage
+
+from outbound import OutboundScheduler, send_priority, PRIORITY_WELCOME
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakeApi:
+    """make_request без сети: записывает отправленные запросы, может ответить 429"""
+
+    def __init__(self):
+        self.sent = []
+        self.retry_after = {}
+
+    async def __call__(self, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        failures = self.retry_after.get(chat_id)
+        if failures:
+            seconds = failures.pop(0)
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=seconds)
+        self.sent.append(_describe(method))
+        return len(self.sent)
+
+def _describe(method):
+    return type(method).__name__, method.chat_id, getattr(method, "text", None)
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def _run(scenario, **options):
+    clock = FakeClock()
+    api = FakeApi()
+    scheduler = OutboundScheduler(clock=clock, **options)
+
+    def send(method, priority=None):
+        async def call():
+            if priority is None:
+                return await scheduler(api, None, method)
+            with send_priority(priority):
+                return await scheduler(api, None, method)
+        return asyncio.ensure_future(call())
+
+    async def wake(seconds: float):
+        # Время идёт только по часам планировщика; обработчик будится вручную
+        clock.now += seconds
+        scheduler._wakeup.set()
+        await _settle()
+
+    async def main():
+        try:
+            await scenario(scheduler, api, send, wake)
+        finally:
+            await scheduler.close(timeout=0)
+
+    asyncio.run(main())
+
+def test_lanes_by_priority():
+    async def scenario(scheduler, api, send, wake):
+        tasks = [
+            send(SendMessage(chat_id=-1, text="привет"), PRIORITY_WELCOME),
+            send(SendMessage(chat_id=-2, text="топ")),
+            send(BanChatMember(chat_id=-3, user_id=7)),
+        ]
+        await asyncio.gather(*tasks)
+        assert api.sent == [
+            ("BanChatMember", -3, None),
+            ("SendMessage", -2, "топ"),
+            ("SendMessage", -1, "привет"),
+        ]
+
+    _run(scenario)
+
+def test_chats_served_round_robin():
+    async def scenario(scheduler, api, send, wake):
+        tasks = [send(SendMessage(chat_id=-1, text=f"a{i}")) for i in range(3)]
+        tasks += [send(SendMessage(chat_id=-2, text=f"b{i}")) for i in range(2)]
+        await asyncio.gather(*tasks)
+        assert [text for _, _, text in api.sent] == ["a0", "b0", "a1", "b1", "a2"]
+
+    _run(scenario)
+
+def test_moderation_bypasses_chat_limit():
+    async def scenario(scheduler, api, send, wake):
+        await asyncio.gather(*(send(SendMessage(chat_id=-1, text=str(i))) for i in range(2)))
+        # Лимит группы исчерпан: сообщение ждёт, бан уходит сразу
+        waiting = send(SendMessage(chat_id=-1, text="2"))
+        ban = send(BanChatMember(chat_id=-1, user_id=7))
+        await _settle()
+        assert ban.done() and not waiting.done()
+        assert scheduler.stats()["depth"] == 1
+
+        # 2 сообщения за 60 сек.: следующее можно через 30 сек.
+        await wake(29)
+        assert not waiting.done()
+        await wake(1)
+        assert waiting.done()
+        assert api.sent[-1] == ("SendMessage", -1, "2")
+
+    _run(scenario, chat_rate=2, chat_period=60)
+
+def test_retry_after_pauses_chat_and_requeues():
+    async def scenario(scheduler, api, send, wake):
+        api.retry_after[-1] = [5]
+        paused = send(SendMessage(chat_id=-1, text="a"))
+        await _settle()
+        assert not paused.done()
+
+        # Пауза касается только этого чата
+        other = send(SendMessage(chat_id=-2, text="b"))
+        await _settle()
+        assert other.done()
+        await wake(4)
+        assert not paused.done()
+        await wake(1)
+        assert await paused == 2
+        assert api.sent == [("SendMessage", -2, "b"), ("SendMessage", -1, "a")]
+        assert scheduler.retries == 1 and scheduler.failed == 0
+
+    _run(scenario)
+
+def test_retry_after_gives_up_after_max_retries():
+    async def scenario(scheduler, api, send, wake):
+        api.retry_after[-1] = [1, 1, 1]
+        request = send(SendMessage(chat_id=-1, text="a"))
+        await _settle()
+        await wake(1)
+        await wake(1)
+        with pytest.raises(TelegramRetryAfter):
+            await request
+        assert scheduler.retries == 2 and scheduler.failed == 1
+        assert api.sent == []
+
+    _run(scenario, max_retries=2)
+
+def test_identical_pending_requests_coalesced():
+    async def scenario(scheduler, api, send, wake):
+        results = await asyncio.gather(
+            send(DeleteMessage(chat_id=-1, message_id=5)),
+            send(DeleteMessage(chat_id=-1, message_id=5)),
+            send(DeleteMessage(chat_id=-1, message_id=6)),
+            # Отправки сообщений не объединяются
+            send(SendMessage(chat_id=-1, text="топ")),
+            send(SendMessage(chat_id=-1, text="топ")),
+        )
+        assert results[0] == results[1]
+        assert len(api.sent) == 4
+        assert scheduler.coalesced == 1
+
+        # Объединяются только ожидающие: после отправки запрос уходит заново
+        await send(DeleteMessage(chat_id=-1, message_id=5))
+        assert len(api.sent) == 5
+
+    _run(scenario)
+
+def test_reads_and_requests_without_chat_sent_directly():
+    async def scenario(scheduler, api, send, wake):
+        await send(GetChat(chat_id=-1))
+        assert api.sent == [("GetChat", -1, None)]
+        assert scheduler._worker is None
+
+    _run(scenario)
@@ -0,0 +1,63 @@
+# tests/test_rate_limiter.py
+from rate_limiter import (
+    FloodPolicy, RateLimiter, SlidingWindowCounter, TokenBucket, SLIDING_WINDOW, TOKEN_BUCKET,
+)
+
+BUCKET = FloodPolicy(TOKEN_BUCKET, capacity=4, period=8)
+WINDOW = FloodPolicy(SLIDING_WINDOW, capacity=4, period=10)
+
+def test_bucket_allows_burst_up_to_capacity():
+    bucket = TokenBucket(BUCKET.capacity, now=100)
+    assert [bucket.allow(BUCKET, now=100) for _ in range(5)] == [True] * 4 + [False]
+
+def test_bucket_refills_at_capacity_per_period():
+    # 4 токена за 8 секунд: один токен каждые 2 секунды
+    bucket = TokenBucket(BUCKET.capacity, now=0)
+    for _ in range(4):
+        bucket.allow(BUCKET, now=0)
+    assert bucket.delay(BUCKET, now=0) == 2.0
+    assert bucket.delay(BUCKET, now=1.5) == 0.5
+    assert not bucket.allow(BUCKET, now=1.5)
+    assert bucket.allow(BUCKET, now=2)
+    assert not bucket.allow(BUCKET, now=2)
+    assert bucket.delay(BUCKET, now=3) == 1.0
+
+def test_bucket_refill_capped_at_capacity():
+    bucket = TokenBucket(BUCKET.capacity, now=0)
+    bucket.allow(BUCKET, now=0)
+    # После долгой паузы всплеск снова не больше capacity
+    assert [bucket.allow(BUCKET, now=1000) for _ in range(5)] == [True] * 4 + [False]
+
+def test_window_counts_within_current_window():
+    counter = SlidingWindowCounter(WINDOW.capacity, now=0)
+    assert [counter.allow(WINDOW, now=100 + i) for i in range(5)] == [True] * 4 + [False]
+
+def test_window_boundary_weights_previous_window():
+    counter = SlidingWindowCounter(WINDOW.capacity, now=0)
+    for _ in range(4):
+        assert counter.allow(WINDOW, now=105)
+    # Сразу за границей окна предыдущие 4 сообщения учитываются почти полностью
+    assert not counter.allow(WINDOW, now=110)
+    # На четверти окна остаётся 3 сообщения от предыдущего: место для одного
+    assert counter.allow(WINDOW, now=112.5)
+    assert not counter.allow(WINDOW, now=112.5)
+    # На половине окна: 1 текущее + 2 от предыдущего — можно ещё одно
+    assert counter.allow(WINDOW, now=115)
+    assert not counter.allow(WINDOW, now=115)
+
+def test_window_skipped_period_forgets_previous():
+    counter = SlidingWindowCounter(WINDOW.capacity, now=0)
+    for _ in range(4):
+        counter.allow(WINDOW, now=105)
+    # Между сообщениями прошло больше целого окна: предыдущее окно пустое
+    assert [counter.allow(WINDOW, now=120) for _ in range(5)] == [True] * 4 + [False]
+
+def test_limiter_keys_are_independent_and_reset_on_mode_change():
+    limiter = RateLimiter(max_period=60)
+    for _ in range(4):
+        assert limiter.allow((1, 1), BUCKET, now=0)
+    assert not limiter.allow((1, 1), BUCKET, now=0)
+    assert limiter.allow((1, 2), BUCKET, now=0)
+    # Смена алгоритма в настройках чата начинает счёт заново
+    assert limiter.allow((1, 1), WINDOW, now=0)
+    assert limiter.denied == 1
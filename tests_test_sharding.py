@@ -0,0 +1,81 @@
+# tests/test_sharding.py
+import asyncio
+import os
+import signal
+import sys
+from pathlib import Path
+
+from aiohttp import web
+
+from benchmarks.webhook import FakeBotAPI
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKERS = 2
+
+async def _fake_api():
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", FakeBotAPI().handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def _read_until(process, output, marker: str, count: int = 1) -> int:
+    """Читает лог бота, пока marker не встретится count раз; возвращает, сколько встретилось"""
+    seen = 0
+    while seen < count:
+        line = await asyncio.wait_for(process.stderr.readline(), timeout=60)
+        if not line:
+            break
+        output.append(line.decode())
+        if marker in output[-1]:
+            seen += 1
+    return seen
+
+def _run_bot(tmp_path, steps) -> str:
+    """Запускает python bot.py с SHARD_WORKERS против фальшивого API, выполняет steps и останавливает по SIGINT"""
+    async def scenario():
+        runner, port = await _fake_api()
+        env = dict(os.environ, SHARD_WORKERS=str(WORKERS), DB_PATH=str(tmp_path / "bot.db"),
+                   TELEGRAM_API_URL=f"http://127.0.0.1:{port}", METRICS_PORT="0", LOG_LEVEL="INFO")
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "bot.py", cwd=ROOT, env=env,
+            stderr=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+        )
+        output = []
+        try:
+            assert await _read_until(process, output, "запущен (pid", WORKERS) == WORKERS, "".join(output)
+            await steps(process, output)
+            process.send_signal(signal.SIGINT)
+            _, rest = await asyncio.wait_for(process.communicate(), timeout=60)
+            output.append((rest or b"").decode())
+            return "".join(output)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+def test_sharded_bot_starts_as_script(tmp_path):
+    # python bot.py с SHARD_WORKERS: воркеры (spawn) исполняют bot.py заново как __mp_main__
+    # и импортируют его; оба должны дойти до "ready", а фронт — штатно их остановить
+    async def steps(process, output):
+        pass
+
+    output = _run_bot(tmp_path, steps)
+    assert "Router is already attached" not in output
+    assert "не запустился" not in output
+
+def test_workers_resized_by_signals(tmp_path):
+    # SIGUSR1 добавляет воркер и переносит на него шарды, SIGUSR2 останавливает последний
+    async def steps(process, output):
+        process.send_signal(signal.SIGUSR1)
+        assert await _read_until(process, output, f"Добавлен воркер {WORKERS}, всего {WORKERS + 1}"), "".join(output)
+        process.send_signal(signal.SIGUSR2)
+        assert await _read_until(process, output, f"Воркер {WORKERS} остановлен, всего {WORKERS}"), "".join(output)
+
+    output = _run_bot(tmp_path, steps)
+    assert "Не удалось изменить число воркеров" not in output
@@ -0,0 +1,23 @@
+# tests/test_webhook.py
+import logging
+
+import pytest
+
+from config import Config
+from webhook import check_webhook_secret
+
+def _config(url: str, secret: str) -> Config:
+    config = Config()
+    config.WEBHOOK_URL = url
+    config.WEBHOOK_SECRET = secret
+    return config
+
+def test_public_webhook_without_secret_refused():
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        check_webhook_secret(_config("https://bot.example.com", ""))
+
+def test_webhook_without_secret_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger="webhook"):
+        check_webhook_secret(_config("", ""))
+        check_webhook_secret(_config("https://bot.example.com", "s3cret"))
+    assert [record.levelno for record in caplog.records] == [logging.WARNING]
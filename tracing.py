@@ -0,0 +1,267 @@
+"""
+Трассировка апдейтов и журнал медленных запросов.
+
+Трасса — все спаны одного апдейта: middleware, обработчик, функции database.py,
+SQL-выражения (текст и число строк) и вызовы Telegram API. Апдейт попадает
+в трассировку с вероятностью sample_rate; спаны без активной трассы ничего не стоят,
+кроме чтения ContextVar. Последние max_traces трасс хранятся в памяти и выгружаются
+в Chrome trace JSON (chrome://tracing, Perfetto): каждый апдейт — отдельная дорожка tid.
+
+SQL-выражения дольше slow_query_ms пишутся в лог с EXPLAIN QUERY PLAN
+независимо от выборки. План получается в фоне через тот же пул и кэшируется по тексту.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from aiosqlite.context import Result
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    __slots__ = ("tid", "events")
+
+    def __init__(self, tid: int):
+        self.tid = tid
+        self.events: List[dict] = []
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+def _now_us() -> float:
+    return time.perf_counter() * 1e6
+
+class Span:
+    """Спан активной трассы; args можно дополнять до выхода из блока"""
+
+    __slots__ = ("trace", "name", "cat", "args", "start")
+
+    def __init__(self, trace: Trace, name: str, cat: str, args: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self) -> "Span":
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.events.append({
+            "name": self.name, "cat": self.cat, "ph": "X",
+            "ts": self.start, "dur": _now_us() - self.start,
+            "pid": tracer.pid, "tid": self.trace.tid, "args": self.args,
+        })
+
+class _NoSpan:
+    """Заглушка вне трассы: with span(...) as s даёт s = None"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+_NO_SPAN = _NoSpan()
+
+def span(name: str, cat: str, **args):
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, cat, args)
+
+def traced(cat: str):
+    """Декоратор корутины: спан с именем функции в активной трассе"""
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return await func(*args, **kwargs)
+            with Span(trace, name, cat, {}):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Tracer:
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.slow_query = 0.0
+        self.pid = os.getpid()
+        self.traces: Deque[Trace] = deque(maxlen=1000)
+        self.slow_queries = 0
+        # Текст SQL -> план; планы меняются только с индексами, TTL — на случай миграций
+        self._plans = LRUCache(max_size=1000, ttl=600)
+        self._explaining: Set[asyncio.Task] = set()
+
+    def configure(self, sample_rate: float = 0.0, slow_query_ms: float = 0, max_traces: int = 1000):
+        self.sample_rate = sample_rate
+        self.slow_query = slow_query_ms / 1000
+        self.traces = deque(self.traces, maxlen=max_traces)
+
+    @property
+    def instrument_db(self) -> bool:
+        """Нужна ли обёртка соединений (трассировка или журнал медленных запросов)"""
+        return self.sample_rate > 0 or self.slow_query > 0
+
+    def begin(self, tid: int) -> Optional[Any]:
+        """Решает по выборке, трассировать ли апдейт; возвращает токен для finish или None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        trace = Trace(tid)
+        self.traces.append(trace)
+        return _trace.set(trace)
+
+    def finish(self, token):
+        _trace.reset(token)
+
+    def export(self, path: str) -> int:
+        """Пишет накопленные трассы в Chrome trace JSON; возвращает число событий"""
+        events = [
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": f"bot {self.pid}"}},
+        ]
+        for trace in list(self.traces):
+            events.extend(trace.events)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, ensure_ascii=False)
+        return len(events) - 1
+
+    def stats(self) -> dict:
+        return {"traces": len(self.traces), "slow_queries": self.slow_queries}
+
+    def report_slow(self, pool, sql: str, parameters, elapsed: float):
+        """Пишет медленное выражение в лог; план запрашивается в фоне при первом случае"""
+        self.slow_queries += 1
+        sql = " ".join(sql.split())
+        plan = self._plans.get(sql)
+        if plan is not None or not sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            self._log_slow(sql, elapsed, plan)
+            return
+        task = asyncio.get_running_loop().create_task(self._explain(pool, sql, parameters, elapsed))
+        self._explaining.add(task)
+        task.add_done_callback(self._explaining.discard)
+
+    async def _explain(self, pool, sql: str, parameters, elapsed: float):
+        try:
+            async with pool.acquire(traced=False) as db:
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())
+                plan = [row[-1] for row in await cursor.fetchall()]
+        except Exception as e:
+            plan = [f"план не получен: {e}"]
+        self._plans.set(sql, plan)
+        self._log_slow(sql, elapsed, plan)
+
+    @staticmethod
+    def _log_slow(sql: str, elapsed: float, plan: Optional[List[str]]):
+        logger.warning("Медленный запрос %.1f мс: %s | план: %s",
+                       elapsed * 1000, sql, "; ".join(plan) if plan else "—")
+
+tracer = Tracer()
+
+class _StatementResult(Result):
+    """Как aiosqlite Result: await или async with; на выходе курсор закрывается"""
+
+    __slots__ = ()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._obj.close()
+
+class TracedCursor:
+    """Курсор, дописывающий в спан выражения число прочитанных строк и время чтения"""
+
+    def __init__(self, cursor, connection: "TracedConnection", sql: str, parameters,
+                 elapsed: float, span_args: Optional[dict]):
+        self._cursor = cursor
+        self._connection = connection
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+        self._args = span_args
+        self._reported = False
+        self._check()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _check(self):
+        if not self._reported and 0 < tracer.slow_query <= self._elapsed:
+            self._reported = True
+            tracer.report_slow(self._connection.pool, self._sql, self._parameters, self._elapsed)
+
+    async def _fetch(self, method, single: bool, *args):
+        start = time.perf_counter()
+        rows = await method(*args)
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        if self._args is not None:
+            count = (rows is not None) if single else len(rows)
+            self._args["rows"] = self._args.get("rows", 0) + count
+            self._args["fetch_ms"] = self._args.get("fetch_ms", 0) + elapsed * 1000
+        self._check()
+        return rows
+
+    async def fetchone(self):
+        return await self._fetch(self._cursor.fetchone, True)
+
+    async def fetchmany(self, size: Optional[int] = None):
+        return await self._fetch(self._cursor.fetchmany, False, *(() if size is None else (size,)))
+
+    async def fetchall(self):
+        return await self._fetch(self._cursor.fetchall, False)
+
+    async def close(self):
+        await self._cursor.close()
+
+class TracedConnection:
+    """
+    Обёртка соединения aiosqlite из пула: каждое execute/executemany — спан
+    с текстом SQL и числом строк, медленные выражения — в журнал.
+    """
+
+    def __init__(self, connection, pool):
+        self._connection = connection
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def execute(self, sql: str, parameters=None) -> Result:
+        return _StatementResult(self._run(self._connection.execute, sql, parameters, None))
+
+    def executemany(self, sql: str, parameters) -> Result:
+        parameters = list(parameters)
+        return _StatementResult(self._run(self._connection.executemany, sql, parameters, len(parameters)))
+
+    async def _run(self, method, sql: str, parameters, batch: Optional[int]) -> TracedCursor:
+        trace = _trace.get()
+        args = None
+        if trace is not None:
+            args = {"sql": " ".join(sql.split())}
+            if batch is not None:
+                args["batch"] = batch
+            with Span(trace, "sql", "sql", args):
+                start = time.perf_counter()
+                cursor = await method(sql, parameters)
+                elapsed = time.perf_counter() - start
+            if cursor.rowcount >= 0:
+                args["rows"] = cursor.rowcount
+        else:
+            start = time.perf_counter()
+            cursor = await method(sql, parameters)
+            elapsed = time.perf_counter() - start
+        # Для плана медленного executemany достаточно первой строки параметров
+        sample = parameters if batch is None else (parameters[0] if parameters else None)
+        return TracedCursor(cursor, self, sql, sample, elapsed, args)
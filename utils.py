@@ -1,4 +1,10 @@
-from database import get_user_info
+import asyncio
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+from cache import LRUCache
+from config import Config
+from database import get_users_info
+
+config = Config()
 
 ADMIN_RANKS = [
     "Смотрящий",
@@ -38,8 +44,7 @@ def get_hidden_rank_name(rank: int) -> str:
         return HIDDEN_RANKS[rank - 1]
     return "Без ранга"
 
-async def get_username_or_name(user_id: int) -> str:
-    info = await get_user_info(user_id)
+def format_user_name(user_id: int, info) -> str:
     if info and info[0]:
         return f"@{info[0]}"
     elif info and (info[1] or info[2]):
@@ -47,8 +52,73 @@ async def get_username_or_name(user_id: int) -> str:
     else:
         return f"ID {user_id}"
 
+async def get_usernames(user_ids: List[int]) -> Dict[int, str]:
+    """Имена для отображения сразу для списка пользователей (не более одного запроса)"""
+    infos = await get_users_info(user_ids)
+    return {user_id: format_user_name(user_id, infos.get(user_id)) for user_id in user_ids}
+
+class ChatAdmins(NamedTuple):
+    admin_ids: FrozenSet[int]
+    creator_id: Optional[int]
+
+# chat_id -> ChatAdmins; заполняется одним вызовом get_chat_administrators,
+# уточняется обновлениями chat_member и истекает по TTL
+_admins_cache = LRUCache(max_size=config.ADMIN_CACHE_SIZE, ttl=config.ADMIN_CACHE_TTL)
+_admin_fetches: Dict[int, asyncio.Future] = {}
+
+def remember_admins(chat_id: int, administrators) -> ChatAdmins:
+    """Кэширует результат get_chat_administrators"""
+    admins = ChatAdmins(
+        frozenset(member.user.id for member in administrators),
+        next((member.user.id for member in administrators if member.status == "creator"), None),
+    )
+    _admins_cache.set(chat_id, admins)
+    return admins
+
+def update_admin_status(chat_id: int, user_id: int, status: str):
+    """Применяет изменение статуса участника (обновление chat_member) к кэшу"""
+    admins = _admins_cache.get(chat_id)
+    if admins is None:
+        return
+    admin_ids = set(admins.admin_ids)
+    creator_id = admins.creator_id
+    if status in ("creator", "administrator"):
+        admin_ids.add(user_id)
+    else:
+        admin_ids.discard(user_id)
+    if status == "creator":
+        creator_id = user_id
+    elif creator_id == user_id:
+        creator_id = None
+    _admins_cache.set(chat_id, ChatAdmins(frozenset(admin_ids), creator_id))
+
+def forget_chat_admins(chat_filter):
+    """Сбрасывает кэш админов чатов, для которых chat_filter(chat_id) истинно"""
+    for chat_id in _admins_cache.keys():
+        if chat_filter(chat_id):
+            _admins_cache.pop(chat_id)
+
+async def _fetch_admins(bot, chat_id: int) -> ChatAdmins:
+    return remember_admins(chat_id, await bot.get_chat_administrators(chat_id))
+
+async def get_chat_admins(bot, chat_id: int) -> ChatAdmins:
+    """Администраторы чата из кэша; одновременные промахи делят один запрос к API"""
+    admins = _admins_cache.get(chat_id)
+    if admins is not None:
+        return admins
+    fetch = _admin_fetches.get(chat_id)
+    if fetch is None:
+        fetch = asyncio.ensure_future(_fetch_admins(bot, chat_id))
+        _admin_fetches[chat_id] = fetch
+        fetch.add_done_callback(lambda _: _admin_fetches.pop(chat_id, None))
+    return await asyncio.shield(fetch)
+
 async def is_admin(bot, chat_id: int, user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором чата"""
+    try:
+        return user_id in (await get_chat_admins(bot, chat_id)).admin_ids
+    except:
+        pass
     try:
         member = await bot.get_chat_member(chat_id, user_id)
         return member.status in ("creator", "administrator")
@@ -57,8 +127,12 @@ async def is_admin(bot, chat_id: int, user_id: int) -> bool:
 
 async def is_creator(bot, chat_id: int, user_id: int) -> bool:
     """Проверяет, является ли пользователь владельцем чата"""
+    try:
+        return (await get_chat_admins(bot, chat_id)).creator_id == user_id
+    except:
+        pass
     try:
         member = await bot.get_chat_member(chat_id, user_id)
         return member.status == "creator"
     except:
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Any, Optional, Set, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Приём апдейтов по вебхуку с обработкой в фоне, не больше max_concurrent одновременно.
+    Пока все слоты заняты, ответ Telegram задерживается — он сам притормаживает доставку,
+    а не накапливает у нас неограниченное число задач.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent: int = 256,
+                 secret_token: Optional[str] = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._tasks.add(task)
+        task.add_done_callback(self._release)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def _release(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ошибка обработки апдейта", exc_info=task.exception())
+
+    @property
+    def in_progress(self) -> int:
+        return len(self._tasks)
+
+    async def wait_idle(self, *_):
+        """Дожидается обработки уже принятых апдейтов"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+def check_webhook_secret(config: Config):
+    """
+    Без WEBHOOK_SECRET вебхук принимает апдейты от любого, кто знает адрес.
+    С публичным WEBHOOK_URL бот не запускается; без него (адрес регистрируется
+    вручную или за прокси) — только предупреждение.
+    """
+    if config.WEBHOOK_SECRET:
+        return
+    if config.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL задан, а WEBHOOK_SECRET пуст: вебхук принимал бы поддельные апдейты")
+    logger.warning("WEBHOOK_SECRET не задан: заголовок X-Telegram-Bot-Api-Secret-Token не проверяется")
+
+async def register_webhook(dp: Dispatcher, bot: Bot, config: Config):
+    """Регистрирует вебхук в Telegram, если задан публичный WEBHOOK_URL"""
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+
+async def start_webhook(dp: Dispatcher, bot: Bot, config: Config) -> Tuple[web.AppRunner, BoundedRequestHandler]:
+    """Поднимает HTTP-сервер вебхука и, если задан WEBHOOK_URL, регистрирует его в Telegram"""
+    check_webhook_secret(config)
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp, bot,
+        max_concurrent=config.WEBHOOK_MAX_CONCURRENCY,
+        secret_token=config.WEBHOOK_SECRET or None,
+    )
+    # Порядок остановки: принятые апдейты -> shutdown диспетчера (очередь отправки, база) -> сессия бота
+    app.on_shutdown.append(handler.wait_idle)
+    setup_application(app, dp, bot=bot)
+    handler.register(app, path=config.WEBHOOK_PATH)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT).start()
+    logger.info(f"Вебхук слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    await register_webhook(dp, bot, config)
+    return runner, handler
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config: Config):
+    runner, _ = await start_webhook(dp, bot, config)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import asyncio
+
+@dataclass
+class PendingStats:
+    """Накопленные, ещё не записанные в базу приращения пользователя"""
+    messages: int = 0
+    experience: int = 0
+    last_message_time: Optional[str] = None
+    # Дневной и недельный счётчики относятся к своим эпохам (см. periods.py)
+    messages_day: int = 0
+    day_epoch: int = 0
+    messages_week: int = 0
+    week_epoch: int = 0
+
+    def day(self, epoch: int) -> int:
+        return self.messages_day if self.day_epoch == epoch else 0
+
+    def week(self, epoch: int) -> int:
+        return self.messages_week if self.week_epoch == epoch else 0
+
+    def merge(self, other: "PendingStats"):
+        self.messages += other.messages
+        self.experience += other.experience
+        self.last_message_time = max(filter(None, (self.last_message_time, other.last_message_time)), default=None)
+        self.messages_day, self.day_epoch = merge_epoch(
+            self.messages_day, self.day_epoch, other.messages_day, other.day_epoch)
+        self.messages_week, self.week_epoch = merge_epoch(
+            self.messages_week, self.week_epoch, other.messages_week, other.week_epoch)
+
+def merge_epoch(count: int, epoch: int, other_count: int, other_epoch: int):
+    """Счётчики одной эпохи складываются, иначе остаётся более новый"""
+    if epoch == other_epoch:
+        return count + other_count, epoch
+    return (count, epoch) if epoch > other_epoch else (other_count, other_epoch)
+
+class MessageBuffer:
+    """
+    Буфер отложенной записи счётчиков сообщений.
+    Копит приращения по (chat_id, user_id) и по дням, чтобы сбрасывать
+    их в базу одной транзакцией, а не коммитить каждое сообщение.
+    """
+
+    def __init__(self, max_pending: int = 500):
+        self.max_pending = max_pending
+        # Сброс в базу и чтения "база + буфер" выполняются под этой блокировкой,
+        # чтобы читатель не увидел приращения дважды или не потерял их
+        self.lock = asyncio.Lock()
+        self._stats: Dict[int, Dict[int, PendingStats]] = {}
+        self._daily: Dict[Tuple[int, int], Dict[str, int]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Количество сообщений, ожидающих записи"""
+        return self._count
+
+    def add(self, chat_id: int, user_id: int, exp_gain: int, date: str, timestamp: str,
+            day_epoch: int, week_epoch: int) -> bool:
+        """Учитывает сообщение. Возвращает True, если пора сбрасывать буфер"""
+        users = self._stats.setdefault(chat_id, {})
+        pending = users.get(user_id)
+        if pending is None:
+            pending = users[user_id] = PendingStats()
+        pending.messages += 1
+        pending.experience += exp_gain
+        pending.last_message_time = timestamp
+        pending.messages_day, pending.day_epoch = merge_epoch(
+            pending.messages_day, pending.day_epoch, 1, day_epoch)
+        pending.messages_week, pending.week_epoch = merge_epoch(
+            pending.messages_week, pending.week_epoch, 1, week_epoch)
+
+        days = self._daily.setdefault((chat_id, user_id), {})
+        days[date] = days.get(date, 0) + 1
+        self._count += 1
+        return self._count >= self.max_pending
+
+    def get(self, chat_id: int, user_id: int) -> Optional[PendingStats]:
+        users = self._stats.get(chat_id)
+        return users.get(user_id) if users else None
+
+    def pending(self) -> Dict[int, Dict[int, PendingStats]]:
+        return self._stats
+
+    def chat_pending(self, chat_id: int) -> Dict[int, PendingStats]:
+        return self._stats.get(chat_id, {})
+
+    def daily_for(self, chat_id: int, user_id: int) -> Dict[str, int]:
+        """Несброшенные сообщения пользователя по датам"""
+        return self._daily.get((chat_id, user_id), {})
+
+    def take(self):
+        """Забирает всё накопленное, оставляя буфер пустым"""
+        stats, daily = self._stats, self._daily
+        self._stats, self._daily, self._count = {}, {}, 0
+        return stats, daily
+
+    def restore(self, stats, daily):
+        """Возвращает в буфер данные, которые не удалось записать"""
+        for chat_id, users in stats.items():
+            for user_id, pending in users.items():
+                self._stats.setdefault(chat_id, {}).setdefault(user_id, PendingStats()).merge(pending)
+                self._count += pending.messages
+        for key, restored_days in daily.items():
+            days = self._daily.setdefault(key, {})
+            for day, count in restored_days.items():
+                days[day] = days.get(day, 0) + count